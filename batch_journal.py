@@ -0,0 +1,186 @@
+import os
+import json
+import glob
+import threading
+from datetime import datetime
+
+# --- Batch checkpoint journal ---
+# An append-only JSON-lines file in the output folder recording what a batch run
+# has finished: OCR lines (and OCR failures) by photo hash, and every report as
+# pending, done (with its input fingerprint) or failed. Each record is fsynced
+# before the run moves on, so after a crash or power loss the next run over the
+# same folder resumes where the last one stopped: no photo is OCR'd twice and
+# finished reports are not rendered again. A run that completes moves the
+# journal aside (batch_journal.last.jsonl); the OCR lines are in the OCR cache by then.
+# Only failures of the photo itself (unreadable, corrupt) are recorded as OCR failures;
+# a timeout waiting for an engine or a crashed worker pool says nothing about the
+# photo, so the next run tries it again (is_transient_error).
+# The watch-folder daemon keeps one too, under its own file name, with the fields
+# read from each photo instead of OCR lines (it never finishes, so it is never moved aside).
+
+JOURNAL_FILENAME = "batch_journal.jsonl"
+LAST_JOURNAL_FILENAME = "batch_journal.last.jsonl"
+
+
+def is_transient_error(error):
+    """Whether an OCR failure came from the machinery (engine timeout, broken pool, memory), not the photo."""
+    from concurrent.futures import BrokenExecutor, CancelledError
+    from ocr_engine_pool import EnginePoolTimeout
+    return isinstance(error, (EnginePoolTimeout, BrokenExecutor, CancelledError, TimeoutError, MemoryError))
+
+
+class BatchJournal:
+    def __init__(self, output_dir, input_dir, filename=JOURNAL_FILENAME):
+        self.path = os.path.join(output_dir, filename)
+        # batch_journal.jsonl -> batch_journal.last.jsonl
+        self.last_path = os.path.join(output_dir, os.path.splitext(filename)[0] + ".last.jsonl")
+        self.input_dir = os.path.abspath(input_dir)
+        self.ocr_lines = {}   # photo hash -> OCR lines
+        self.ocr_errors = {}  # photo hash -> error message
+        self.fields = {}      # photo hash -> extracted fields (watch daemon)
+        self.done = {}        # report filename -> fingerprint
+        self.failed = {}      # report filename -> error message
+        self.planned = {}     # report filename -> names of its two photos
+        self.resumed = False
+        self._lock = threading.Lock()
+        self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if not self.resumed:
+            self._append({"event": "start", "input": self.input_dir,
+                          "at": datetime.now().isoformat(timespec="seconds")})
+
+    def _load(self):
+        """Replays an interrupted run's journal. A torn last line (crash mid-write) is cut off."""
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return
+        records, good_bytes = [], 0
+        for line in raw.splitlines(keepends=True):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("incomplete line")
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            good_bytes += len(line)
+        if records and records[-1].get("event") == "finish": # Finished, but not moved aside yet
+            os.replace(self.path, self.last_path)
+            return
+        if not records or records[0].get("event") != "start" or records[0].get("input") != self.input_dir:
+            print("Starting a new batch journal; the previous one was for another folder or unreadable.")
+            os.replace(self.path, self.last_path)
+            return
+        if good_bytes < len(raw):
+            with open(self.path, "r+b") as f:
+                f.truncate(good_bytes)
+        for record in records:
+            self._apply(record)
+        self.resumed = True
+        print(f"Resuming the run started {records[0].get('at')} ({os.path.basename(self.path)}): {self.describe()}")
+
+    def _apply(self, record):
+        event = record.get("event")
+        if event == "ocr":
+            self.ocr_lines[record["hash"]] = [tuple(line) for line in record["lines"]]
+        elif event == "ocr_failed":
+            self.ocr_errors[record["hash"]] = record["error"]
+        elif event == "fields":
+            self.fields[record["hash"]] = record["fields"]
+        elif event == "pending":
+            self.planned[record["report"]] = record.get("photos")
+        elif event == "done":
+            self.done[record["report"]] = record["fingerprint"]
+            self.failed.pop(record["report"], None)
+        elif event == "failed":
+            self.failed[record["report"]] = record["error"]
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno()) # Durable before the work it records is considered done
+
+    def describe(self):
+        pending = len(self.planned.keys() - self.done.keys() - self.failed.keys())
+        return (f"{len(self.done)} reports done, {len(self.failed)} failed, {pending} pending; "
+                f"{len(self.ocr_lines) + len(self.fields)} OCR results recovered")
+
+    # --- OCR ---
+    def restore_ocr(self, cache):
+        """Puts the OCR lines recorded so far into the OCR cache (which is only saved at the end of OCR)."""
+        for digest, lines in self.ocr_lines.items():
+            cache.put(digest, lines)
+
+    def ocr_error(self, digest):
+        """The recorded error if this photo already failed OCR (a corrupt image fails every time)."""
+        return self.ocr_errors.get(digest)
+
+    def ocr_done(self, digest, lines):
+        if digest and digest not in self.ocr_lines:
+            self.ocr_lines[digest] = lines
+            self._append({"event": "ocr", "hash": digest, "lines": [[text, float(conf)] for text, conf in lines]})
+
+    def ocr_failed(self, digest, error):
+        """Records a photo that cannot be recognised. Transient failures are not recorded; returns whether it was."""
+        if is_transient_error(error) or not digest:
+            return False
+        self.ocr_errors[digest] = str(error)
+        self._append({"event": "ocr_failed", "hash": digest, "error": str(error)})
+        return True
+
+    def fields_done(self, digest, fields):
+        """Records the fields read from a photo (watch daemon); OCR errors are not recorded."""
+        if digest and "error" not in fields and digest not in self.fields:
+            self.fields[digest] = fields
+            self._append({"event": "fields", "hash": digest, "fields": fields})
+
+    # --- Reports ---
+    def plan(self, report, img1, img2):
+        if report not in self.planned:
+            photos = [os.path.basename(img1), os.path.basename(img2)]
+            self.planned[report] = photos
+            self._append({"event": "pending", "report": report, "photos": photos})
+
+    def is_done(self, report, fingerprint, doc_path):
+        """Whether an earlier attempt of this run already wrote this report from the same inputs."""
+        return self.done.get(report) == fingerprint and os.path.exists(doc_path)
+
+    def completed(self, report, fingerprint):
+        self.done[report] = fingerprint
+        self._append({"event": "done", "report": report, "fingerprint": fingerprint})
+
+    def report_failed(self, report, error):
+        self.failed[report] = str(error)
+        self._append({"event": "failed", "report": report, "error": str(error)})
+
+    # --- Lifetime ---
+    def close(self):
+        """Closes the journal but keeps it: the run did not finish and can be resumed."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def finish(self, summary):
+        """Marks the run complete and moves the journal aside; the next run starts afresh."""
+        self._append({"event": "finish", "summary": summary, "at": datetime.now().isoformat(timespec="seconds")})
+        self.close()
+        os.replace(self.path, self.last_path)
+
+
+def discard_journal(output_dir):
+    """Forgets an interrupted run (--restart)."""
+    path = os.path.join(output_dir, JOURNAL_FILENAME)
+    if os.path.exists(path):
+        os.replace(path, os.path.join(output_dir, LAST_JOURNAL_FILENAME))
+
+
+def remove_partial_files(output_dir):
+    """Deletes temporary report files a crash left behind (reports are written as *.tmp, then renamed)."""
+    for path in glob.glob(os.path.join(glob.escape(output_dir), "*.docx.tmp")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
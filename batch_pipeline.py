@@ -0,0 +1,422 @@
+import io
+import os
+import time
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from extraction_rules import format_plate_entry
+from exif_metadata import read_capture_time
+from ocr_service import OCR_CACHE_FILENAME, OcrCache, extract_fields, merge_pair_fields
+from report_builder import (DEFAULT_TRUCK_TYPE, build_output_filename, compute_fingerprint,
+                            render_report, select_template)
+from photo_pairing import DEFAULT_WINDOW_SECONDS, list_photos, pair_photos
+from inspection_history import record_safely
+from batch_runner import BatchStats
+from batch_journal import BatchJournal, is_transient_error, remove_partial_files
+from output_sinks import DirectorySink
+
+# --- Pipelined batch mode ---
+# The same work as batch_runner.run_batch, but stages overlap instead of running
+# one after another:
+#
+#   read (I/O pool) -> ocr (1 worker) -> [pairing] -> load (I/O pool) -> render (1 worker) -> write (I/O pool)
+#
+# Stages are connected by bounded asyncio queues, so a slow network share keeps the
+# OCR worker fed without reading the whole folder into memory, and saving one report
+# overlaps with rendering the next. Pairing needs every photo's OCR result, so it is
+# the one barrier between the two halves.
+# OCR and rendering each get a single worker: one PaddleOCR engine must not be used
+# from several threads, and python-docx rendering is bound by the GIL anyway.
+# With shm_transport.SharedMemoryOcr as `read_ocr_lines`, OCR runs in worker
+# processes instead and `ocr_workers` threads keep them busy.
+# Progress is checkpointed in batch_journal.py, so an interrupted run resumes.
+# The write stage hands reports to an output sink: the output folder, or one zip archive.
+
+DEFAULT_IO_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 8  # Photos (or pairs) held in memory between two stages
+MONITOR_INTERVAL = 0.1  # Queue depth sampling
+PROGRESS_INTERVAL = 5.0
+
+
+class Stage:
+    """Busy time and item count of one pipeline stage."""
+
+    def __init__(self, name, executor, workers):
+        self.name = name
+        self.executor = executor
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+
+    async def run(self, fn, *args):
+        elapsed = []
+
+        def timed():
+            # Measured on the worker thread, so time spent queued for the executor is not "busy"
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                elapsed.append(time.perf_counter() - start)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+        finally:
+            # Totalled on the event loop thread: `+=` from several worker threads can lose updates
+            if elapsed:
+                self.busy += elapsed[0]
+                self.items += 1
+
+    def utilization(self, wall):
+        return self.busy / (wall * self.workers) if wall > 0 else 0.0
+
+
+class QueueGauge:
+    """Samples the depth of a queue: current, maximum and mean."""
+
+    def __init__(self, name, queue):
+        self.name = name
+        self.queue = queue
+        self.samples = 0
+        self.total = 0
+        self.max = 0
+
+    def sample(self):
+        depth = self.queue.qsize()
+        self.samples += 1
+        self.total += depth
+        self.max = max(self.max, depth)
+
+    def mean(self):
+        return self.total / self.samples if self.samples else 0.0
+
+
+def _read_photo(path):
+    """Reads a photo once: bytes, content hash, EXIF capture time."""
+    with open(path, "rb") as f:
+        data = f.read()
+    stream = io.BytesIO(data)
+    stream.name = path
+    return data, hashlib.sha256(data).hexdigest(), read_capture_time(stream)
+
+
+def _load_pair(sink, doc_path, fingerprint, img1, img2, force, photo_store=None, digests=(None, None)):
+    """
+    None if the existing report is up to date, else the two photos as named streams
+    (or, for linked reports, their paths in the photo store: the bytes are not needed).
+    """
+    if not force and sink.is_current(doc_path, fingerprint):
+        return None
+    if photo_store:
+        return [photo_store.add(path, digest) for path, digest in zip((img1, img2), digests)]
+    streams = []
+    for path in (img1, img2):
+        with open(path, "rb") as f:
+            stream = io.BytesIO(f.read())
+        stream.name = path
+        streams.append(stream)
+    return streams
+
+
+def _render_to_bytes(template_path, fields, stream1, stream2, fingerprint, linked=False):
+    warnings = []
+    document = render_report(template_path, fields, stream1, stream2, warnings, linked=linked)
+    if not warnings: # Same rule as generate_report_file: incomplete reports are not stamped
+        document.core_properties.identifier = fingerprint
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue(), warnings
+
+
+class BatchPipeline:
+    def __init__(self, input_dir, output_dir, read_ocr_lines, plate_map, yellow_template, white_template,
+                 truck_type=DEFAULT_TRUCK_TYPE, truck_type_for=None, history=None, force=False,
+                 window_seconds=DEFAULT_WINDOW_SECONDS, io_workers=DEFAULT_IO_WORKERS, ocr_workers=1,
+                 queue_size=DEFAULT_QUEUE_SIZE, progress_interval=PROGRESS_INTERVAL, resume=True, sink=None, photo_store=None):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.read_ocr_lines = read_ocr_lines  # Called with the photo's bytes
+        self.plate_map = plate_map
+        self.yellow_template = yellow_template
+        self.white_template = white_template
+        self.truck_type = truck_type
+        self.truck_type_for = truck_type_for
+        self.history = history
+        self.force = force
+        self.window_seconds = window_seconds
+        self.io_workers = io_workers
+        self.ocr_workers = ocr_workers  # > 1 only if read_ocr_lines may be called concurrently
+        self.queue_size = queue_size
+        self.progress_interval = progress_interval
+        self.resume = resume  # Keep a checkpoint journal and continue an interrupted run
+        self.journal = None
+        self.sink = sink or DirectorySink(output_dir)  # Where reports go (output_sinks.py)
+        self.photo_store = photo_store  # Link photos from here instead of embedding (linked_images.py)
+        self.stats = BatchStats()
+        self.stages = {}
+        self.gauges = []
+        self.wall_seconds = 0.0
+        self.ocr_seconds = {}  # path -> seconds spent in OCR (0 for cache hits)
+
+    def run(self):
+        """Runs the whole batch. Returns (BatchStats, PairingResult)."""
+        return asyncio.run(self._run())
+
+    async def _run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        remove_partial_files(self.output_dir)
+        if self.resume:
+            self.journal = BatchJournal(self.output_dir, self.input_dir)
+        self.sink.open()
+        io_pool = ThreadPoolExecutor(self.io_workers, thread_name_prefix="pipeline-io")
+        ocr_pool = ThreadPoolExecutor(self.ocr_workers, thread_name_prefix="pipeline-ocr")
+        render_pool = ThreadPoolExecutor(1, thread_name_prefix="pipeline-render")
+        self.stages = {
+            "read": Stage("read", io_pool, self.io_workers),
+            "ocr": Stage("ocr", ocr_pool, self.ocr_workers),
+            "load": Stage("load", io_pool, self.io_workers),
+            "render": Stage("render", render_pool, 1),
+            "write": Stage("write", io_pool, self.io_workers),
+        }
+        started = time.perf_counter()
+        monitor = asyncio.create_task(self._monitor(started))
+        try:
+            paths = await asyncio.get_running_loop().run_in_executor(io_pool, list_photos, self.input_dir)
+            ocr_results, taken, hashes = await self._recognise(paths)
+            pairing = pair_photos(paths, ocr_results, known_codes=set(self.plate_map.values()),
+                                  window_seconds=self.window_seconds, read_time=taken.get)
+            await self._generate(pairing.pairs, ocr_results, hashes)
+            await asyncio.get_running_loop().run_in_executor(io_pool, self.sink.close)
+        except BaseException:
+            self.sink.abort()
+            if self.journal:
+                self.journal.close() # Kept for the next run to resume from
+            raise
+        finally:
+            monitor.cancel()
+            self.wall_seconds = time.perf_counter() - started
+            for pool in (io_pool, ocr_pool, render_pool):
+                pool.shutdown(wait=True)
+        self.stats.ocr_seconds = self.stages["ocr"].busy
+        self.stats.render_seconds = self.stages["render"].busy
+        self.print_report()
+        for group, reason in pairing.ambiguous:
+            print(f"[待確認] {', '.join(os.path.basename(p) for p in group)} ({reason})")
+        for path in pairing.unpaired:
+            print(f"[未配對] {os.path.basename(path)}")
+        print(f"Batch done: {self.stats.summary()}. {pairing.summary()}")
+        print(f"Field sources: {self.stats.source_summary()}")
+        if self.journal:
+            self.journal.finish(self.stats.summary())
+        return self.stats, pairing
+
+    # --- First half: read -> ocr ---
+    async def _recognise(self, paths):
+        cache = OcrCache(os.path.join(self.output_dir, OCR_CACHE_FILENAME))
+        journal = self.journal
+        if journal:
+            journal.restore_ocr(cache)
+        read_q = asyncio.Queue(self.queue_size)
+        self.gauges.append(QueueGauge("read->ocr", read_q))
+        ocr_results, taken, hashes = {}, {}, {}
+        pending = iter(paths)
+
+        async def reader():
+            for path in pending:  # Shared iterator: each path is taken by one reader
+                try:
+                    data, digest, taken[path] = await self.stages["read"].run(_read_photo, path)
+                except OSError as e:
+                    print(f"Warning: Could not read {os.path.basename(path)}: {e}")
+                    ocr_results[path] = {"error": f"圖片讀取失敗: {e}"}
+                    taken[path] = None
+                    continue
+                await read_q.put((path, data, digest))
+
+        async def recogniser():
+            while True:
+                item = await read_q.get()
+                if item is None:
+                    return
+                path, data, digest = item
+                hashes[path] = digest
+                if journal and journal.ocr_error(digest):
+                    ocr_results[path] = {"error": f"OCR 處理失敗: {journal.ocr_error(digest)}"}
+                    continue
+                ocr_lines = cache.get(digest)
+                start = time.perf_counter()
+                try:
+                    if ocr_lines is None:
+                        ocr_lines = await self.stages["ocr"].run(self.read_ocr_lines, data)
+                        cache.put(digest, ocr_lines)
+                        if journal:
+                            journal.ocr_done(digest, ocr_lines)
+                    self.ocr_seconds[path] = time.perf_counter() - start
+                    ocr_results[path] = extract_fields(ocr_lines, self.plate_map)
+                except Exception as e:
+                    retried = " (retried on the next run)" if is_transient_error(e) else ""
+                    print(f"Warning: OCR failed for {os.path.basename(path)}: {e}{retried}")
+                    ocr_results[path] = {"error": f"OCR 處理失敗: {e}"}
+                    if journal:
+                        journal.ocr_failed(digest, e) # Not for transient failures: those are retried
+
+        ocr_tasks = [asyncio.create_task(recogniser()) for _ in range(self.ocr_workers)]
+        await asyncio.gather(*(reader() for _ in range(self.io_workers)))
+        for _ in ocr_tasks:
+            await read_q.put(None)
+        await asyncio.gather(*ocr_tasks)
+        cache.save()
+        print(f"OCR: {len(paths)} photos, {cache.hits} from cache, {cache.misses} recognised")
+        return ocr_results, taken, hashes
+
+    # --- Second half: load -> render -> write ---
+    def _plan(self, pairs, ocr_results, hashes):
+        """One job per pair: (img1, img2, fields, plate, truck type, template, doc_path, fingerprint)."""
+        used_outputs = {}
+        for pair in pairs:
+            img1, img2 = pair.photo1.path, pair.photo2.path
+            fields = merge_pair_fields(ocr_results[img1], ocr_results[img2], (pair.photo1.taken, pair.photo2.taken))
+            self.stats.count_sources(fields)
+            plate = fields["plate"]
+            pair_type = (self.truck_type_for and self.truck_type_for(plate)) or self.truck_type
+            try:
+                template_path = select_template(pair_type, self.yellow_template, self.white_template)
+                output_filename = build_output_filename(fields.get("code"), pair_type)
+            except Exception as e:
+                print(f"Error: Report for {os.path.basename(img1)} + {os.path.basename(img2)} failed: {e}")
+                self.stats.failed += 1
+                continue
+            if output_filename in used_outputs:
+                print(f"Warning: {os.path.basename(img1)} + {os.path.basename(img2)} would overwrite {output_filename} "
+                      f"(already written for {used_outputs[output_filename]}); skipped, needs review.")
+                self.stats.failed += 1
+                continue
+            if self.journal:
+                self.journal.plan(output_filename, img1, img2)
+            used_outputs[output_filename] = os.path.basename(img1)
+            fields["plate"] = format_plate_entry(plate, fields.get("code"))
+            fingerprint = compute_fingerprint(template_path, fields, img1, img2,
+                                              image_hashes=(hashes.get(img1), hashes.get(img2)),
+                                              linked=self.photo_store is not None)
+            yield (img1, img2, fields, plate, pair_type, template_path,
+                   self.sink.target(output_filename), fingerprint)
+
+    async def _generate(self, pairs, ocr_results, hashes):
+        load_q = asyncio.Queue(self.queue_size)
+        write_q = asyncio.Queue(self.queue_size)
+        self.gauges += [QueueGauge("load->render", load_q), QueueGauge("render->write", write_q)]
+        jobs = self._plan(pairs, ocr_results, hashes)
+
+        async def loader():
+            for job in jobs:
+                img1, img2, _, _, _, _, doc_path, fingerprint = job
+                if self.journal and not self.force and self.journal.is_done(
+                        os.path.basename(doc_path), fingerprint, doc_path):
+                    self.stats.skipped += 1 # Written before the interruption
+                    continue
+                try:
+                    streams = await self.stages["load"].run(_load_pair, self.sink, doc_path, fingerprint, img1, img2,
+                                                            self.force, self.photo_store,
+                                                            (hashes.get(img1), hashes.get(img2)))
+                except OSError as e:
+                    print(f"Error: Could not read photos for {os.path.basename(doc_path)}: {e}")
+                    self._report_failed(doc_path, e)
+                    continue
+                if streams is None:
+                    self.stats.skipped += 1
+                    self._report_done(doc_path, fingerprint)
+                    continue
+                await load_q.put((job, streams))
+
+        async def renderer():
+            while True:
+                item = await load_q.get()
+                if item is None:
+                    await write_q.put(None)
+                    return
+                job, (stream1, stream2) = item
+                _, _, fields, _, _, template_path, doc_path, fingerprint = job
+                start = time.perf_counter()
+                try:
+                    data, warnings = await self.stages["render"].run(
+                        _render_to_bytes, template_path, fields, stream1, stream2, fingerprint,
+                        self.photo_store is not None)
+                except Exception as e:
+                    print(f"Error: Report {os.path.basename(doc_path)} failed: {e}")
+                    self._report_failed(doc_path, e)
+                    continue
+                for message in warnings:
+                    print(f"Warning: {message}")
+                await write_q.put((job, data, time.perf_counter() - start))
+
+        async def writer():
+            while True:
+                item = await write_q.get()
+                if item is None:
+                    return
+                (img1, img2, fields, plate, pair_type, template_path, doc_path, fingerprint), data, render_seconds = item
+                try:
+                    row = (os.path.basename(doc_path), plate, fields.get("code"), pair_type, fields.get("address"),
+                           fields.get("date"), os.path.basename(img1), os.path.basename(img2))
+                    await self.stages["write"].run(self.sink.write, doc_path, data, row)
+                except OSError as e:
+                    print(f"Error: Could not save {doc_path}: {e}")
+                    self._report_failed(doc_path, e)
+                    continue
+                self.stats.rebuilt += 1
+                record_safely(
+                    self.history, "batch", plate=plate, code=fields.get("code"), truck_type=pair_type,
+                    address=fields.get("address"), inspection_date=fields.get("date"), image1=img1, image2=img2,
+                    output_path=doc_path, template=template_path, render_seconds=render_seconds,
+                    ocr_seconds=self.ocr_seconds.get(img1, 0.0) + self.ocr_seconds.get(img2, 0.0))
+                self._report_done(doc_path, fingerprint)
+                print(f"報告已產生: {doc_path}")
+
+        async def loaders():
+            await asyncio.gather(*(loader() for _ in range(self.io_workers)))
+            await load_q.put(None)
+
+        # All stages are awaited together: if one dies (e.g. the archive cannot be written),
+        # the batch stops instead of the others waiting forever on a full queue
+        await asyncio.gather(loaders(), renderer(), writer())
+
+    def _report_done(self, doc_path, fingerprint):
+        if self.journal:
+            self.journal.completed(os.path.basename(doc_path), fingerprint)
+
+    def _report_failed(self, doc_path, error):
+        self.stats.failed += 1
+        if self.journal:
+            self.journal.report_failed(os.path.basename(doc_path), error)
+
+    # --- Observability ---
+    async def _monitor(self, started):
+        last_progress = time.perf_counter()
+        while True:
+            await asyncio.sleep(MONITOR_INTERVAL)
+            for gauge in self.gauges:
+                gauge.sample()
+            now = time.perf_counter()
+            if self.progress_interval and now - last_progress >= self.progress_interval:
+                last_progress = now
+                print(self.progress_line(now - started))
+
+    def progress_line(self, wall):
+        stages = " | ".join(f"{s.name} {s.items} ({s.utilization(wall):.0%})" for s in self.stages.values())
+        queues = " ".join(f"{g.name}={g.queue.qsize()}" for g in self.gauges)
+        return f"[{wall:6.1f}s] {stages} | queues {queues}"
+
+    def print_report(self):
+        wall = self.wall_seconds
+        print(f"Pipeline: {wall:.2f}s wall")
+        print(f"{'stage':<8} {'items':>6} {'busy [s]':>9} {'util':>6}")
+        for stage in self.stages.values():
+            print(f"{stage.name:<8} {stage.items:>6} {stage.busy:>9.2f} {stage.utilization(wall):>6.0%}")
+        print(f"{'queue':<14} {'mean':>6} {'max':>5} (capacity {self.queue_size})")
+        for gauge in self.gauges:
+            print(f"{gauge.name:<14} {gauge.mean():>6.1f} {gauge.max:>5}")
+
+
+def run_pipeline(input_dir, output_dir, read_ocr_lines, plate_map, yellow_template, white_template, **options):
+    """Pipelined equivalent of batch_runner.run_batch; `read_ocr_lines` gets the photo bytes."""
+    return BatchPipeline(input_dir, output_dir, read_ocr_lines, plate_map, yellow_template, white_template,
+                         **options).run()
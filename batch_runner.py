@@ -0,0 +1,286 @@
+import os
+import time
+
+from extraction_rules import format_plate_entry
+from ocr_service import OCR_CACHE_FILENAME, OcrCache, extract_fields, merge_pair_fields
+from report_builder import (DEFAULT_TRUCK_TYPE, build_output_filename, compute_fingerprint, file_sha256,
+                            generate_report_file, select_template)
+from photo_pairing import DEFAULT_WINDOW_SECONDS, list_photos, pair_photos
+from summary_writer import write_summary_safely
+from batch_journal import BatchJournal, discard_journal, is_transient_error, remove_partial_files
+
+# --- Batch mode ---
+# Generates the reports for a whole folder of photos: OCR, pairing
+# (photo_pairing.py), rendering. Reruns are incremental: OCR lines are cached by
+# image hash and a report whose input fingerprint (report_builder.py) has not
+# changed is left as it is, so rerunning after fixing one record only rebuilds that one.
+# From the command line the pipelined version in batch_pipeline.py is used;
+# run_batch is the plain sequential form (--sequential).
+# Both checkpoint their progress in a journal (batch_journal.py): rerunning an
+# interrupted batch resumes it without repeating finished OCR or reports.
+# When the batch shares its OCR engine with the GUI, run_batch goes through the
+# GUI's job_scheduler.JobScheduler: all photos are queued as BATCH jobs up front
+# (the biggest start first) and an operator's photo is always served next.
+
+
+class BatchStats:
+    def __init__(self):
+        self.rebuilt = 0
+        self.skipped = 0
+        self.failed = 0
+        self.ocr_seconds = 0.0
+        self.render_seconds = 0.0
+        self.sources = {}  # field -> {source: reports}, see ocr_service.py
+
+    def summary(self):
+        return (f"{self.rebuilt} rebuilt, {self.skipped} unchanged (skipped), {self.failed} failed; "
+                f"OCR {self.ocr_seconds:.1f}s, render {self.render_seconds:.1f}s")
+
+    def count_sources(self, fields):
+        for name in ("date", "address", "plate", "code"):
+            source = fields["sources"].get(name, (None, "missing"))[1]
+            counts = self.sources.setdefault(name, {})
+            counts[source] = counts.get(source, 0) + 1
+
+    def source_summary(self):
+        """e.g. 'date: exif 70, ocr 1; address: ocr 71; ...' (which source supplied each field)."""
+        return "; ".join(f"{name}: " + ", ".join(f"{source} {count}" for source, count in sorted(counts.items()))
+                         for name, counts in self.sources.items())
+
+
+def schedule_recognition(paths, read_ocr_lines, cache, scheduler, journal=None):
+    """
+    Queues OCR of every photo that is not cached (nor failed before) on `scheduler` as BATCH
+    jobs, each costed by its pixel count. Returns a read_ocr_lines that waits for those jobs.
+    """
+    from job_scheduler import BATCH, image_cost
+    jobs, queued = {}, set()
+    for path in paths:
+        digest = file_sha256(path)
+        if not digest or digest in cache or digest in queued or (journal and journal.ocr_error(digest)):
+            continue # Unreadable photos fail when read; duplicates are cache hits by then
+        queued.add(digest)
+        jobs[path] = scheduler.submit(read_ocr_lines, path, priority=BATCH, cost=image_cost(path), kind="ocr")
+    return lambda path: jobs[path].result() if path in jobs else read_ocr_lines(path)
+
+
+def ocr_photos(paths, read_ocr_lines, plate_map, cache, journal=None, scheduler=None):
+    """
+    path -> fields dict (or {"error": ...}), using the OCR cache. Returns (results, ocr seconds per path).
+    With a journal, every new OCR result (or failure) is checkpointed as soon as it is known.
+    With a `scheduler` (job_scheduler.py) recognition runs as its batch jobs; the seconds then include queueing.
+    """
+    if scheduler:
+        read_ocr_lines = schedule_recognition(paths, read_ocr_lines, cache, scheduler, journal)
+    results, seconds = {}, {}
+    for path in paths:
+        start = time.perf_counter()
+        digest = None
+        try:
+            digest = file_sha256(path)
+            if journal and journal.ocr_error(digest):
+                raise RuntimeError(journal.ocr_error(digest))
+
+            def recognise():
+                ocr_lines = read_ocr_lines(path)
+                if journal:
+                    journal.ocr_done(digest, ocr_lines)
+                return ocr_lines
+            results[path] = extract_fields(cache.lines(digest, recognise), plate_map)
+        except Exception as e:
+            retried = " (retried on the next run)" if is_transient_error(e) else ""
+            print(f"Warning: OCR failed for {os.path.basename(path)}: {e}{retried}")
+            results[path] = {"error": f"OCR 處理失敗: {e}"}
+            if journal and digest and not journal.ocr_error(digest):
+                journal.ocr_failed(digest, e) # Not for transient failures: those are retried
+        seconds[path] = time.perf_counter() - start
+    return results, seconds
+
+
+def run_batch(input_dir, output_dir, read_ocr_lines, plate_map, yellow_template, white_template,
+              truck_type=DEFAULT_TRUCK_TYPE, truck_type_for=None, history=None, force=False,
+              window_seconds=DEFAULT_WINDOW_SECONDS, resume=True, photo_store=None, scheduler=None):
+    """
+    Generates a report for every photo pair in `input_dir`. `read_ocr_lines(path)` returns
+    run_ocr()'s (text, confidence) lines. With `force`, unchanged reports are rebuilt too.
+    With `resume`, progress is journaled and an interrupted run is continued.
+    With a `photo_store` (linked_images.PhotoStore), reports link to the photos instead of embedding them.
+    With a `scheduler` (job_scheduler.JobScheduler), OCR and rendering run as its BATCH jobs.
+    Returns (BatchStats, PairingResult).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    remove_partial_files(output_dir)
+    journal = BatchJournal(output_dir, input_dir) if resume else None
+    try:
+        stats, pairing = _run_batch(input_dir, output_dir, read_ocr_lines, plate_map, yellow_template,
+                                    white_template, truck_type, truck_type_for, history, force,
+                                    window_seconds, journal, photo_store, scheduler)
+    except BaseException:
+        if journal:
+            journal.close() # Kept for the next run to resume from
+        raise
+    if journal:
+        journal.finish(stats.summary())
+    return stats, pairing
+
+
+def _run_batch(input_dir, output_dir, read_ocr_lines, plate_map, yellow_template, white_template,
+               truck_type, truck_type_for, history, force, window_seconds, journal, photo_store, scheduler):
+    from inspection_history import record_safely
+    paths = list_photos(input_dir)
+    cache = OcrCache(os.path.join(output_dir, OCR_CACHE_FILENAME))
+    if journal:
+        journal.restore_ocr(cache)
+    ocr_results, ocr_seconds = ocr_photos(paths, read_ocr_lines, plate_map, cache, journal, scheduler)
+    cache.save()
+    print(f"OCR: {len(paths)} photos, {cache.hits} from cache, {cache.misses} recognised")
+
+    pairing = pair_photos(paths, ocr_results, known_codes=set(plate_map.values()), window_seconds=window_seconds)
+    stats = BatchStats()
+    stats.ocr_seconds = sum(ocr_seconds.values())
+    used_outputs = {}
+    for pair in pairing.pairs:
+        img1, img2 = pair.photo1.path, pair.photo2.path
+        fields = merge_pair_fields(ocr_results[img1], ocr_results[img2], (pair.photo1.taken, pair.photo2.taken))
+        stats.count_sources(fields)
+        plate = fields["plate"]
+        pair_type = (truck_type_for and truck_type_for(plate)) or truck_type
+        output_filename = build_output_filename(fields.get("code"), pair_type)
+        if output_filename in used_outputs:
+            # Two pairs would write the same file; keep the first rather than flip-flopping between runs
+            print(f"Warning: {os.path.basename(img1)} + {os.path.basename(img2)} would overwrite {output_filename} "
+                  f"(already written for {used_outputs[output_filename]}); skipped, needs review.")
+            stats.failed += 1
+            continue
+        used_outputs[output_filename] = os.path.basename(img1)
+        fields["plate"] = format_plate_entry(plate, fields.get("code"))
+        start = time.perf_counter()
+        try:
+            fingerprint = compute_fingerprint(
+                select_template(pair_type, yellow_template, white_template), fields, img1, img2,
+                linked=photo_store is not None)
+            if journal:
+                journal.plan(output_filename, img1, img2)
+                if not force and journal.is_done(output_filename, fingerprint,
+                                                 os.path.join(output_dir, output_filename)):
+                    stats.skipped += 1 # Written before the interruption
+                    continue
+            render = generate_report_file
+            if scheduler:
+                render = _scheduled(scheduler, generate_report_file, img1, img2)
+            doc_path, warnings, rebuilt = render(
+                fields, img1, img2, pair_type, output_dir, yellow_template, white_template,
+                skip_unchanged=not force, photo_store=photo_store)
+        except Exception as e:
+            print(f"Error: Report for {os.path.basename(img1)} + {os.path.basename(img2)} failed: {e}")
+            stats.failed += 1
+            if journal:
+                journal.report_failed(output_filename, e)
+            continue
+        render_seconds = time.perf_counter() - start
+        stats.render_seconds += render_seconds
+        for message in warnings:
+            print(f"Warning: {message}")
+        if not rebuilt:
+            stats.skipped += 1
+            if journal:
+                journal.completed(output_filename, fingerprint)
+            continue
+        stats.rebuilt += 1
+        record_safely(
+            history, "batch", plate=plate, code=fields.get("code"), truck_type=pair_type,
+            address=fields.get("address"), inspection_date=fields.get("date"), image1=img1, image2=img2,
+            output_path=doc_path, template=select_template(pair_type, yellow_template, white_template),
+            ocr_seconds=ocr_seconds[img1] + ocr_seconds[img2], render_seconds=render_seconds)
+        if journal:
+            journal.completed(output_filename, fingerprint)
+        print(f"報告已產生: {doc_path}")
+
+    for group, reason in pairing.ambiguous:
+        print(f"[待確認] {', '.join(os.path.basename(p) for p in group)} ({reason})")
+    for path in pairing.unpaired:
+        print(f"[未配對] {os.path.basename(path)}")
+    print(f"Batch done: {stats.summary()}. {pairing.summary()}")
+    print(f"Field sources: {stats.source_summary()}")
+    return stats, pairing
+
+
+def _scheduled(scheduler, render, img1, img2):
+    """`render` as a BATCH rendering job on `scheduler`, waited for."""
+    from job_scheduler import BATCH, image_cost
+    return lambda *args, **kwargs: scheduler.submit(render, *args, priority=BATCH, cost=image_cost(img1, img2),
+                                                    kind="render", **kwargs).result()
+
+
+def add_batch_arguments(parser):
+    """Command line flags for batch mode, shared by main.py and main-pack.py (uses --truck-type too)."""
+    parser.add_argument("--batch", metavar="INPUT_DIR", help="批次模式：將資料夾內所有照片配對並產生報告")
+    parser.add_argument("--force", action="store_true", help="批次模式：輸入未變更的報告也重新產生")
+    parser.add_argument("--pair-window", type=float, default=DEFAULT_WINDOW_SECONDS,
+                        help="批次模式：同一車輛兩張照片的最大拍攝間隔（秒）")
+    parser.add_argument("--io-workers", type=int, default=4, help="批次模式：同時讀寫檔案的執行緒數")
+    parser.add_argument("--sequential", action="store_true", help="批次模式：不重疊各階段，依序處理")
+    parser.add_argument("--restart", action="store_true",
+                        help="批次模式：捨棄上次中斷的進度紀錄，從頭開始（已完成且未變更的報告仍會略過）")
+    parser.add_argument("--ocr-processes", type=int, default=0,
+                        help="批次模式：以 N 個子行程執行 OCR（各自載入模型，照片經共享記憶體傳遞）")
+    parser.add_argument("--ocr-threads", type=int,
+                        help="批次模式：每個 OCR 子行程的運算執行緒數（預設依核心數平均分配）")
+    parser.add_argument("--pin-cores", action="store_true", help="批次模式：將每個 OCR 子行程固定在各自的核心")
+    parser.add_argument("--link-images", metavar="PHOTO_STORE",
+                        help="批次模式：報告以連結方式引用照片（照片存入此資料夾），不內嵌；"
+                             "需要完整檔時執行 python linked_images.py pack")
+    parser.add_argument("--zip", metavar="ZIP_PATH",
+                        help="批次模式：所有報告直接寫入單一 zip 封存檔（附 manifest.csv），不另存個別檔案")
+
+
+def uses_ocr_processes(args):
+    """Whether this batch recognises in worker processes (--ocr-processes), not with in-process engines."""
+    return bool(args.batch) and args.ocr_processes > 1 and not args.sequential
+
+
+def run_from_args(args, output_dir, read_ocr_lines, plate_map, yellow_template, white_template,
+                  truck_type_for=None, history=None, model_dirs=None, ocr_workers=1):
+    """
+    `read_ocr_lines` must accept a path (sequential) as well as the photo's bytes (pipeline),
+    and may be called from `ocr_workers` threads at once (e.g. one per engine of an ocr_engine_pool).
+    `model_dirs` (det, rec, cls) are needed for --ocr-processes.
+    """
+    options = dict(truck_type=args.truck_type, truck_type_for=truck_type_for, history=history,
+                   force=args.force, window_seconds=args.pair_window)
+    if args.link_images:
+        from linked_images import PhotoStore
+        options["photo_store"] = PhotoStore(args.link_images)
+    if args.zip and args.sequential:
+        print("Error: --zip needs the pipelined batch mode; drop --sequential.")
+        return 2
+    if args.restart:
+        discard_journal(output_dir)
+    if args.sequential:
+        stats, _ = run_batch(args.batch, output_dir, read_ocr_lines, plate_map, yellow_template,
+                             white_template, **options)
+        write_summary_safely(history, output_dir, plate_map)
+        return 1 if stats.failed else 0
+
+    from batch_pipeline import run_pipeline
+    if args.zip:
+        from output_sinks import ZipSink
+        options["sink"] = ZipSink(args.zip)
+    process_ocr = None
+    if uses_ocr_processes(args) and model_dirs:
+        from memory_watchdog import policy_from_args
+        from shm_transport import SharedMemoryOcr
+        from thread_budget import ThreadBudget
+        budget = ThreadBudget(args.ocr_processes, reserve=1, threads_per_worker=args.ocr_threads, pin=args.pin_cores)
+        print(f"Thread budget: {budget.describe()}")
+        process_ocr = read_ocr_lines = SharedMemoryOcr(args.ocr_processes, *model_dirs, budget=budget,
+                                                       recycle=policy_from_args(args))
+    try:
+        stats, _ = run_pipeline(args.batch, output_dir, read_ocr_lines, plate_map, yellow_template,
+                                white_template, io_workers=args.io_workers,
+                                ocr_workers=process_ocr.processes if process_ocr else ocr_workers, **options)
+    finally:
+        if process_ocr:
+            process_ocr.close()
+    write_summary_safely(history, output_dir, plate_map)
+    return 1 if stats.failed else 0
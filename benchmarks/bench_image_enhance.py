@@ -0,0 +1,53 @@
+"""
+Cost of the enhancement retry (image_enhance.py) per photo size and method. It is only
+paid by photos whose first OCR read was weak; the check that decides (retry_reason)
+is measured too, since every photo pays that.
+
+Usage: python benchmarks/bench_image_enhance.py [--repeat 5] [photos...]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_enhance import METHODS, enhance, retry_reason  # noqa: E402
+from plate_locator import load_image  # noqa: E402
+
+SIZES = {"1MP (1280x800)": (800, 1280, 3), "12MP (4000x3000)": (3000, 4000, 3)}
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="enhancement retry cost")
+    parser.add_argument("photos", nargs="*", help="real photos to time as well")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = {label: rng.integers(0, 255, shape, dtype=np.uint8) for label, shape in SIZES.items()}
+    images.update((os.path.basename(path), load_image(path)) for path in args.photos)
+    print(f"{'image':<24} {'method':<10} {'median [ms]':>11}")
+    for label, image in images.items():
+        for method in METHODS:
+            print(f"{label:<24} {method:<10} {median_ms(lambda: enhance(image, method), args.repeat):>11.0f}")
+
+    lines = [("文心路二段28號", 0.93), ("114年03月03日", 0.95), ("KEL-1002", 0.97)]
+    fields = {"address": "文心路二段28號", "date": "114年03月03日", "plate": "KEL-1002"}
+    per_check = median_ms(lambda: [retry_reason(lines, fields, ("plate",)) for _ in range(10000)], args.repeat) / 10000
+    print(f"retry_reason (every photo): {per_check * 1000:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
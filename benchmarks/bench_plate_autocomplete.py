@@ -0,0 +1,59 @@
+"""
+Plate autocomplete (plate_autocomplete.py) lookup latency per keystroke for a synthetic
+fleet of N vehicles, typing each test plate one character at a time. The GUI has a
+frame budget of ~16 ms per keystroke; the index should use a tiny part of it.
+
+Usage: python benchmarks/bench_plate_autocomplete.py [--vehicles 100000] [--typed 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from plate_autocomplete import PlateIndex  # noqa: E402
+
+LETTERS = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+
+
+def synthetic_mapping(count, rng):
+    """`count` distinct plates like KEL-0283, each listed with and without hyphen (as loaded from the workbook)."""
+    mapping = {}
+    while len(mapping) < 2 * count:
+        plate = f"{''.join(rng.choice(LETTERS) for _ in range(3))}-{rng.randrange(10000):04d}"
+        code = str(100 + len(mapping) // 2)
+        mapping[plate] = code
+        mapping[plate.replace("-", "")] = code
+    return mapping
+
+
+def main():
+    parser = argparse.ArgumentParser(description="plate autocomplete latency")
+    parser.add_argument("--vehicles", type=int, default=100000)
+    parser.add_argument("--typed", type=int, default=200, help="plates typed character by character")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mapping = synthetic_mapping(args.vehicles, rng)
+    start = time.perf_counter()
+    index = PlateIndex(mapping)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"{len(index)} vehicles, index built in {build_ms:.0f} ms (once per workbook version)")
+
+    latencies = []
+    for plate in rng.sample(sorted(mapping), args.typed):
+        for length in range(1, len(plate) + 1):
+            start = time.perf_counter()
+            index.complete(plate[:length])
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"{len(latencies)} keystrokes: median {statistics.median(latencies) * 1e6:.1f} us, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us, max {latencies[-1] * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Plate localisation (plate_locator.py) on the sample photos in pictures/.
+Reports the proposal latency and whether the hand-marked plate is covered by one of
+the crops (hit rate at 1 and at MAX_REGIONS proposals). With --ocr and PaddleOCR
+installed, also compares full-frame OCR with the crop-only fast path.
+
+Usage: python benchmarks/bench_plate_locator.py [--repeat N] [--ocr --det DIR --rec DIR --cls DIR]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from plate_locator import CROP_MARGIN, MAX_REGIONS, load_image, propose_plate_regions  # noqa: E402
+
+# Plate boxes (x0, y0, x1, y1) in full-resolution pixels, marked by hand
+PLATES = {
+    "202.jpg": ("KEL-0283", (1542, 1323, 1725, 1472)),
+    "202-.jpg": ("KEL-0283", (1114, 628, 1241, 697)),
+    "206-267.jpg": ("KEG-8396", (1433, 1402, 1627, 1518)),
+    "207-290.jpg": ("KED-3019", (1540, 1524, 1793, 1678)),
+}
+MIN_COVERAGE = 0.8 # Share of the plate box a crop must contain to count as a hit
+
+
+def coverage(region, plate_box):
+    """Share of plate_box inside the region's crop (with its margin)."""
+    x0, y0, x1, y1 = region.box
+    dx, dy = int((x1 - x0) * CROP_MARGIN), int((y1 - y0) * CROP_MARGIN)
+    width = min(x1 + dx, plate_box[2]) - max(x0 - dx, plate_box[0])
+    height = min(y1 + dy, plate_box[3]) - max(y0 - dy, plate_box[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    return width * height / ((plate_box[2] - plate_box[0]) * (plate_box[3] - plate_box[1]))
+
+
+def compare_ocr(args, images):
+    import ocr_service
+    engine = ocr_service.create_ocr_engine(args.det, args.rec, args.cls)
+    plate_map = {plate: name for name, (plate, _) in PLATES.items()}
+    print(f"\n{'photo':<14} {'full [s]':>8} {'plate (full)':<14} {'fast [s]':>8} {'plate (fast)':<14} regions")
+    from plate_locator import read_plate
+    for name, image in images.items():
+        start = time.perf_counter()
+        full = ocr_service.extract_fields(ocr_service.run_ocr(engine, image), plate_map)
+        full_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        fast, tried = read_plate(engine, image, plate_map)
+        fast_seconds = time.perf_counter() - start
+        print(f"{name:<14} {full_seconds:>8.2f} {full['plate'] or '-':<14} {fast_seconds:>8.2f} "
+              f"{(fast or {}).get('plate') or '(fallback)':<14} {tried}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="plate localisation latency and hit rate")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--ocr", action="store_true", help="also compare full-frame and crop OCR (needs paddleocr)")
+    parser.add_argument("--det")
+    parser.add_argument("--rec")
+    parser.add_argument("--cls")
+    args = parser.parse_args()
+
+    images, hits_top1, hits_any = {}, 0, 0
+    print(f"{'photo':<14} {'decode [ms]':>11} {'locate [ms]':>11} {'hit at':>6}  coverage of the proposals")
+    for name, (_, plate_box) in PLATES.items():
+        path = os.path.join(ROOT, "pictures", name)
+        decode, locate = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            image = load_image(path)
+            decode.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            regions = propose_plate_regions(image)
+            locate.append(time.perf_counter() - start)
+        images[name] = image
+        covered = [coverage(region, plate_box) for region in regions]
+        rank = next((i for i, share in enumerate(covered, start=1) if share >= MIN_COVERAGE), None)
+        hits_top1 += rank == 1
+        hits_any += rank is not None
+        print(f"{name:<14} {statistics.median(decode) * 1000:>11.1f} {statistics.median(locate) * 1000:>11.1f} "
+              f"{rank or '-':>6}  {', '.join(f'{share:.2f}' for share in covered)}")
+    print(f"hit rate: {hits_top1}/{len(PLATES)} first proposal, {hits_any}/{len(PLATES)} within {MAX_REGIONS}")
+
+    if args.ocr:
+        compare_ocr(args, images)
+
+
+if __name__ == "__main__":
+    main()
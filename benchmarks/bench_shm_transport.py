@@ -0,0 +1,85 @@
+"""
+Image handoff to worker processes: pickle vs shared memory (shm_transport.py).
+Sends decoded-size RGB arrays to a process pool whose task only touches a sample of
+the pixels, so the numbers are the transport cost, not OCR.
+
+Usage: python benchmarks/bench_shm_transport.py [--images N] [--workers N]
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shm_transport import SharedImageTransport, open_image  # noqa: E402
+
+SIZES = {"1MP (1280x800)": (800, 1280, 3), "12MP (4000x3000)": (3000, 4000, 3)}
+
+
+def _checksum(image):
+    return int(image[::97, ::97].sum())
+
+
+def consume_pickled(image):
+    return _checksum(image)
+
+
+def consume_shared(handle):
+    with open_image(handle) as image:
+        return _checksum(image)
+
+
+def run_pickle(pool, images):
+    latencies = []
+    start = time.perf_counter()
+    for image in images:
+        t = time.perf_counter()
+        pool.submit(consume_pickled, image).result()
+        latencies.append(time.perf_counter() - t)
+    return time.perf_counter() - start, latencies
+
+
+def run_shared(pool, images, transport):
+    latencies = []
+    start = time.perf_counter()
+    for image in images:
+        t = time.perf_counter()
+        handle = transport.put(image)
+        try:
+            pool.submit(consume_shared, handle).result()
+        finally:
+            transport.release(handle)
+        latencies.append(time.perf_counter() - t)
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pickle vs shared-memory image transport")
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Spawned like SharedMemoryOcr's workers: each has its own resource tracker (see shm_transport._attach)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(args.workers, mp_context=context) as pool, SharedImageTransport() as transport:
+        pool.submit(consume_pickled, np.zeros((1, 1, 3), np.uint8)).result()  # Start the workers
+        print(f"{'image size':<18} {'transport':<9} {'total [s]':>9} {'median [ms]':>11} {'MB/s':>8}")
+        for label, shape in SIZES.items():
+            images = [rng.integers(0, 255, shape, dtype=np.uint8) for _ in range(args.images)]
+            megabytes = sum(image.nbytes for image in images) / 1e6
+            for name, run in (("pickle", lambda: run_pickle(pool, images)),
+                              ("shm", lambda: run_shared(pool, images, transport))):
+                total, latencies = run()
+                print(f"{label:<18} {name:<9} {total:>9.3f} {statistics.median(latencies) * 1000:>11.1f} "
+                      f"{megabytes / total:>8.0f}")
+        print(f"segments left: {transport.live_segments()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Startup benchmark for main-pack.py against STARTUP_BUDGET_SECONDS (startup_profile.py).
+Runs `main-pack.py --profile-startup` several cold processes in a row and checks the
+median time to a drawn window. Without a display it falls back to timing the module
+import alone (everything main-pack.py does before creating the window).
+
+Usage: python benchmarks/bench_startup.py [--runs N]
+Exit code 1 if the median is over budget.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from startup_profile import STARTUP_BUDGET_SECONDS  # noqa: E402
+
+MAIN_PACK = os.path.join(ROOT, "main-pack.py")
+_STARTUP_LINE_RE = re.compile(r"^startup: ([\d.]+)s", re.MULTILINE)
+# Loads main-pack.py as a module (not __main__), so the GUI is not started
+IMPORT_ONLY_SNIPPET = "import runpy, sys; runpy.run_path(sys.argv[1], run_name='startup_bench')"
+
+
+def run_with_window():
+    proc = subprocess.run([sys.executable, MAIN_PACK, "--profile-startup"], cwd=ROOT,
+                          capture_output=True, text=True, encoding="utf-8", errors="replace")
+    match = _STARTUP_LINE_RE.search(proc.stdout)
+    if not match:
+        return None, proc.stdout + proc.stderr
+    return float(match.group(1)), proc.stdout
+
+
+def run_import_only():
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", IMPORT_ONLY_SNIPPET, MAIN_PACK], cwd=ROOT,
+                          capture_output=True, text=True, encoding="utf-8", errors="replace")
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="main-pack.py startup time vs. budget")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    timings = []
+    mode = "window"
+    last_report = ""
+    for _ in range(args.runs):
+        if mode == "window":
+            elapsed, output = run_with_window()
+            if elapsed is None:
+                print("No window could be created (headless?); timing module import only.")
+                print(output.strip().splitlines()[-1] if output.strip() else "")
+                mode = "import"
+            else:
+                timings.append(elapsed)
+                last_report = output
+                continue
+        timings.append(run_import_only())
+
+    if last_report:
+        print(last_report.rstrip())
+    median = statistics.median(timings)
+    print(f"mode={mode} runs={len(timings)} median={median:.3f}s min={min(timings):.3f}s max={max(timings):.3f}s")
+    if median > STARTUP_BUDGET_SECONDS:
+        print(f"FAIL: median startup {median:.3f}s exceeds budget {STARTUP_BUDGET_SECONDS:.1f}s")
+        return 1
+    print(f"OK: within budget {STARTUP_BUDGET_SECONDS:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+OCR throughput for 1..N worker processes, with and without the thread budget
+(thread_budget.py). Without it every worker's math library starts one thread per
+core (PaddleOCR: 10), so adding workers oversubscribes the CPU; with it the cores
+are split between the workers.
+
+With --det/--rec/--cls and --images, real OCR runs on the photos of a folder
+(SharedMemoryOcr, as in batch mode). Otherwise a NumPy matrix-multiply job stands
+in for the recognizer: it is the same kind of BLAS-bound work and needs no models.
+
+Usage: python benchmarks/bench_thread_scaling.py [--max-workers N] [--jobs 48] [--pin]
+       python benchmarks/bench_thread_scaling.py --det D --rec R --cls C --images DIR
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from thread_budget import ThreadBudget, usable_cores  # noqa: E402
+
+# numpy is imported in the workers only, after the budget's limits are set (they are
+# read when the BLAS library loads, so this module must not import it at the top)
+
+
+class Unbudgeted(ThreadBudget):
+    """Library defaults: no limits, no pinning, PaddleOCR's own cpu_threads."""
+
+    def describe(self):
+        return f"{self.workers} worker(s), library default threads"
+
+    def apply(self, slot=0):
+        return None
+
+
+def _init_proxy_worker(budget, slots):
+    with slots.get_lock():
+        slot = slots.value
+        slots.value += 1
+    budget.apply(slot)
+    import numpy  # noqa: F401
+
+
+def proxy_job(size):
+    import numpy as np
+    a = np.random.default_rng(size).random((size, size))
+    for _ in range(4):
+        a = a @ a
+        a /= a.max()
+    return float(a[0, 0])
+
+
+def run_proxy(budget, jobs, size):
+    context = multiprocessing.get_context("spawn")
+    slots = context.Value("i", 0)
+    with ProcessPoolExecutor(budget.workers, mp_context=context, initializer=_init_proxy_worker,
+                             initargs=(budget, slots)) as pool:
+        list(pool.map(proxy_job, [64] * budget.workers))  # Start the workers
+        start = time.perf_counter()
+        list(pool.map(proxy_job, [size] * jobs))
+        return time.perf_counter() - start
+
+
+def run_ocr(budget, photos, model_dirs):
+    from shm_transport import SharedMemoryOcr
+    with open(photos[0], "rb") as f:
+        warmup = f.read()
+    ocr = SharedMemoryOcr(budget.workers, *model_dirs, budget=budget)
+    try:
+        with ThreadPoolExecutor(budget.workers) as threads:
+            list(threads.map(ocr, [warmup] * budget.workers))  # Load the models
+            start = time.perf_counter()
+            list(threads.map(lambda path: ocr(open(path, "rb").read()), photos))
+            return time.perf_counter() - start
+    finally:
+        ocr.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR worker scaling with and without a thread budget")
+    parser.add_argument("--max-workers", type=int, default=len(usable_cores()))
+    parser.add_argument("--jobs", type=int, default=48, help="proxy jobs per run")
+    parser.add_argument("--size", type=int, default=384, help="proxy matrix size")
+    parser.add_argument("--reserve", type=int, default=0, help="cores kept out of the budget")
+    parser.add_argument("--pin", action="store_true", help="pin each budgeted worker to its cores")
+    parser.add_argument("--det")
+    parser.add_argument("--rec")
+    parser.add_argument("--cls")
+    parser.add_argument("--images", help="folder of photos for the real OCR run")
+    args = parser.parse_args()
+
+    model_dirs = (args.det, args.rec, args.cls)
+    if all(model_dirs) and args.images:
+        photos = sorted(os.path.join(args.images, name) for name in os.listdir(args.images)
+                        if name.lower().endswith((".jpg", ".jpeg", ".png")))
+        if not photos:
+            parser.error(f"no photos in {args.images}")
+        workload, count, unit = "OCR", len(photos), "photos"
+        run = lambda budget: run_ocr(budget, photos, model_dirs)  # noqa: E731
+    else:
+        workload, count, unit = f"proxy {args.size}x{args.size} matmul", args.jobs, "jobs"
+        run = lambda budget: run_proxy(budget, args.jobs, args.size)  # noqa: E731
+
+    print(f"{workload}, {count} {unit}, {len(usable_cores())} usable cores")
+    print(f"{'workers':>7} {'mode':<9} {'total [s]':>9} {unit + '/s':>10}  budget")
+    for workers in range(1, args.max_workers + 1):
+        for mode, budget in (("default", Unbudgeted(workers)),
+                             ("budget", ThreadBudget(workers, reserve=args.reserve, pin=args.pin))):
+            total = run(budget)
+            print(f"{workers:>7} {mode:<9} {total:>9.2f} {count / total:>10.1f}  {budget.describe()}")
+
+
+if __name__ == "__main__":
+    main()
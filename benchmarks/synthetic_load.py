@@ -0,0 +1,264 @@
+"""
+Synthetic photo sets for stress tests: photo pairs with a rendered stamp (time, ROC
+date, address) and plate, for vehicles taken from the mapping workbook, plus a
+ground-truth manifest. The same seed always produces the same photos, report by
+report, so a 100-report set is the start of the 5000-report one.
+
+  python benchmarks/synthetic_load.py generate synthetic --reports 5000 --seed 7
+  python main.py --batch synthetic/day_001                        (once per day folder)
+  python benchmarks/synthetic_load.py check synthetic --db output/inspection_history.sqlite3
+
+Reports are spread over day_NNN folders holding each vehicle at most once, as one
+inspection day would; batch mode names reports after the vehicle code.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MANIFEST_FILENAME = "manifest.jsonl"
+DEFAULT_MAPPING = os.path.join(ROOT, "license_mapping", "車牌對照表、輪胎規格表114.03.03.xlsx")
+PHOTO_SIZE = (2364, 1774) # What the inspection phones produce
+FONT_CANDIDATES = (
+    r"C:\Windows\Fonts\msjh.ttc", r"C:\Windows\Fonts\mingliu.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+)
+STREETS = ("健行路", "德化街", "美德街", "中山路一段", "文心路二段", "崇德路", "五權西路", "大雅路", "太原路", "忠明南路")
+BODY_COLOURS = {"壓縮式垃圾車": (232, 176, 20), "資源回收車": (236, 236, 232)}
+# How the two photos of a report are named: code-based (paired by filename) or
+# camera-style (paired by OCR / capture time)
+NAMING = ("code", "code_suffix", "camera")
+
+
+def find_font(explicit=None):
+    """A font that can draw the Chinese stamp text, or DejaVu (stamp text then unreadable)."""
+    for path in ((explicit,) if explicit else FONT_CANDIDATES):
+        if path and os.path.exists(path):
+            return path
+    if explicit:
+        sys.exit(f"Font not found: {explicit}")
+    print("Warning: No CJK font found (use --font); addresses and dates will not be readable.")
+    return "DejaVuSans.ttf"
+
+
+def load_vehicles(mapping_file):
+    """(plate, code, truck type) for every vehicle in the workbook, or made-up ones without it."""
+    try:
+        from vehicle_registry import load_vehicle_registry
+        registry = load_vehicle_registry(mapping_file)
+        # One vehicle per code: a day folder must not produce two reports with the same name
+        by_code = {}
+        for record in registry:
+            by_code.setdefault(record.code, (record.plate, record.code, record.truck_type or ""))
+        vehicles = sorted(by_code.values())
+    except ImportError as e:
+        print(f"Warning: Cannot read the mapping workbook ({e}).")
+        vehicles = []
+    if not vehicles:
+        print("Warning: Using 60 made-up vehicles; batch mode will not find their codes.")
+        rng = random.Random(0)
+        vehicles = [(f"{''.join(rng.choices('ABCDEFGHJKLMNPQRSTUVWXYZ', k=3))}-{rng.randrange(10000):04d}",
+                     str(200 + i), "") for i in range(60)]
+    return vehicles
+
+
+def plan_reports(count, seed, vehicles, start_day):
+    """The ground truth of every report; each report has its own RNG stream so sets nest."""
+    reports = []
+    per_day = len(vehicles)
+    for index in range(count):
+        rng = random.Random(f"{seed}:{index}")
+        day_index, slot = divmod(index, per_day)
+        day_vehicles = random.Random(f"{seed}:day:{day_index}").sample(vehicles, per_day)
+        plate, code, truck_type = day_vehicles[slot]
+        truck_type = truck_type or rng.choice(tuple(BODY_COLOURS))
+        taken = start_day + timedelta(days=day_index, hours=8, seconds=slot * 600 + rng.randrange(300)) # Vehicles > pair window apart
+        naming = rng.choice(NAMING)
+        folder = f"day_{day_index + 1:03d}"
+        if naming == "code":
+            names = (f"{code}.jpg", f"{code}-.jpg")
+        elif naming == "code_suffix":
+            names = (f"{code}_1.jpg", f"{code}_2.jpg")
+        else:
+            names = (f"IMG_{index * 2 + 1:05d}.jpg", f"IMG_{index * 2 + 2:05d}.jpg")
+        reports.append({
+            "index": index, "folder": folder, "photo1": names[0], "photo2": names[1], "naming": naming,
+            "plate": plate, "code": code, "truck_type": truck_type,
+            "address": f"{rng.choice(STREETS)}{rng.randrange(1, 800)}號",
+            "date": f"{taken.year - 1911}年{taken.month:02d}月{taken.day:02d}日",
+            "taken": taken.isoformat(), "taken2": (taken + timedelta(seconds=rng.randrange(10, 60))).isoformat(),
+        })
+    return reports
+
+
+def _background(rng, size, body_colour):
+    """Street-ish backdrop with a truck body and a little sensor noise."""
+    import numpy as np
+    from PIL import Image
+    width, height = size
+    noise = np.random.default_rng(rng.randrange(2 ** 32))
+    image = np.empty((height, width, 3), dtype=np.int16)
+    image[:] = np.linspace(rng.randrange(150, 230), rng.randrange(60, 120), height).astype(np.int16)[:, None, None]
+    left, top = int(width * rng.uniform(0.15, 0.3)), int(height * rng.uniform(0.1, 0.25))
+    right, bottom = int(width * rng.uniform(0.7, 0.85)), int(height * rng.uniform(0.8, 0.95))
+    image[top:bottom, left:right] = body_colour
+    # A tiled noise patch is indistinguishable for OCR and far cheaper than per-pixel noise
+    tile = noise.normal(0, 6, (128, 128, 3)).astype(np.int16)
+    image += np.tile(tile, (-(-height // 128), -(-width // 128), 1))[:height, :width]
+    return Image.fromarray(np.clip(image, 0, 255, out=image).astype(np.uint8)), (left, top, right, bottom)
+
+
+def _text_patch(text, font, fill, background=None, padding=0.15):
+    """Text rendered on its own (transparent or plate-coloured) patch, ready to rotate and paste."""
+    from PIL import Image, ImageDraw
+    left, top, right, bottom = font.getbbox(text)
+    pad = int((bottom - top) * padding) + 2
+    patch = Image.new("RGBA", (right - left + 2 * pad, bottom - top + 2 * pad), background or (0, 0, 0, 0))
+    draw = ImageDraw.Draw(patch)
+    if background:
+        draw.rectangle((0, 0, patch.width - 1, patch.height - 1), outline=fill, width=max(2, pad // 3))
+    draw.text((pad - left, pad - top), text, font=font, fill=fill)
+    return patch
+
+
+def _stamp(image, rng, font_path, lines):
+    """The camera app's stamp: white lines right-aligned in the bottom right corner."""
+    from PIL import ImageFont
+    size = int(image.height * rng.uniform(0.03, 0.05))
+    font = ImageFont.truetype(font_path, size)
+    y = image.height - int(size * 0.6)
+    for text in reversed(lines):
+        patch = _text_patch(text, font, (255, 255, 255, 255))
+        y -= patch.height
+        image.paste(patch, (image.width - patch.width - int(size * 1.5), y), patch)
+
+
+def render_photo(report, photo, font_path, size, seed):
+    """One JPEG (bytes) of a report; photo 1 shows the code and stamp, photo 2 the plate and stamp."""
+    import io
+    from PIL import Image, ImageFont
+    rng = random.Random(f"{seed}:{report['index']}:{photo}")
+    if rng.random() < 0.2: # Portrait shots
+        size = (size[1], size[0])
+    image, (left, top, right, bottom) = _background(rng, size, BODY_COLOURS[report["truck_type"]])
+    body_width = right - left
+    if photo == 1:
+        font = ImageFont.truetype(font_path, int(body_width * rng.uniform(0.08, 0.14)))
+        patch = _text_patch(report["code"], font, (20, 20, 20, 255))
+        position = (left + (body_width - patch.width) // 2, top + int((bottom - top) * rng.uniform(0.35, 0.5)))
+    else:
+        font = ImageFont.truetype(font_path, int(body_width * rng.uniform(0.05, 0.09)))
+        patch = _text_patch(report["plate"], font, (20, 60, 40, 255), background=(245, 245, 240, 255))
+        patch = patch.rotate(rng.uniform(-8, 8), expand=True, resample=Image.BICUBIC)
+        position = (left + int((body_width - patch.width) * rng.uniform(0.3, 0.7)),
+                    bottom - patch.height - int((bottom - top) * rng.uniform(0.05, 0.2)))
+    image.paste(patch, position, patch)
+    taken = datetime.fromisoformat(report["taken" if photo == 1 else "taken2"])
+    _stamp(image, rng, font_path, (taken.strftime("%H:%M"), report["date"], report["address"]))
+
+    exif = Image.Exif()
+    exif[306] = taken.strftime("%Y:%m:%d %H:%M:%S") # DateTime, read by exif_metadata.read_capture_time
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=rng.randrange(80, 95), exif=exif)
+    return out.getvalue()
+
+
+def _write_report(job):
+    report, out_dir, font_path, size, seed = job
+    folder = os.path.join(out_dir, report["folder"])
+    os.makedirs(folder, exist_ok=True)
+    hashes = []
+    for photo in (1, 2):
+        data = render_photo(report, photo, font_path, size, seed)
+        with open(os.path.join(folder, report[f"photo{photo}"]), "wb") as f:
+            f.write(data)
+        hashes.append(hashlib.sha256(data).hexdigest())
+    return dict(report, photo1_sha256=hashes[0], photo2_sha256=hashes[1])
+
+
+def generate(args):
+    vehicles = load_vehicles(args.mapping)
+    reports = plan_reports(args.reports, args.seed, vehicles, datetime.fromisoformat(args.start_day))
+    font_path = find_font(args.font)
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    os.makedirs(args.out_dir, exist_ok=True)
+    jobs = [(report, args.out_dir, font_path, size, args.seed) for report in reports]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool, \
+            open(os.path.join(args.out_dir, MANIFEST_FILENAME), "w", encoding="utf-8") as manifest:
+        for done, row in enumerate(pool.map(_write_report, jobs, chunksize=8), start=1):
+            manifest.write(json.dumps(row, ensure_ascii=False) + "\n")
+            if done % 500 == 0:
+                print(f"{done}/{len(jobs)} reports")
+    elapsed = time.perf_counter() - start
+    folders = math.ceil(len(reports) / len(vehicles))
+    print(f"Wrote {len(reports)} reports ({2 * len(reports)} photos) in {folders} day folder(s) "
+          f"to {args.out_dir} in {elapsed:.1f}s (seed {args.seed}, {len(vehicles)} vehicles).")
+    return 0
+
+
+def check(args):
+    """Compares the inspection history written by batch runs over the set with the manifest."""
+    with open(os.path.join(args.dataset, MANIFEST_FILENAME), encoding="utf-8") as f:
+        reports = [json.loads(line) for line in f]
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    rows = {}
+    for row in conn.execute("SELECT * FROM inspections WHERE source = 'batch'"):
+        rows[(row["image1_sha256"], row["image2_sha256"])] = row # Latest run wins
+    conn.close()
+
+    found = swapped = 0
+    correct = {"plate": 0, "code": 0, "address": 0, "date": 0}
+    for report in reports:
+        row = rows.get((report["photo1_sha256"], report["photo2_sha256"]))
+        if row is None:
+            row = rows.get((report["photo2_sha256"], report["photo1_sha256"]))
+            swapped += row is not None
+        if row is None:
+            continue
+        found += 1
+        correct["plate"] += (row["plate"] or "").replace("-", "") == report["plate"].replace("-", "")
+        correct["code"] += row["code"] == report["code"]
+        correct["address"] += row["address"] == report["address"]
+        correct["date"] += (row["inspection_date"] or "").replace(" ", "") == report["date"]
+    total = len(reports)
+    print(f"reports generated: {found}/{total} ({swapped} with the photos swapped)")
+    for field, hits in correct.items():
+        print(f"{field:<8} {hits}/{found} correct ({hits / found:.1%})" if found else f"{field:<8} -")
+    return 0 if found == total else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="synthetic photo sets with ground truth")
+    commands = parser.add_subparsers(dest="command", required=True)
+    make = commands.add_parser("generate", help="render a photo set and its manifest")
+    make.add_argument("out_dir")
+    make.add_argument("--reports", type=int, default=100)
+    make.add_argument("--seed", type=int, default=1)
+    make.add_argument("--mapping", default=DEFAULT_MAPPING, help="mapping workbook the plates are drawn from")
+    make.add_argument("--font", help="TrueType font with Chinese glyphs")
+    make.add_argument("--size", default=f"{PHOTO_SIZE[0]}x{PHOTO_SIZE[1]}", help="photo size WxH")
+    make.add_argument("--start-day", default="2025-03-03", help="first inspection day (YYYY-MM-DD)")
+    make.add_argument("--workers", type=int, default=os.cpu_count())
+    verify = commands.add_parser("check", help="score batch results (inspection history) against the manifest")
+    verify.add_argument("dataset")
+    verify.add_argument("--db", default=os.path.join("output", "inspection_history.sqlite3"))
+    args = parser.parse_args(argv)
+    return generate(args) if args.command == "generate" else check(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
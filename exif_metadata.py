@@ -0,0 +1,43 @@
+import os
+from datetime import datetime
+
+# --- EXIF helpers ---
+# PIL's Image.open only parses the file header, so reading EXIF here never
+# decodes pixel data.
+
+EXIF_IFD_POINTER = 0x8769
+TAG_DATETIME = 306            # IFD0 DateTime (last modification on the phone)
+TAG_DATETIME_ORIGINAL = 36867  # Exif IFD DateTimeOriginal (shutter time)
+EXIF_TIME_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+
+def _parse_exif_time(value):
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "ignore")
+    try:
+        return datetime.strptime(value.strip("\0 ").strip(), EXIF_TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def read_capture_time(path):
+    """
+    Returns the photo's capture time as a datetime, or None if the file has no usable EXIF time.
+    `path` may also be an open binary file (e.g. BytesIO of photo data already read).
+    """
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            exif = img.getexif()
+            taken = _parse_exif_time(exif.get_ifd(EXIF_IFD_POINTER).get(TAG_DATETIME_ORIGINAL))
+            return taken or _parse_exif_time(exif.get(TAG_DATETIME))
+    except (OSError, SyntaxError, ValueError) as e:
+        print(f"Warning: Could not read EXIF from {os.path.basename(getattr(path, 'name', '') or str(path))}: {e}")
+        return None
+
+
+def format_roc_date(taken):
+    """datetime -> the ROC-calendar date the templates use, e.g. 2025-03-03 -> 114年03月03日."""
+    return f"{taken.year - 1911}年{taken.month:02d}月{taken.day:02d}日"
@@ -0,0 +1,189 @@
+import re
+from bisect import bisect_right
+
+# --- Field Extraction Rules ---
+# Declarative description of every field we try to pull out of OCR text.
+# Each field has optional "before"/"after" guards shared by all its rules and a
+# list of rules: a name, a regex (non-capturing groups only, the matcher wraps
+# every rule in its own named group) and a score used to rank candidates.
+# Within a field, rules are tried in descending score order at each position.
+EXTRACTION_RULES = {
+    "date": {
+        "rules": [
+            # ROC calendar date as printed on the photo stamp, e.g. 114年3月3日
+            {"name": "roc_ymd", "pattern": r"\d{2,3}\s*年\s*\d{1,2}\s*月\s*\d{1,2}\s*日", "score": 10},
+        ],
+    },
+    "address": {
+        "before": r"(?=[\u4e00-\u9fff])",
+        "rules": [
+            # Street + number, e.g. 健行路530號 / 中山路一段12號
+            {"name": "street_number", "pattern": r"[\u4e00-\u9fff]+(?:路|街|巷|弄|段)\s*[\d-]+(?:號|号)", "score": 10},
+            # Street name only, used when the number was not recognised
+            {"name": "street_only", "pattern": r"[\u4e00-\u9fff]{2,}(?:路|街|大道)(?:[一二三四五六七八九十]段)?", "score": 3},
+        ],
+    },
+    "plate": {
+        # Plates must not be glued to other letters/digits
+        "before": r"(?<![A-Z0-9])",
+        "after": r"(?![A-Z0-9])",
+        "rules": [
+            # Current format, e.g. KEL-0283, and older three-digit ones, e.g. ABC-123
+            {"name": "letters3_digits", "pattern": r"[A-Z]{3}[- ]?[0-9]{3,4}", "score": 10},
+            # Older truck plates, e.g. 116-UX / 862-UB
+            {"name": "digits_letters2", "pattern": r"[0-9]{3,4}[- ]?[A-Z]{2,3}", "score": 8},
+            # Mixed suffix, e.g. 045-Q3 / 3202D3 / 045 Q3
+            {"name": "digits_alnum", "pattern": r"[0-9]{3,4}[- ]?[A-Z][0-9]", "score": 7},
+            # Short legacy plates, e.g. AB-1234
+            {"name": "letters2_digits", "pattern": r"[A-Z]{2}[- ]?[0-9]{3,4}", "score": 6},
+        ],
+    },
+}
+
+# Parses what the operator typed in the 車牌號碼 entry: PLATE or PLATE(CODE),
+# half or full width parentheses.
+PLATE_ENTRY_PATTERN = r"^\s*([^(（)）]+?)\s*(?:[(（]\s*(\d+)\s*[)）])?\s*$"
+# Parses a PLATE(CODE) cell of the mapping workbook.
+MAPPING_CELL_PATTERN = r"([A-Z0-9-]+)\s*[(（](\d+)[)）]"
+# Parses a CODE(PLATE) cell (工作表1 / first column of 1.2級車牌複製用), possibly split over two lines.
+CODE_PLATE_CELL_PATTERN = r"^\s*(\d+)\s*[(（]\s*([A-Z0-9-]+)\s*[)）]\s*$"
+
+
+def _normalize_plate(value):
+    return value.upper().replace(' ', '-')
+
+
+# Per-field clean-up applied to the raw matched text
+FIELD_NORMALIZERS = {
+    "date": lambda value: value,
+    "address": lambda value: value.strip(),
+    "plate": _normalize_plate,
+}
+
+
+class Candidate:
+    """One possible value for a field, as found by a single rule."""
+    __slots__ = ("field", "value", "rule", "score", "confidence", "line_index")
+
+    def __init__(self, field, value, rule, score, confidence, line_index):
+        self.field = field
+        self.value = value
+        self.rule = rule
+        self.score = score
+        self.confidence = confidence
+        self.line_index = line_index
+
+    def sort_key(self):
+        # Higher rule score first, then higher OCR confidence, then earlier line
+        return (-self.score, -self.confidence, self.line_index)
+
+    def __repr__(self):
+        return f"Candidate({self.field}={self.value!r}, rule={self.rule}, score={self.score}, conf={self.confidence:.2f})"
+
+
+class ExtractionResult:
+    """Ranked candidates per field."""
+
+    def __init__(self, candidates):
+        self.candidates = candidates  # field -> list[Candidate], best first
+
+    def best(self, field, default=""):
+        ranked = self.candidates.get(field)
+        return ranked[0].value if ranked else default
+
+    def ranked(self, field):
+        return [c.value for c in self.candidates.get(field, [])]
+
+
+class FieldMatcher:
+    """All extraction rules compiled into one alternation and applied in a single scan per line."""
+
+    def __init__(self, rules=None):
+        rules = EXTRACTION_RULES if rules is None else rules
+        self._group_info = {}  # group name -> (field, rule name, score)
+        field_alternatives = []
+        for field, spec in rules.items():
+            # Most specific rule first so that, at a given position, it wins
+            ordered = sorted(spec["rules"], key=lambda rule: -rule["score"])
+            alternatives = []
+            for rule in ordered:
+                group_name = f"r{len(self._group_info)}"
+                self._group_info[group_name] = (field, rule["name"], rule["score"])
+                alternatives.append(f"(?P<{group_name}>{rule['pattern']})")
+            field_alternatives.append(f"{spec.get('before', '')}(?:{'|'.join(alternatives)}){spec.get('after', '')}")
+        self.fields = tuple(rules)
+        self._regex = re.compile("|".join(field_alternatives), re.IGNORECASE)
+
+    def extract(self, lines, fields=None, boost=None):
+        """
+        Extracts every field from OCR lines in one pass.
+        `lines` is a list of text strings or (text, confidence) tuples.
+        `fields` limits which fields are collected; `boost` is an optional
+        callable (field, value) -> extra score, e.g. for plates found in the mapping.
+        """
+        wanted = set(self.fields if fields is None else fields)
+        found = {field: [] for field in wanted}
+        texts, confidences, line_starts = [], [], []
+        offset = 0
+        for line in lines:
+            text, confidence = (line, 1.0) if isinstance(line, str) else (line[0], float(line[1]))
+            texts.append(text)
+            confidences.append(confidence)
+            line_starts.append(offset)
+            offset += len(text) + 1
+        seen = set()
+        group_info = self._group_info
+        # One scan over the joined text; match offsets are mapped back to their OCR line
+        for match in self._regex.finditer("\n".join(texts)):
+            group = match.lastgroup
+            field, rule_name, score = group_info[group]
+            if field not in wanted:
+                continue
+            value = FIELD_NORMALIZERS[field](match.group(group))
+            if not value or (field, value) in seen:
+                continue
+            seen.add((field, value))
+            if boost:
+                score += boost(field, value)
+            line_index = bisect_right(line_starts, match.start()) - 1
+            found[field].append(Candidate(field, value, rule_name, score, confidences[line_index], line_index))
+        for ranked in found.values():
+            ranked.sort(key=Candidate.sort_key)
+        return ExtractionResult(found)
+
+
+# Compiled once at import; everything else shares these
+DEFAULT_MATCHER = FieldMatcher()
+_PLATE_ENTRY_RE = re.compile(PLATE_ENTRY_PATTERN, re.IGNORECASE)
+_MAPPING_CELL_RE = re.compile(MAPPING_CELL_PATTERN, re.IGNORECASE)
+_CODE_PLATE_CELL_RE = re.compile(CODE_PLATE_CELL_PATTERN, re.IGNORECASE)
+
+
+def parse_plate_entry(text):
+    """Splits a 車牌號碼 entry like 'KEL-0283(202)' into ('KEL-0283', '202'). Code is None if absent."""
+    text = (text or "").strip()  # A blank entry is no plate, not " "
+    match = _PLATE_ENTRY_RE.match(text)
+    if not match:
+        return text, None
+    return match.group(1).upper(), match.group(2)
+
+
+def format_plate_entry(plate, code):
+    """Inverse of parse_plate_entry: 'KEL-0283', '202' -> 'KEL-0283(202)'."""
+    return f"{plate}({code})" if plate and code else (plate or "")
+
+
+def parse_mapping_cell(text):
+    """Parses a PLATE(CODE) workbook cell into (plate, code), or None if it does not match."""
+    match = _MAPPING_CELL_RE.match(text)
+    if not match:
+        return None
+    return match.group(1).upper(), match.group(2)
+
+
+def parse_code_plate_cell(text):
+    """Parses a CODE(PLATE) workbook cell like '202\\n(KEL-0283)' into (plate, code), or None."""
+    match = _CODE_PLATE_CELL_RE.match(text)
+    if not match:
+        return None
+    return match.group(2).upper(), match.group(1)
@@ -0,0 +1,202 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import date, datetime
+
+from vehicle_registry import normalize_plate
+from report_builder import file_sha256
+
+# --- Inspection history ---
+# Every generated report adds one row to a local SQLite database, so questions like
+# "which vehicles were inspected this month" or "when was plate X last checked" are
+# answered from an index instead of by opening docx files.
+#
+#   python inspection_history.py plate KEL-0283         last inspections of a plate
+#   python inspection_history.py month 2025-03          vehicles inspected in a month
+#   python inspection_history.py range 2025-01-01 2025-03-31
+#   python inspection_history.py export [2025-03] [-o 總表.xlsx]   summary workbook (summary_writer.py)
+
+HISTORY_FILENAME = "inspection_history.sqlite3"
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inspections (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,          -- when the report was generated (local time, ISO)
+    source TEXT NOT NULL,              -- gui / watch / batch
+    plate TEXT NOT NULL,
+    plate_key TEXT NOT NULL,           -- normalize_plate(plate), what queries match on
+    code TEXT,
+    truck_type TEXT,
+    address TEXT,
+    inspection_date TEXT,              -- as printed in the report, e.g. 114年03月03日
+    inspection_day TEXT NOT NULL,      -- the same date as YYYY-MM-DD, for range queries
+    image1_sha256 TEXT,
+    image2_sha256 TEXT,
+    output_path TEXT,
+    template TEXT,
+    ocr_seconds REAL,
+    render_seconds REAL
+);
+CREATE INDEX IF NOT EXISTS idx_inspections_plate ON inspections (plate_key, inspection_day);
+CREATE INDEX IF NOT EXISTS idx_inspections_day ON inspections (inspection_day);
+"""
+
+_ROC_DATE_RE = re.compile(r"(\d{2,3})\s*[年./-]\s*(\d{1,2})\s*[月./-]\s*(\d{1,2})")
+
+
+def roc_to_iso(text):
+    """'114年03月03日' -> '2025-03-03'. None if the text is not a ROC date."""
+    match = _ROC_DATE_RE.search(text or "")
+    if not match:
+        return None
+    year, month, day = (int(g) for g in match.groups())
+    try:
+        return date(year + 1911, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+class InspectionHistory:
+    """The history database. One connection shared by the GUI and worker threads, guarded by a lock."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL") # Readers (the CLI) never block the app
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(self, source, plate, code=None, truck_type=None, address=None, inspection_date=None,
+               image1=None, image2=None, output_path=None, template=None,
+               ocr_seconds=None, render_seconds=None):
+        """Adds one generated report. Image files are hashed here; the photos may be moved later."""
+        now = datetime.now()
+        row = (
+            now.isoformat(timespec="seconds"), source, plate, normalize_plate(plate), code, truck_type,
+            address, inspection_date, roc_to_iso(inspection_date) or now.date().isoformat(),
+            file_sha256(image1) if image1 else None, file_sha256(image2) if image2 else None,
+            os.path.abspath(output_path) if output_path else None, template, ocr_seconds, render_seconds,
+        )
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO inspections (created_at, source, plate, plate_key, code, truck_type, address,"
+                " inspection_date, inspection_day, image1_sha256, image2_sha256, output_path, template,"
+                " ocr_seconds, render_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            return cursor.lastrowid
+
+    def last_for_plate(self, plate, limit=1):
+        """Most recent inspections of a plate (with or without hyphen), newest first."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM inspections WHERE plate_key = ? ORDER BY inspection_day DESC, id DESC LIMIT ?",
+                (normalize_plate(plate), limit)).fetchall()
+
+    def vehicles_between(self, first_day, last_day):
+        """One row per vehicle inspected between two YYYY-MM-DD days (inclusive): plate, code, count, last day."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT plate, code, COUNT(*) AS inspections, MAX(inspection_day) AS last_day"
+                " FROM inspections WHERE inspection_day BETWEEN ? AND ?"
+                " GROUP BY plate_key ORDER BY code, plate", (first_day, last_day)).fetchall()
+
+    def iter_inspections(self, first_day=None, last_day=None, batch_size=500):
+        """
+        Every inspection (optionally between two YYYY-MM-DD days), oldest first, streamed from
+        the database. Uses its own connection, so long exports never hold up record().
+        """
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(
+                "SELECT * FROM inspections WHERE inspection_day BETWEEN ? AND ? ORDER BY inspection_day, id",
+                (first_day or "0000-00-00", last_day or "9999-99-99"))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            conn.close()
+
+
+def open_history(output_dir):
+    """Opens (creating if needed) the history next to the generated reports."""
+    return InspectionHistory(os.path.join(output_dir, HISTORY_FILENAME))
+
+
+def record_safely(history, source, **fields):
+    """Records a report; a history problem is printed but never fails the report itself."""
+    if history is None:
+        return None
+    try:
+        return history.record(source, **fields)
+    except sqlite3.Error as e:
+        print(f"Warning: Could not record report in inspection history: {e}")
+        return None
+
+
+def _month_range(text):
+    year, month = (int(part) for part in text.split("-"))
+    first = date(year, month, 1)
+    following = date(year + month // 12, month % 12 + 1, 1)
+    return first.isoformat(), date.fromordinal(following.toordinal() - 1).isoformat()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查詢檢查紀錄")
+    parser.add_argument("--db", default=os.path.join("output", HISTORY_FILENAME))
+    commands = parser.add_subparsers(dest="command", required=True)
+    by_plate = commands.add_parser("plate", help="某車牌最近的檢查")
+    by_plate.add_argument("plate")
+    by_plate.add_argument("-n", type=int, default=5, help="顯示筆數")
+    by_month = commands.add_parser("month", help="某月份檢查過的車輛 (YYYY-MM，預設本月)")
+    by_month.add_argument("month", nargs="?", default=date.today().strftime("%Y-%m"))
+    by_range = commands.add_parser("range", help="日期區間內檢查過的車輛 (YYYY-MM-DD YYYY-MM-DD)")
+    by_range.add_argument("first_day")
+    by_range.add_argument("last_day")
+    export = commands.add_parser("export", help="匯出檢查總表 xlsx（可指定月份 YYYY-MM）")
+    export.add_argument("month", nargs="?")
+    export.add_argument("-o", "--output", help="輸出檔（預設 output/檢查總表.xlsx）")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"找不到檢查紀錄資料庫: {args.db}")
+        return 1
+    history = InspectionHistory(args.db)
+    start = time.perf_counter()
+    if args.command == "export":
+        from summary_writer import SUMMARY_FILENAME, write_summary
+        path = args.output or os.path.join(os.path.dirname(args.db), SUMMARY_FILENAME)
+        count = write_summary(history, path, None, *(_month_range(args.month) if args.month else ()))
+        print(f"已匯出 {count} 筆至 {path} ({time.perf_counter() - start:.1f}s)")
+        history.close()
+        return 0
+    if args.command == "plate":
+        rows = history.last_for_plate(args.plate, args.n)
+        for row in rows:
+            print(f"{row['inspection_day']}  {row['plate']}({row['code'] or '?'})  {row['address'] or ''}  {row['output_path'] or ''}")
+    else:
+        first_day, last_day = _month_range(args.month) if args.command == "month" else (args.first_day, args.last_day)
+        rows = history.vehicles_between(first_day, last_day)
+        for row in rows:
+            print(f"{row['code'] or '?':>5}  {row['plate']:<10}  {row['inspections']} 次, 最近 {row['last_day']}")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"{len(rows)} 筆 ({elapsed_ms:.1f} ms)")
+    history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+# --- Priority job scheduler in front of the OCR engine and report rendering ---
+# The GUI and a background batch share the OCR engines. Jobs wait in one queue,
+# ordered by:
+#
+#   priority   INTERACTIVE (an operator is waiting) before BATCH: a photo the
+#              operator picks is started as soon as the running job is done, ahead
+#              of every queued batch job (running jobs are never interrupted)
+#   cost       within BATCH, biggest first: a 12MP photo queued last would
+#              otherwise finish the batch alone (longest-processing-time first)
+#   order      first come, first served otherwise (always for INTERACTIVE)
+#
+# A job's cost is its pixel count in megapixels (read from the image header, see
+# image_cost). The scheduler learns seconds per megapixel for each kind of job
+# from the jobs it ran, which gives the queue position and estimated wait the GUI
+# shows while a job is queued.
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+DEFAULT_COST = 1.0  # Megapixels assumed when an image header cannot be read
+# Seconds per megapixel before the first job of a kind has finished
+INITIAL_RATES = {"ocr": 0.4, "render": 0.05}
+RATE_SMOOTHING = 0.2  # Weight of the newest job in the moving average
+
+
+def image_cost(*images):
+    """Megapixels of the given image paths (or encoded bytes), from their headers only; None entries are free."""
+    import io
+    from PIL import Image
+
+    cost = 0.0
+    for image in images:
+        if image is None:
+            continue
+        try:
+            with Image.open(io.BytesIO(image) if isinstance(image, bytes) else image) as opened:
+                width, height = opened.size
+            cost += width * height / 1e6
+        except Exception: # Unreadable or missing: the job itself will report that
+            cost += DEFAULT_COST
+    return cost
+
+
+class Job:
+    """A scheduled call. `future` has its result; `cost` is in megapixels."""
+
+    def __init__(self, fn, args, kwargs, priority, cost, kind, seq):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.cost = cost
+        self.kind = kind
+        self.seq = seq
+        self.future = Future()
+        self.started = None
+        self.finished = None
+
+    def sort_key(self):
+        return (self.priority, -self.cost if self.priority == BATCH else 0.0, self.seq)
+
+    def __lt__(self, other):
+        return self.sort_key() < other.sort_key()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+    def elapsed(self):
+        """Seconds the job ran (without its time in the queue), once finished."""
+        return self.finished - self.started if self.finished is not None else None
+
+    def cancel(self):
+        """Removes a queued job (it is skipped when its turn comes). False once it has started."""
+        return self.future.cancel()
+
+
+class JobScheduler:
+    """
+    Runs submitted calls on `workers` threads, most urgent first (see above).
+    OCR jobs need an engine each: give it no more workers than the engine pool has (ocr_engine_pool.py).
+    """
+
+    def __init__(self, workers=1, name="jobs"):
+        self.workers = workers
+        self.name = name
+        self._queue = []
+        self._running = []
+        self._rates = dict(INITIAL_RATES)
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._threads = []
+
+    def submit(self, fn, *args, priority=BATCH, cost=None, kind="ocr", **kwargs):
+        """Queues fn(*args, **kwargs) and returns its Job. `cost` defaults to DEFAULT_COST megapixels."""
+        job = Job(fn, args, kwargs, priority, DEFAULT_COST if cost is None else cost, kind, next(self._counter))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The scheduler has been shut down")
+            heapq.heappush(self._queue, job)
+            self._start_threads()
+            self._condition.notify()
+        return job
+
+    def _start_threads(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                job = heapq.heappop(self._queue)
+                if not job.future.set_running_or_notify_cancel():
+                    continue # Cancelled while queued
+                job.started = time.perf_counter()
+                self._running.append(job)
+            result, error = None, None
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                error = e
+            job.finished = time.perf_counter()
+            with self._condition:
+                self._running.remove(job)
+                if job.cost > 0:
+                    rate = self._rates.get(job.kind, job.elapsed() / job.cost)
+                    self._rates[job.kind] = (1 - RATE_SMOOTHING) * rate + RATE_SMOOTHING * job.elapsed() / job.cost
+            # Completed last, so whoever waits on it sees finished and the updated rates
+            if error is None:
+                job.future.set_result(result)
+            else:
+                job.future.set_exception(error)
+
+    def _estimate(self, job):
+        return job.cost * self._rates.get(job.kind, INITIAL_RATES["ocr"])
+
+    def position(self, job):
+        """Jobs ahead of `job`: running ones and those queued to start before it. None once it has started."""
+        with self._condition:
+            if job.started is not None or job.future.done():
+                return None
+            return len(self._running) + sum(1 for other in self._queue
+                                            if other < job and not other.future.cancelled())
+
+    def estimated_wait(self, job):
+        """Seconds until `job` is expected to start (0 once it has), from the learned rates."""
+        with self._condition:
+            if job.started is not None or job.future.done():
+                return 0.0
+            now = time.perf_counter()
+            busy = sum(max(0.0, self._estimate(other) - (now - other.started)) for other in self._running)
+            ahead = sum(self._estimate(other) for other in self._queue
+                        if other < job and not other.future.cancelled())
+            return (busy + ahead) / self.workers
+
+    def pending(self, priority=None):
+        """Queued (not yet started) jobs, optionally of one priority."""
+        with self._condition:
+            return sum(1 for job in self._queue if not job.future.cancelled()
+                       and (priority is None or job.priority == priority))
+
+    def describe(self):
+        with self._condition:
+            counts = {name: 0 for name in PRIORITY_NAMES.values()}
+            for job in self._queue:
+                if not job.future.cancelled():
+                    counts[PRIORITY_NAMES[job.priority]] += 1
+            queued = ", ".join(f"{count} {name}" for name, count in counts.items())
+            return f"{len(self._running)} running, queued: {queued}"
+
+    def shutdown(self, wait=True, cancel_queued=False):
+        with self._condition:
+            self._closed = True
+            if cancel_queued:
+                for job in self._queue:
+                    job.future.cancel()
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+def describe_wait(scheduler, job):
+    """Status line for a queued job, e.g. '排隊中：前面還有 3 項，預計約 4 秒後開始'; None once it runs."""
+    position = scheduler.position(job)
+    if position is None:
+        return None
+    return f"排隊中：前面還有 {position} 項，預計約 {scheduler.estimated_wait(job):.0f} 秒後開始"
@@ -0,0 +1,117 @@
+import os
+import time
+import hashlib
+import threading
+from types import MappingProxyType
+from vehicle_registry import VehicleRegistry, load_vehicle_registry
+
+# --- License Plate Mapping ---
+# The workbook is read by vehicle_registry.py (all sheets, with tire specs);
+# this module keeps the plate -> code view the OCR code uses.
+
+
+def load_license_mapping(filepath, data=None):
+    """
+    Loads license plate to code mapping from the specified Excel file.
+    Plates are listed both with and without hyphen.
+    """
+    return load_vehicle_registry(filepath, data).plate_map()
+
+
+# --- Hot-reloadable mapping store ---
+# The fleet office sends updated workbooks during the day. MappingStore keeps the
+# mapping in an immutable, versioned snapshot and a background thread swaps in a
+# new snapshot when the workbook's content hash changes. Callers take one
+# snapshot per operation (store.current()), so a lookup never sees half of an update.
+
+class MappingSnapshot:
+    """One parsed version of the workbook: the vehicle registry and its read-only plate -> code `mapping`."""
+    __slots__ = ("version", "content_hash", "registry", "mapping", "entry_count", "loaded_at")
+
+    def __init__(self, version, content_hash, registry, loaded_at):
+        self.version = version
+        self.content_hash = content_hash
+        self.registry = registry
+        self.mapping = MappingProxyType(registry.plate_map())
+        self.entry_count = len(registry)
+        self.loaded_at = loaded_at
+
+    def describe(self):
+        if not self.version:
+            return "對照表未載入"
+        return f"對照表 v{self.version} ({self.entry_count} 筆, {time.strftime('%H:%M:%S', time.localtime(self.loaded_at))} 載入, {self.content_hash[:8]})"
+
+
+EMPTY_SNAPSHOT = MappingSnapshot(0, "", VehicleRegistry(), 0.0)
+
+
+class MappingStore:
+    """Versioned vehicle registry / plate -> code mapping that follows changes to the workbook file."""
+
+    def __init__(self, filepath, check_interval=5.0, loader=load_vehicle_registry):
+        self.filepath = filepath
+        self.check_interval = check_interval
+        self._loader = loader
+        self._snapshot = EMPTY_SNAPSHOT
+        self._stat_signature = None
+        self._failed_hash = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """The active snapshot. Swapped by a single reference assignment, so always consistent."""
+        return self._snapshot
+
+    def ensure_loaded(self):
+        """Loads the workbook on first use; later changes are picked up by refresh()/the watcher."""
+        if self._stat_signature is None:
+            self.refresh()
+        return self._snapshot
+
+    def refresh(self):
+        """Re-parses the workbook if its content changed. Returns True if a new snapshot was published."""
+        with self._refresh_lock:
+            try:
+                st = os.stat(self.filepath)
+            except FileNotFoundError:
+                if not self._snapshot.version and self._stat_signature != "missing":
+                    self._loader(self.filepath) # Prints the usual "not found" banner once
+                    self._stat_signature = "missing"
+                return False
+            signature = (st.st_size, st.st_mtime_ns)
+            if signature == self._stat_signature:
+                return False # Cheap check first: untouched file, no need to hash
+            with open(self.filepath, "rb") as f:
+                data = f.read()
+            content_hash = hashlib.sha256(data).hexdigest()
+            self._stat_signature = signature
+            if content_hash in (self._snapshot.content_hash, self._failed_hash):
+                return False # Touched but same content (e.g. re-saved), or a version that already failed
+            registry = self._loader(self.filepath, data)
+            if not registry:
+                # Probably caught mid-save: keep serving the old version until the content changes again
+                self._failed_hash = content_hash
+                if self._snapshot.version:
+                    print(f"Warning: Mapping workbook changed but could not be parsed; keeping v{self._snapshot.version}.")
+                return False
+            self._failed_hash = None
+            self._snapshot = MappingSnapshot(self._snapshot.version + 1, content_hash, registry, time.time())
+            print(f"License mapping updated: {self._snapshot.describe()}")
+            return True
+
+    def start_watching(self):
+        """Starts the background change detection (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch_loop, name="mapping-watch", daemon=True)
+            self._thread.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _watch_loop(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Warning: Mapping reload check failed: {e}")
@@ -0,0 +1,149 @@
+import os
+import sys
+import shutil
+import argparse
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from report_builder import file_sha256, save_document
+
+# --- Linked-image reports ---
+# An embedded report is ~1 MB of the same JPEG bytes that are already kept in the
+# photo archive. In linked mode {{IMAGE_1}}/{{IMAGE_2}} become pictures *linked* to
+# a file (w:drawing with <a:blip r:link=...> and an external relationship), so a
+# report is a few tens of KB and rendering only reads each photo's header for its
+# size. Links point into a photo store, not at the input folder:
+#
+#   <store>/ab/ab12...ef.jpg     named by content hash, hard-linked from the input
+#                                photo when on the same volume (no bytes copied)
+#
+# so renaming or clearing the input folder never breaks a report.
+# `python linked_images.py pack` turns linked reports into self-contained ones
+# (e.g. before mailing them); Word also shows linked pictures directly as long as
+# the store is reachable.
+
+IMAGE_RELTYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+
+class PhotoStore:
+    """Content-addressed folder of the photos linked reports point at."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path_for(self, digest, extension):
+        return os.path.join(self.root, digest[:2], digest + extension.lower())
+
+    def add(self, photo_path, digest=None):
+        """The store path of a photo, adding it first if needed (hard link, else copy)."""
+        digest = digest or file_sha256(photo_path)
+        if not digest:
+            raise FileNotFoundError(f"圖片檔案未找到: {photo_path}")
+        target = self.path_for(digest, os.path.splitext(photo_path)[1] or ".jpg")
+        if os.path.exists(target):
+            return target
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        try:
+            os.link(photo_path, tmp_path)
+        except OSError: # Another volume, or a file system without hard links
+            shutil.copyfile(photo_path, tmp_path)
+        os.replace(tmp_path, target)
+        return target
+
+
+def add_linked_picture(run, image_path, width):
+    """
+    Like run.add_picture(image_path, width=width), but the picture is a link to
+    `image_path` instead of a copy. Only the image header is read (for the aspect ratio).
+    """
+    from PIL import Image
+    from docx.oxml.ns import qn
+    from docx.oxml.shape import CT_Inline
+
+    with Image.open(image_path) as image:
+        pixel_width, pixel_height = image.size
+    part = run.part
+    rId = part.relate_to(Path(os.path.abspath(image_path)).as_uri(), IMAGE_RELTYPE, is_external=True)
+    height = int(width * pixel_height / pixel_width)
+    inline = CT_Inline.new_pic_inline(part.next_id, rId, os.path.basename(image_path), width, height)
+    for blip in inline.xpath(".//a:blip"):
+        blip.set(qn("r:link"), blip.get(qn("r:embed")))
+        del blip.attrib[qn("r:embed")]
+    run._r.add_drawing(inline)
+
+
+def linked_path(target_ref):
+    """file:///D:/store/ab/x.jpg -> D:\\store\\ab\\x.jpg (and UNC file://server/share/... links)."""
+    url = urlparse(target_ref)
+    path = url2pathname(url.path)
+    return f"//{url.netloc}{path}" if url.netloc else path
+
+
+def linked_images(document):
+    """(rId, photo path) of every linked picture in the document body."""
+    return [(rId, linked_path(rel.target_ref)) for rId, rel in document.part.rels.items()
+            if rel.is_external and rel.reltype == IMAGE_RELTYPE]
+
+
+def pack_report(doc_path, output_path=None):
+    """
+    Embeds the linked photos of a report so it no longer depends on the photo store.
+    Written over `doc_path` unless `output_path` is given. Returns the number of photos embedded;
+    raises FileNotFoundError (nothing written) if a linked photo is missing.
+    """
+    from docx import Document
+    from docx.oxml.ns import qn
+
+    document = Document(doc_path)
+    links = linked_images(document)
+    if not links and output_path is None:
+        return 0 # Already self-contained
+    for _, photo_path in links:
+        if not os.path.exists(photo_path):
+            raise FileNotFoundError(f"圖片檔案未找到: {photo_path}")
+    part = document.part
+    for rId, photo_path in links:
+        embedded_rId, _ = part.get_or_add_image(photo_path)
+        for blip in document.element.body.xpath(f'.//a:blip[@r:link="{rId}"]'):
+            blip.set(qn("r:embed"), embedded_rId)
+            del blip.attrib[qn("r:link")]
+        del part.rels[rId]
+    save_document(document, output_path or doc_path)
+    return len(links)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="將連結照片的報告轉為內嵌照片的完整報告")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="內嵌照片（預設覆寫原檔）")
+    pack.add_argument("reports", nargs="+", help="報告 .docx 或資料夾")
+    pack.add_argument("-o", "--output-dir", help="另存至此資料夾")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for path in args.reports:
+        if os.path.isdir(path):
+            paths += sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(".docx"))
+        else:
+            paths.append(path)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    failed = 0
+    for path in paths:
+        output_path = os.path.join(args.output_dir, os.path.basename(path)) if args.output_dir else None
+        try:
+            count = pack_report(path, output_path)
+        except Exception as e:
+            print(f"Error: {os.path.basename(path)}: {e}")
+            failed += 1
+            continue
+        if count or output_path:
+            print(f"{os.path.basename(path)}: {count} 張照片已內嵌 -> {output_path or path}")
+    print(f"{len(paths) - failed}/{len(paths)} 份報告完成")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,30 @@
+import os, sys, time
+STARTUP_T0 = time.perf_counter() # For --profile-startup
+if "--profile-startup" in sys.argv:
+    # Must be installed before the imports below so they are measured
+    import startup_profile
+    startup_profile.install()
+
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import os, sys
-from paddleocr import PaddleOCR # Import PaddleOCR
-from PIL import Image, ImageTk, UnidentifiedImageError  # Import ImageTk
-from docx import Document
-from docx.shared import Inches
-import re
-import io  # Import io
-import pandas as pd # Add pandas import
+import argparse
+import threading
+# Heavy dependencies (paddleocr, PIL, python-docx, openpyxl) are imported on first use,
+# so the window shows up without waiting for them.
+from extraction_rules import parse_plate_entry, format_plate_entry
+import ocr_service
+from report_builder import ReportError, build_output_filename, select_template, render_report, save_document
+from watch_folder import add_watch_arguments, run_from_args as run_watch_daemon
+from batch_runner import add_batch_arguments, run_from_args as run_batch
+from summary_writer import SummaryUpdater
+from plate_autocomplete import PlateAutocomplete
+from ocr_engine_pool import add_pool_arguments, create_engine_pool
+from memory_watchdog import WATCHDOG, add_memory_arguments, policy_from_args, start_from_args as start_memory_watchdog
+from report_service_args import add_service_arguments # report_service itself is imported for --serve only
+from job_scheduler import BATCH, INTERACTIVE, JobScheduler, describe_wait, image_cost
+from report_queue import ReportQueue, ReportQueuePanel
+import batch_runner
+from license_mapping import MappingStore
 
 # 如果是被 PyInstaller 打包的 one‑file exe，就把 paddle/libs 加入 DLL 搜寻目录
 if getattr(sys, "frozen", False):
@@ -35,301 +52,115 @@ CLS_DIR = os.path.join(base, "paddle_models", "cls", "ch_ppocr_mobile_v2.0_cls_i
 TEMPLATE_DIR = os.path.join(base, "templates")
 YELLOW_TEMPLATE = os.path.join(TEMPLATE_DIR, "template_yellow.docx")
 WHITE_TEMPLATE = os.path.join(TEMPLATE_DIR, "template_white.docx")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(TEMPLATE_DIR, exist_ok=True)
-print(">>> Using Paddle models in:", DET_DIR, REC_DIR, CLS_DIR)
-
-ocr_engine = PaddleOCR(
-    use_angle_cls=True,
-    lang="ch",
-    use_gpu=False,
-    det_model_dir=DET_DIR,
-    rec_model_dir=REC_DIR,
-    cls_model_dir=CLS_DIR
-)
-print("PaddleOCR Initialized.")
-
-# --- Load License Plate Mapping ---
-def load_license_mapping(filepath):
-    """Loads license plate to code mapping from the specified Excel file."""
-    mapping = {}
-    try:
-        # Try reading the specified sheet name first, then common fallbacks
-        sheet_name_to_try = '1.2級車牌複製用'
-        try:
-            df = pd.read_excel(filepath, sheet_name=sheet_name_to_try, header=None) # Assuming no header
-        except ValueError: # If the specific sheet is not found
-            print(f"Warning: Sheet '{sheet_name_to_try}' not found. Trying '工作表1' or 'Sheet1'...")
+
+
+def ensure_directories():
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(TEMPLATE_DIR, exist_ok=True)
+
+
+# --- Lazily created shared state ---
+# The PaddleOCR engines (see ocr_engine_pool.py) and the mapping are built on first
+# use (or by the background warm-up once the window is up), never at import time.
+ocr_pool = create_engine_pool(DET_DIR, REC_DIR, CLS_DIR)
+# Follows edits to the workbook while the app runs (see license_mapping.MappingStore)
+mapping_store = MappingStore(MAPPING_FILE)
+
+
+def get_license_plate_map():
+    """The current mapping snapshot (read-only dict). Take it once per photo, not per lookup."""
+    return mapping_store.ensure_loaded().mapping
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history():
+    """The inspection history database in OUTPUT_DIR, opened on first use. None if it cannot be opened."""
+    global _history
+    with _history_lock:
+        if _history is None:
             try:
-                df = pd.read_excel(filepath, sheet_name='工作表1', header=None)
-            except ValueError:
-                try:
-                    df = pd.read_excel(filepath, sheet_name='Sheet1', header=None)
-                except ValueError:
-                    print(f"Error: Could not find sheets '{sheet_name_to_try}', '工作表1', or 'Sheet1' in {filepath}")
-                    return {}
-
-        # --- Final Revised Mapping Logic --- 
-        # Reads PLATE(CODE) format directly from columns B, D, F (indices 1, 3, 5)
-        mapping = {} # Reset mapping here before filling
-        relevant_columns = [1, 3, 5] # Columns B, D, F
-
-        for col_idx in relevant_columns:
-            if col_idx < df.shape[1]: # Check column exists
-                for item in df[col_idx].dropna(): # Iterate through non-empty cells in the column
-                    item_str = str(item).strip()
-                    # Regex to extract PLATE(CODE) format - Handles both half/full width parentheses
-                    match = re.match(r'([A-Z0-9-]+)\s*[(（](\d+)[)）]', item_str, re.IGNORECASE)
-                    if match:
-                        plate = match.group(1).upper()
-                        code = match.group(2) # Digits only
-                        mapping[plate] = code
-                        # Add version without hyphen too
-                        mapping[plate.replace('-', '')] = code
-                    else:
-                        # Keep this uncommented for debugging
-                        print(f"Debug: Item '{item_str}' in column {col_idx+1} did not match PLATE(CODE) format.")
-                        pass
-        # ------------------------------------
-
-        if not mapping:
-            print("Warning: No license plate mappings were loaded. Check file path, sheet name, and column format.")
-        else:
-            print(f"Successfully loaded {len(mapping)} license plate mappings.")
-        return mapping
-
-    except FileNotFoundError:
-        print(f"*********************************************************************")
-        print(f"*** Error: Mapping file not found at '{os.path.abspath(filepath)}' ***")
-        print(f"*** Please ensure the file exists and the path is correct. ***")
-        print(f"*********************************************************************")
-        return {} # Return empty mapping on file not found
-    except Exception as e: # General except block for any other errors during loading/processing
-        print(f"*****************************************************")
-        print(f"*** Error loading license plate mapping: {e} ***")
-        print(f"*** Check file integrity, sheet names, and format. ***")
-        print(f"*****************************************************")
-        return {} # Return empty mapping on other errors
-
-license_plate_map = load_license_mapping(MAPPING_FILE)
+                from inspection_history import open_history # sqlite3: not needed to show the window
+                _history = open_history(OUTPUT_DIR)
+            except Exception as e:
+                print(f"Warning: Inspection history unavailable: {e}")
+                return None
+    return _history
+
+
+summary_updater = SummaryUpdater(OUTPUT_DIR, get_license_plate_map)
+
+# --- Job scheduler (see job_scheduler.py) ---
+# Runs all OCR and rendering, as many jobs at once as there are engines in the
+# pool: the operator's jobs (INTERACTIVE) ahead of a background batch's (BATCH).
+scheduler = JobScheduler(workers=ocr_pool.size, name="ocr")
+
+
+def use_ocr_engines(count):
+    """Allows `count` OCR engines (--ocr-engines) and as many concurrent scheduler jobs."""
+    ocr_pool.resize(count)
+    scheduler.workers = count
+
+
+def render_queued_report(report):
+    """Renders and saves a report staged in the GUI's queue (report_queue.py), on a render worker, and records it."""
+    report.stage = "產生中…"
+    document = render_report(report.template_path, report.fields, report.image1, report.image2, report.warnings)
+    report.stage = "儲存中…"
+    save_document(document, report.output_path) # Via a temporary file: never a half-written report
+    for message in report.warnings: # Image insertion problems; the report is still saved
+        print(f"錯誤: {message}")
+    from inspection_history import record_safely
+    record_safely(
+        get_history(), "gui", plate=report.details["plate"], code=report.details["code"],
+        truck_type=report.details["truck_type"], address=report.fields["address"],
+        inspection_date=report.fields["date"], image1=report.image1, image2=report.image2,
+        output_path=report.output_path, template=report.template_path,
+        ocr_seconds=report.details["ocr_seconds"], render_seconds=time.perf_counter() - report.job.started)
+    summary_updater.request(get_history()) # 檢查總表.xlsx, rebuilt in the background
+
+
+# Reports the operator has confirmed, rendered in the background while the next vehicle is entered
+report_queue = ReportQueue(render_queued_report)
+
+
+def warm_up_in_background():
+    """Loads the mapping and the OCR models in a background thread so the first OCR is fast."""
+    def warm_up():
+        get_license_plate_map()
+        mapping_store.start_watching()
+        print(">>> Using Paddle models in:", DET_DIR, REC_DIR, CLS_DIR)
+        ocr_pool.prefill()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
 # --------------------------------
 
 # --- OCR Function using PaddleOCR ---
 def extract_data_from_image(image_path):
-    # Placeholder function for OCR extraction.
-    try:
-        # No specific image preprocessing needed initially for PaddleOCR, it handles much internally
-        # img = Image.open(image_path)
-        # img = img.convert('L')
-
-        print(f"--- Running PaddleOCR on {os.path.basename(image_path)} ---")
-        result = ocr_engine.ocr(image_path, cls=True)
-        print("--- PaddleOCR Raw Result ---")
-        # print(result) # Can be very verbose
-        print("-----------------------------")
-
-        # Process PaddleOCR result into a single text block
-        text_lines = []
-        if result and result[0]: # Check if result is valid and contains data
-            for line_info in result[0]:
-                # line_info is like [[[coords]], ('text', confidence)]
-                text_lines.append(line_info[1][0])
-        text = "\n".join(text_lines)
-
-        print("--- Reconstructed Text ---")
-        print(text)
-        print("---------------------------")
-
-
-        # Basic extraction attempts (only for Address and Date now)
-        # Date (look for 年月日 pattern)
-        date_match = re.search(r'(\d{2,3})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日', text)
-        date_str = date_match.group(0) if date_match else ""
-
-        # Address (very basic - look for 路 or 街 or 號) - Needs improvement
-        # Corrected Regex: Matches Chinese characters + street type + numbers + 号/號
-        address_match = re.search(r'([\u4e00-\u9fff]+(?:路|街|巷|弄)\s*[\d-]+(?:號|号))', text)
-        address_str = address_match.group(1).strip() if address_match else ""
-
-        # --- Add License Plate Extraction ---
-        # Regex to find common Taiwanese license plates (e.g., ABC-1234, KEL-0283, 1234-AB, TXY-1234)
-        # This regex tries to cover various formats, including older ones and newer ones.
-        # It looks for patterns like AAA-NNNN, AAA-NNN.N, AA-NNNN, NNNN-AA, K(E/A/...)L-NNNN etc.
-        # Making it less strict about exact character counts where applicable.
-        plate_match = re.search(r'([A-Z]{2,3}[- ]?[0-9]{3,4})|([0-9]{3,4}[- ]?[A-Z]{2,3})', text, re.IGNORECASE)
-        plate_str = plate_match.group(0).upper().replace(' ', '-') if plate_match else ""
-        code_str = None # Initialize code as None
-        if plate_str and license_plate_map: # Check if map is loaded
-            # Look up in map (try with and without hyphen)
-            code_str = license_plate_map.get(plate_str) or license_plate_map.get(plate_str.replace('-', ''))
-        # ------------------------------------
-
-        # REMOVED OCR FOR PLATE AND TYPE - These will be manual
-        # truck_type = ...
-
-        return {"address": address_str, "date": date_str, "plate": plate_str, "code": code_str}
-
-    except FileNotFoundError:
-        return {"error": "圖片檔案未找到"}
-    except Exception as e:
-        print(f"OCR Error: {e}")
-        return {"error": f"OCR 處理失敗: {e}"}
-
-
-def generate_word_doc(data, img_path1, img_path2, output_filename):
-    # Placeholder function for generating the Word document.
-    # Determine template based on color (assuming manual selection for now)
-    # For now, let's default to yellow, will add color selection later
-    template_path = YELLOW_TEMPLATE # Defaulting, need GUI element for this
-    # TODO: Add logic to select template based on GUI input for color
-
-    try:
-        if not os.path.exists(template_path):
-             messagebox.showerror("錯誤", f"模板檔案未找到: {template_path}")
-             return
-
-        document = Document(template_path)
-
-        # --- Replace Text Placeholders --- ## YOU ARE HERE
-        replacements = {
-            "{{ADDRESS}}": data.get("address", "N/A"),
-            "{{DATE}}": data.get("date", "N/A"),
-            "{{LICENSE_PLATE}}": data.get("plate", "N/A"),
-            # Checkboxes
-            "{{CHECKBOX_COMPRESSION}}": "■" if data.get("type") == "壓縮式垃圾車" else "□",
-            "{{CHECKBOX_RECYCLING}}": "■" if data.get("type") == "資源回收車" else "□",
-        }
+    """OCRs one photo with a pooled engine and the shared mapping (see ocr_service.py)."""
+    return ocr_pool.run(ocr_service.extract_data_from_image, image_path, get_license_plate_map())
+
 
-        # Replace in paragraphs
-        for p in document.paragraphs:
-            for key, value in replacements.items():
-                if key in p.text:
-                    inline = p.runs
-                    # Replace runs containing key
-                    for i in range(len(inline)):
-                        if key in inline[i].text:
-                            text = inline[i].text.replace(key, value)
-                            inline[i].text = text
-
-        # Replace in tables
-        for table in document.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for p in cell.paragraphs:
-                        for key, value in replacements.items():
-                            if key in p.text:
-                                inline = p.runs
-                                for i in range(len(inline)):
-                                    if key in inline[i].text:
-                                        text = inline[i].text.replace(key, value)
-                                        inline[i].text = text
-
-
-        # --- Replace Image Placeholders ---
-        # We need to find the paragraph containing the placeholder, clear it, then add picture
-        def replace_image_placeholder(doc, placeholder, img_path, width_inches=3.0):
-            replaced = False
-            print(f"DEBUG: Searching for placeholder: '{placeholder}'")
-            for p_idx, p in enumerate(doc.paragraphs):
-                print(f"DEBUG: Checking paragraph {p_idx} text: '{p.text}'")
-                if placeholder in p.text:
-                    # Clear the placeholder text first
-                    # --- Use run-level replacement to preserve formatting ---
-                    inline = p.runs
-                    for i in range(len(inline)):
-                        if placeholder in inline[i].text:
-                            inline[i].text = inline[i].text.replace(placeholder, '')
-                    # --- End run-level replacement ---
-                    # p.text = p.text.replace(placeholder, '') # Basic clear (commented out)
-
-                    # Add the picture in the now empty paragraph (or where the run was)
-                    try:
-                        print(f"DEBUG: Found placeholder in paragraph {p_idx}. Attempting to add picture: {img_path}")
-                        run = p.add_run() # Add picture in a new run at the end of the paragraph
-                        run.add_picture(img_path, width=Inches(width_inches))
-                        replaced = True
-                    except FileNotFoundError:
-                        messagebox.showerror("錯誤", f"圖片檔案未找到: {img_path}")
-                        print(f"錯誤: 找不到檔案 {img_path}")
-                    except UnidentifiedImageError:
-                        messagebox.showerror("錯誤", f"無法識別圖片檔案格式或檔案已損毀: {os.path.basename(img_path)}")
-                        print(f"錯誤: 無法識別圖片 {img_path}")
-                    except Exception as e:
-                        # 顯示實際的錯誤類型和訊息
-                        error_message = f"插入圖片 '{os.path.basename(img_path)}' 時發生未預期錯誤:\n{type(e).__name__}: {e}"
-                        messagebox.showerror("錯誤", error_message)
-                        print(f"錯誤: {error_message}")
-                    # Break after first replacement in paragraphs if needed, or handle multiple occurrences
-                    # For now, assume unique placeholders
-                    if replaced: break
-            if replaced: return True # Return True if replaced in paragraphs
-
-            # Check tables if not found in paragraphs
-            print(f"DEBUG: Placeholder '{placeholder}' not found in paragraphs. Checking tables...")
-            for t_idx, table in enumerate(doc.tables):
-                 for r_idx, row in enumerate(table.rows):
-                     try: # Outer try for row.cells access
-                         for c_idx, cell in enumerate(row.cells):
-                             for p_idx, p in enumerate(cell.paragraphs):
-                                 print(f"DEBUG: Checking table {t_idx}, row {r_idx}, cell {c_idx}, paragraph {p_idx} text: '{p.text}'")
-                                 if placeholder in p.text:
-                                     # Clear placeholder and attempt to insert image
-                                     # --- Use run-level replacement ---
-                                     inline = p.runs
-                                     for i in range(len(inline)):
-                                         if placeholder in inline[i].text:
-                                             inline[i].text = inline[i].text.replace(placeholder, '')
-                                     # --- End run-level replacement ---
-                                     # p.text = p.text.replace(placeholder, '') # Basic clear (commented out)
-
-                                     try: # Inner try for image insertion
-                                         print(f"DEBUG: Found placeholder in table cell. Attempting to add picture: {img_path}")
-                                         run = p.add_run() # Add picture in a new run
-                                         run.add_picture(img_path, width=Inches(width_inches))
-                                         replaced = True # Set flag to True on success
-                                     except FileNotFoundError:
-                                         messagebox.showerror("錯誤", f"圖片檔案未找到: {img_path}")
-                                         print(f"錯誤: 找不到檔案 {img_path}")
-                                     except UnidentifiedImageError:
-                                         messagebox.showerror("錯誤", f"無法識別圖片檔案格式或檔案已損毀: {os.path.basename(img_path)}")
-                                         print(f"錯誤: 無法識別圖片 {img_path}")
-                                     except Exception as e:
-                                          error_message = f"插入表格圖片 '{os.path.basename(img_path)}' 時發生錯誤:\n{type(e).__name__}: {e}"
-                                          messagebox.showerror("錯誤", error_message)
-                                          print(f"錯誤: {error_message}")
-                                     # Break inner loops if image replaced
-                                     if replaced: break # break paragraph loop
-                             if replaced: break # break cell loop
-                     except AttributeError:
-                         # Skip rows that cause AttributeError (likely malformed)
-                         print(f"Warning: Skipping a row in table {t_idx} due to unexpected structure (no 'cells' attribute).")
-                         continue # Continue to the next row
-
-                     # Break outer loop (row loop) if image replaced
-                     if replaced: break
-                 # Break table loop if image replaced
-                 if replaced: break
-
-            # Return status after checking both paragraphs and tables
-            if not replaced:
-                 print(f"Warning: Image placeholder '{placeholder}' not found anywhere in the document.")
-            return replaced
-
-        if img_path1 and not replace_image_placeholder(document, "{{IMAGE_1}}", img_path1, width_inches=5.0):
-             # Warning is now printed inside the function if not found
-             pass # print(f"Warning: Image placeholder '{{IMAGE_1}}' not found in the document.")
-        if img_path2 and not replace_image_placeholder(document, "{{IMAGE_2}}", img_path2, width_inches=5.0):
-             # Warning is now printed inside the function if not found
-             pass # print(f"Warning: Image placeholder '{{IMAGE_2}}' not found in the document.")
-
-
-        # Save the document
-        doc_path = os.path.join(OUTPUT_DIR, output_filename)
-        document.save(doc_path)
-        messagebox.showinfo("成功", f"報告已產生: {doc_path}")
-
-    except Exception as e:
-        messagebox.showerror("錯誤", f"產生 Word 文件時發生錯誤: {e}")
+def read_photo_fields(image_path, known=()):
+    """
+    EXIF date first, then OCR for the rest; when `known` and EXIF already give address and date,
+    only the likely plate regions are recognised (see ocr_service.read_photo_fields).
+    """
+    return ocr_pool.run(ocr_service.read_photo_fields, image_path, get_license_plate_map(), known)
+
+
+def read_selection(path1, path2):
+    """OCR of the photos picked in the GUI (run as a scheduler job). Returns (data1, data2); None for no photo."""
+    data1 = read_photo_fields(path1) if path1 else None
+    # Photo one (or EXIF) usually gives the address and date; then photo two is only needed for the plate
+    known = []
+    if data1 and "error" not in data1 and data1.get("address"):
+        known.append("address")
+    if data1 and data1.get("date"): # The EXIF date also survives an OCR error
+        known.append("date")
+    data2 = read_photo_fields(path2, known=known) if path2 else None
+    return data1, data2
 
 
 # --- GUI Application ---
@@ -341,6 +172,10 @@ class App:
         self.img_path1 = tk.StringVar()
         self.img_path2 = tk.StringVar()
         self.ocr_data = {} # To store combined results from OCR (mainly for potential pre-fill)
+        self.ocr_seconds = None # Duration of the last OCR run, recorded in the inspection history
+        self.ocr_job = None # OCR of the current selection, queued or running on the scheduler
+        self.batch_thread = None # Background batch (start_background_batch)
+        self.batch_status = ""
 
         # --- Manual Input Variables ---
         self.plate_var = tk.StringVar()
@@ -378,6 +213,8 @@ class App:
         tk.Label(frame_manual_input, text="車牌號碼:").grid(row=0, column=0, padx=5, pady=2, sticky="w")
         plate_entry = tk.Entry(frame_manual_input, textvariable=self.plate_var, width=40)
         plate_entry.grid(row=0, column=1, padx=5, pady=2, sticky="ew")
+        # Suggestions from the mapping as the plate is typed; choosing one fills in PLATE(CODE)
+        self.plate_autocomplete = PlateAutocomplete(plate_entry, self.plate_var, get_license_plate_map)
 
         # Address
         tk.Label(frame_manual_input, text="檢查地點路段:").grid(row=1, column=0, padx=5, pady=2, sticky="w")
@@ -410,7 +247,32 @@ class App:
         scrollbar.config(command=self.result_text.yview) # Link scrollbar to text widget
 
         # Generate Button
-        tk.Button(root, text="產生報告", command=self.generate_report, font=('Arial', 12, 'bold')).pack(pady=20)
+        tk.Button(root, text="產生報告（加入佇列）", command=self.generate_report, font=('Arial', 12, 'bold')).pack(pady=(20, 5))
+        tk.Button(root, text="背景批次處理資料夾…", command=self.start_background_batch).pack(pady=(0, 10))
+
+        # Queue position of the OCR job the operator is waiting for
+        self.job_status_var = tk.StringVar()
+        tk.Label(root, textvariable=self.job_status_var, fg="blue").pack(anchor="w", padx=10)
+        self.batch_status_var = tk.StringVar()
+        tk.Label(root, textvariable=self.batch_status_var, fg="gray").pack(side=tk.BOTTOM, anchor="w", padx=10)
+
+        # Active mapping version; the store may swap in a new workbook while the app runs
+        self.mapping_status_var = tk.StringVar(value=mapping_store.current().describe())
+        tk.Label(root, textvariable=self.mapping_status_var, fg="gray").pack(side=tk.BOTTOM, anchor="e", padx=10)
+        self.root.after(1000, self.refresh_mapping_status)
+
+        # Staged reports and their progress; rendering never blocks the form
+        self.queue_panel = ReportQueuePanel(root, report_queue)
+        self.queue_panel.pack(padx=10, pady=5, fill="both", expand=True)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def refresh_mapping_status(self):
+        self.mapping_status_var.set(mapping_store.current().describe())
+        if self.batch_thread and self.batch_thread.is_alive():
+            self.batch_status_var.set(f"背景批次進行中：{scheduler.pending(BATCH)} 項待處理")
+        else:
+            self.batch_status_var.set(self.batch_status)
+        self.root.after(1000, self.refresh_mapping_status)
 
     def select_image(self, path_var, preview_label):
         file_path = filedialog.askopenfilename(
@@ -426,6 +288,7 @@ class App:
     def display_image_preview(self, file_path, preview_label, max_width=200, max_height=150):
         # Displays a preview of the selected image in the GUI.
         try:
+            from PIL import Image, ImageTk # Imported on first preview, not at startup
             img = Image.open(file_path)
             img.thumbnail((max_width, max_height)) # Resize preserving aspect ratio
             photo = ImageTk.PhotoImage(img)
@@ -437,20 +300,51 @@ class App:
             preview_label.image = None # Clear reference
 
 
+    def wait_for_job(self, job, on_done, on_error=None):
+        """
+        Follows a scheduler job from the Tk loop, showing its queue position and estimated wait,
+        then calls on_done(result) or on_error(exception) on the Tk thread.
+        """
+        if not job.done():
+            self.job_status_var.set(describe_wait(scheduler, job) or "處理中…")
+            self.root.after(100, self.wait_for_job, job, on_done, on_error)
+            return
+        self.job_status_var.set("")
+        if job.future.cancelled():
+            return
+        error = job.future.exception()
+        if error is None:
+            on_done(job.result())
+        elif on_error:
+            on_error(error)
+        else:
+            messagebox.showerror("錯誤", f"{type(error).__name__}: {error}")
+
     def run_ocr_on_selection(self):
-        # Runs OCR on selected images and updates the results display.
+        # Queues OCR of the selected images; the results display is updated when it is done.
         self.ocr_data = {} # Reset previous results
+        path1 = self.img_path1.get()
+        path2 = self.img_path2.get()
+        if self.ocr_job:
+            self.ocr_job.cancel() # Superseded by this selection (too late if it is already running)
+        job = self.ocr_job = scheduler.submit(read_selection, path1, path2, priority=INTERACTIVE,
+                                              cost=image_cost(path1 or None, path2 or None), kind="ocr")
+
+        def on_done(result):
+            if job is self.ocr_job: # Not superseded meanwhile
+                self.ocr_seconds = job.elapsed()
+                self.show_ocr_results(*result)
+        self.wait_for_job(job, on_done)
+
+    def show_ocr_results(self, data1, data2):
+        # Shows read_selection's results and pre-fills the manual fields.
         results_display = ""
         ocr_address = ""
         ocr_date = ""
         ocr_plate = "" # Add variable for plate
         ocr_code = ""  # Add variable for code
 
-        path1 = self.img_path1.get()
-        path2 = self.img_path2.get()
-
-        if path1:
-            data1 = extract_data_from_image(path1)
+        if data1:
             if "error" not in data1:
                  # Store potential OCR results
                  if data1.get('address'): ocr_address = data1.get('address')
@@ -459,12 +353,15 @@ class App:
                  if data1.get('code'): ocr_code = data1.get('code')    # Get code if found
                  plate_display = f"{ocr_plate}({ocr_code})" if ocr_plate and ocr_code else ocr_plate # Format for display
                  results_display += f"照片一 OCR (參考):\n  地址: {ocr_address or 'N/A'}\n  日期: {ocr_date or 'N/A'}\n  車牌: {plate_display or 'N/A'}\n" # Add formatted plate to display
+                 results_display += f"  來源: {ocr_service.describe_sources(data1.get('sources', {})) or 'N/A'}\n"
             else:
                  results_display += f"照片一 OCR 錯誤: {data1['error']}\n"
+                 if data1.get('date'): # The EXIF date does not depend on OCR
+                     ocr_date = data1['date']
+                     results_display += f"  日期 (EXIF): {ocr_date}\n"
 
 
-        if path2:
-            data2 = extract_data_from_image(path2)
+        if data2:
             if "error" not in data2:
                  # Update address/date only if first image didn't find it
                  if not ocr_address and data2.get('address'): ocr_address = data2.get('address')
@@ -477,9 +374,12 @@ class App:
                      ocr_code = data2.get('code')
 
                  plate_display = f"{ocr_plate}({ocr_code})" if ocr_plate and ocr_code else ocr_plate # Format for display
-                 results_display += f"照片二 OCR (參考):\n  地址: {data2.get('address', 'N/A')}\n  日期: {data2.get('date', 'N/A')}\n  車牌: {plate_display or 'N/A'}\n" # Add formatted plate to display
+                 results_display += f"照片二 OCR (參考):\n  地址: {data2.get('address') or 'N/A'}\n  日期: {data2.get('date') or 'N/A'}\n  車牌: {plate_display or 'N/A'}\n" # Add formatted plate to display
+                 results_display += f"  來源: {ocr_service.describe_sources(data2.get('sources', {})) or 'N/A'}\n"
             else:
                  results_display += f"照片二 OCR 錯誤: {data2['error']}\n"
+                 if not ocr_date and data2.get('date'):
+                     ocr_date = data2['date']
 
 
         # --- Pre-fill manual fields with OCR results (if found) ---
@@ -490,17 +390,22 @@ class App:
         if ocr_date:
             self.date_var.set(ocr_date)
         if ocr_plate: # Pre-fill plate if found
-            plate_display = f"{ocr_plate}({ocr_code})" if ocr_code else ocr_plate # Format plate with code if available
+            plate_display = format_plate_entry(ocr_plate, ocr_code) # Format plate with code if available
             self.plate_var.set(plate_display)
         # else:
             # self.date_var.set("")
         # else:
             # self.plate_var.set("") # Optional: Clear plate if not found
 
+        # Vehicle details from the workbook (vehicle_registry.py)
+        vehicle = mapping_store.current().registry.by_plate(ocr_plate)
+        if vehicle:
+            if vehicle.tire_spec:
+                results_display += f"輪胎規格: {vehicle.tire_spec.replace(chr(10), ' / ')}\n"
+            if vehicle.truck_type: # Only when the workbook has a 車種 column
+                self.truck_type_var.set(vehicle.truck_type)
+
         # Update the text display widget
-        print("--- Updating GUI Text Area ---") # Debug print added
-        print(f"Content to display:\\n{results_display}") # Debug print added
-        print("-----------------------------") # Debug print added
         self.result_text.config(state=tk.NORMAL) # Enable editing
         self.result_text.delete('1.0', tk.END) # Clear previous text
         self.result_text.insert(tk.END, results_display)
@@ -521,9 +426,8 @@ class App:
         manual_date = self.date_var.get().strip()
         manual_truck_type = self.truck_type_var.get() # Restore getting truck type
 
-        # --- Extract only the plate number from the potentially formatted input ---
-        plate_parse_match = re.match(r'([A-Z0-9-]+)(?:s*(\(\d+))?$', manual_plate_full, re.IGNORECASE)
-        manual_plate = plate_parse_match.group(1).upper() if plate_parse_match else manual_plate_full # Fallback to full string if parse fails
+        # --- Split the potentially formatted input into plate number and code ---
+        manual_plate, entry_code = parse_plate_entry(manual_plate_full)
         # -----------------------------------------------------------------------
 
         # Basic validation (optional but recommended)
@@ -539,7 +443,7 @@ class App:
         # Truck type validation not strictly needed as it has a default
 
         final_data = {
-            "plate": manual_plate,
+            "plate": format_plate_entry(manual_plate, entry_code), # Shown as PLATE(CODE) in the report
             "address": manual_address,
             "date": manual_date,
             # Type is used for template selection, not replacement
@@ -547,9 +451,8 @@ class App:
         # -------------------------------------------
 
         # --- Extract the 3-digit code directly from the full input string ---
-        code_match = re.search(r'[(（](\d+)[)）]', manual_plate_full)
-        if code_match:
-            plate_code_3digit = code_match.group(1)
+        if entry_code:
+            plate_code_3digit = entry_code
             print(f"Extracted code '{plate_code_3digit}' directly from input '{manual_plate_full}'.")
         else:
             plate_code_3digit = "XXX" # Use placeholder if no code in parentheses found in input
@@ -557,180 +460,87 @@ class App:
         # ---------------------------------------------------------------------
 
         # Create a meaningful output filename using the new format
-        # --- Generate filename based on truck type and extracted code ---
-        if manual_truck_type == "壓縮式垃圾車": # Corresponds to Yellow Template
-            output_filename = f"空白-1.2級檢查-{plate_code_3digit}垃圾車.docx"
-            template_path = YELLOW_TEMPLATE
-            print(f"選擇模板: {YELLOW_TEMPLATE}")
-        elif manual_truck_type == "資源回收車": # Corresponds to White Template
-            output_filename = f"空白-1.2級檢查-{plate_code_3digit}回收車.docx"
-            template_path = WHITE_TEMPLATE
-            print(f"選擇模板: {WHITE_TEMPLATE}")
-        else:
-            # Handle unexpected case or default - Use a fallback name
-            messagebox.showerror("錯誤", f"未知的車種選擇: {manual_truck_type}. 無法產生檔名。")
-            # Fallback filename if type is unknown
-            # output_filename = f"{manual_plate.replace('-', '')}_XXX_report.docx" # Example fallback
-            # template_path = YELLOW_TEMPLATE # Default template maybe? Or just return
-            print(f"錯誤: 未知的車種選擇: {manual_truck_type}. 無法決定模板與檔名。")
+        # --- Pick template and filename based on truck type and extracted code ---
+        try:
+            template_path = select_template(manual_truck_type, YELLOW_TEMPLATE, WHITE_TEMPLATE)
+            output_filename = build_output_filename(plate_code_3digit, manual_truck_type)
+        except ReportError as e:
+            messagebox.showerror("錯誤", str(e))
+            print(f"錯誤: {e}")
             return # Stop processing if truck type is invalid
-
+        print(f"選擇模板: {template_path}")
         print(f"輸出檔名將為: {output_filename}")
         # -------------------------------------------
 
-        # --- Generate the Word Document ---
+        # --- Stage the report; it is rendered in the background (see report_queue.py) ---
         try:
-            if not os.path.exists(template_path):
-                 messagebox.showerror("錯誤", f"模板檔案未找到: {template_path}")
-                 return
-
-            document = Document(template_path)
-
-            # --- Replace Text Placeholders using MANUAL data --- ## YOU WERE HERE
-            replacements = {
-                "{{ADDRESS}}": final_data.get("address", "N/A"),
-                "{{DATE}}": final_data.get("date", "N/A"),
-                "{{LICENSE_PLATE}}": final_data.get("plate", "N/A"),
-                # Checkboxes are now static in the template, no replacement needed
-            }
-
-            # Replace in paragraphs (Restore run-level replacement logic)
-            for p in document.paragraphs:
-                for key, value in replacements.items():
-                    if key in p.text:
-                        inline = p.runs
-                        # Replace runs containing key while preserving style
-                        for i in range(len(inline)):
-                            if key in inline[i].text:
-                                text = inline[i].text.replace(key, value)
-                                inline[i].text = text
-
-
-            # Replace in tables (Restore and enable run-level replacement logic)
-            for table in document.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for p in cell.paragraphs:
-                            for key, value in replacements.items():
-                                if key in p.text:
-                                    inline = p.runs
-                                    # Replace runs containing key while preserving style
-                                    for i in range(len(inline)):
-                                        if key in inline[i].text:
-                                            text = inline[i].text.replace(key, value)
-                                            inline[i].text = text
-            # ----------------------------------------------------------
-
-
-            # --- Replace Image Placeholders ---
-            def replace_image_placeholder(doc, placeholder, img_path, width_inches=3.0):
-                replaced = False
-                print(f"DEBUG: Searching for placeholder: '{placeholder}'")
-                for p_idx, p in enumerate(doc.paragraphs):
-                    print(f"DEBUG: Checking paragraph {p_idx} text: '{p.text}'")
-                    if placeholder in p.text:
-                        # Clear the placeholder text first
-                        # --- Use run-level replacement to preserve formatting ---
-                        inline = p.runs
-                        for i in range(len(inline)):
-                            if placeholder in inline[i].text:
-                                inline[i].text = inline[i].text.replace(placeholder, '')
-                        # --- End run-level replacement ---
-                        # p.text = p.text.replace(placeholder, '') # Basic clear (commented out)
-
-                        # Add the picture in the now empty paragraph (or where the run was)
-                        try:
-                            print(f"DEBUG: Found placeholder in paragraph {p_idx}. Attempting to add picture: {img_path}")
-                            run = p.add_run() # Add picture in a new run at the end of the paragraph
-                            run.add_picture(img_path, width=Inches(width_inches))
-                            replaced = True
-                        except FileNotFoundError:
-                            messagebox.showerror("錯誤", f"圖片檔案未找到: {img_path}")
-                            print(f"錯誤: 找不到檔案 {img_path}")
-                        except UnidentifiedImageError:
-                            messagebox.showerror("錯誤", f"無法識別圖片檔案格式或檔案已損毀: {os.path.basename(img_path)}")
-                            print(f"錯誤: 無法識別圖片 {img_path}")
-                        except Exception as e:
-                            # 顯示實際的錯誤類型和訊息
-                            error_message = f"插入圖片 '{os.path.basename(img_path)}' 時發生未預期錯誤:\n{type(e).__name__}: {e}"
-                            messagebox.showerror("錯誤", error_message)
-                            print(f"錯誤: {error_message}")
-                        # Break after first replacement in paragraphs if needed, or handle multiple occurrences
-                        # For now, assume unique placeholders
-                        if replaced: break
-                if replaced: return True # Return True if replaced in paragraphs
-
-                # Check tables if not found in paragraphs
-                print(f"DEBUG: Placeholder '{placeholder}' not found in paragraphs. Checking tables...")
-                for t_idx, table in enumerate(doc.tables):
-                     for r_idx, row in enumerate(table.rows):
-                         try: # Outer try for row.cells access
-                             for c_idx, cell in enumerate(row.cells):
-                                 for p_idx, p in enumerate(cell.paragraphs):
-                                     print(f"DEBUG: Checking table {t_idx}, row {r_idx}, cell {c_idx}, paragraph {p_idx} text: '{p.text}'")
-                                     if placeholder in p.text:
-                                         # Clear placeholder and attempt to insert image
-                                         # --- Use run-level replacement ---
-                                         inline = p.runs
-                                         for i in range(len(inline)):
-                                             if placeholder in inline[i].text:
-                                                 inline[i].text = inline[i].text.replace(placeholder, '')
-                                         # --- End run-level replacement ---
-                                         # p.text = p.text.replace(placeholder, '') # Basic clear (commented out)
-
-                                         try: # Inner try for image insertion
-                                             print(f"DEBUG: Found placeholder in table cell. Attempting to add picture: {img_path}")
-                                             run = p.add_run() # Add picture in a new run
-                                             run.add_picture(img_path, width=Inches(width_inches))
-                                             replaced = True # Set flag to True on success
-                                         except FileNotFoundError:
-                                             messagebox.showerror("錯誤", f"圖片檔案未找到: {img_path}")
-                                             print(f"錯誤: 找不到檔案 {img_path}")
-                                         except UnidentifiedImageError:
-                                             messagebox.showerror("錯誤", f"無法識別圖片檔案格式或檔案已損毀: {os.path.basename(img_path)}")
-                                             print(f"錯誤: 無法識別圖片 {img_path}")
-                                         except Exception as e:
-                                              error_message = f"插入表格圖片 '{os.path.basename(img_path)}' 時發生錯誤:\n{type(e).__name__}: {e}"
-                                              messagebox.showerror("錯誤", error_message)
-                                              print(f"錯誤: {error_message}")
-                                         # Break inner loops if image replaced
-                                         if replaced: break # break paragraph loop
-                                 if replaced: break # break cell loop
-                         except AttributeError:
-                             # Skip rows that cause AttributeError (likely malformed)
-                             print(f"Warning: Skipping a row in table {t_idx} due to unexpected structure (no 'cells' attribute).")
-                             continue # Continue to the next row
-
-                         # Break outer loop (row loop) if image replaced
-                         if replaced: break
-                     # Break table loop if image replaced
-                     if replaced: break
-
-                # Return status after checking both paragraphs and tables
-                if not replaced:
-                     print(f"Warning: Image placeholder '{placeholder}' not found anywhere in the document.")
-                return replaced
-
-
-            if img1 and not replace_image_placeholder(document, "{{IMAGE_1}}", img1, width_inches=5.0):
-                 # Warning is now printed inside the function if not found
-                 pass # print(f"Warning: Image placeholder '{{IMAGE_1}}' not found in the document.")
-            if img2 and not replace_image_placeholder(document, "{{IMAGE_2}}", img2, width_inches=5.0):
-                 # Warning is now printed inside the function if not found
-                 pass # print(f"Warning: Image placeholder '{{IMAGE_2}}' not found in the document.")
-
-
-            # Save the document
-            doc_path = os.path.join(OUTPUT_DIR, output_filename)
-            document.save(doc_path)
-            messagebox.showinfo("成功", f"報告已產生於:\n{os.path.abspath(doc_path)}")
+            report = report_queue.add(final_data, img1, img2, template_path, os.path.join(OUTPUT_DIR, output_filename),
+                                      plate=manual_plate, code=entry_code, truck_type=manual_truck_type,
+                                      ocr_seconds=self.ocr_seconds)
+        except ReportError as e:
+            messagebox.showwarning("警告", str(e))
+            return
+        print(f"Queued report #{report.number}: {output_filename}")
+        self.clear_form() # Ready for the next vehicle while this one renders
+
+    def clear_form(self):
+        """Empties the photos, fields and OCR results for the next vehicle (the truck type is kept)."""
+        if self.ocr_job:
+            self.ocr_job.cancel() # Its results must not land in the next vehicle's fields
+            self.ocr_job = None
+        for var in (self.img_path1, self.img_path2, self.plate_var, self.address_var, self.date_var):
+            var.set("")
+        for preview_label in (self.img_preview1_label, self.img_preview2_label):
+            preview_label.config(image="", text="")
+            preview_label.image = None
+        self.ocr_data = {}
+        self.ocr_seconds = None
+        self.result_text.config(state=tk.NORMAL)
+        self.result_text.delete('1.0', tk.END)
+        self.result_text.config(state=tk.DISABLED)
+
+    def on_close(self):
+        pending = report_queue.unfinished()
+        if pending and not messagebox.askyesno("確認", f"尚有 {pending} 份報告尚未產生完成，確定要離開？"):
+            return
+        report_queue.shutdown()
+        self.root.destroy()
+        summary_updater.close() # Reports confirmed since the last rebuild of 檢查總表.xlsx
+
+    def start_background_batch(self):
+        """
+        Generates the reports for a whole folder (batch_runner.run_batch) in the background. Its OCR and
+        rendering are BATCH jobs on the shared scheduler, so the operator's own photos are never held up.
+        """
+        if self.batch_thread and self.batch_thread.is_alive():
+            messagebox.showwarning("警告", "背景批次仍在進行中")
+            return
+        folder = filedialog.askdirectory(title="選擇要批次處理的照片資料夾")
+        if not folder:
+            return
 
-        except Exception as e:
-            messagebox.showerror("錯誤", f"產生 Word 文件時發生嚴重錯誤: {e}")
+        def run():
+            try:
+                stats, pairing = batch_runner.run_batch(
+                    folder, OUTPUT_DIR, lambda path: ocr_pool.run(ocr_service.run_ocr, path), get_license_plate_map(),
+                    YELLOW_TEMPLATE, WHITE_TEMPLATE,
+                    truck_type_for=lambda plate: mapping_store.current().registry.truck_type_for(plate),
+                    history=get_history(), scheduler=scheduler)
+                summary_updater.request(get_history())
+                self.batch_status = f"背景批次完成：{stats.summary()}。{pairing.summary()}"
+            except Exception as e:
+                print(f"Error: Background batch failed: {e}")
+                self.batch_status = f"背景批次失敗：{e}"
+        self.batch_thread = threading.Thread(target=run, name="background-batch", daemon=True)
+        self.batch_thread.start()
 
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    if getattr(sys, "frozen", False): # OCR worker processes are spawned from the exe itself (--ocr-processes)
+        import multiprocessing
+        multiprocessing.freeze_support()
+    ensure_directories()
     # Check if template files exist
     if not os.path.exists(YELLOW_TEMPLATE):
         with open(YELLOW_TEMPLATE, 'w') as f: # Create dummy if not exists
@@ -751,8 +561,49 @@ if __name__ == "__main__":
          print(f"Warning: Created dummy template file at {WHITE_TEMPLATE}")
 
 
+    parser = argparse.ArgumentParser(description="垃圾車記錄產生器")
+    add_watch_arguments(parser)
+    add_batch_arguments(parser)
+    add_pool_arguments(parser)
+    add_service_arguments(parser)
+    add_memory_arguments(parser)
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="顯示啟動時各模組匯入耗時，視窗出現後即結束 (預算見 startup_profile.py)")
+    args = parser.parse_args()
+    use_ocr_engines(args.ocr_engines)
+    ocr_pool.recycle = policy_from_args(args) # --recycle-after-jobs / --max-worker-mb
+    start_memory_watchdog(args)
+    if args.watch: # Headless daemon mode, no GUI
+        mapping_store.start_watching()
+        run_watch_daemon(args, OUTPUT_DIR, extract_data_from_image, YELLOW_TEMPLATE, WHITE_TEMPLATE,
+                         truck_type_for=lambda plate: mapping_store.current().registry.truck_type_for(plate),
+                         history=get_history(), ocr_workers=ocr_pool.size)
+        sys.exit(0)
+    if args.serve: # Local HTTP report service, no GUI
+        from report_service import run_from_args as run_report_service
+        mapping_store.start_watching()
+        run_report_service(args, read_photo_fields, get_license_plate_map, YELLOW_TEMPLATE, WHITE_TEMPLATE,
+                           truck_type_for=lambda plate: mapping_store.current().registry.truck_type_for(plate),
+                           history=get_history(), ocr_pool=ocr_pool)
+        sys.exit(0)
+    if args.batch: # Headless batch mode, no GUI
+        status = run_batch(args, OUTPUT_DIR, lambda path: ocr_pool.run(ocr_service.run_ocr, path), get_license_plate_map(),
+                           YELLOW_TEMPLATE, WHITE_TEMPLATE,
+                           truck_type_for=lambda plate: mapping_store.current().registry.truck_type_for(plate),
+                           history=get_history(), model_dirs=(DET_DIR, REC_DIR, CLS_DIR), ocr_workers=ocr_pool.size)
+        print(ocr_pool.describe())
+        print(WATCHDOG.describe())
+        sys.exit(status)
+
     root = tk.Tk()
     app = App(root)
+    if args.profile_startup:
+        # Measure up to the first fully drawn window, then quit
+        root.update()
+        elapsed = startup_profile.report_startup(STARTUP_T0)
+        root.destroy()
+        sys.exit(0 if elapsed <= startup_profile.STARTUP_BUDGET_SECONDS else 1)
+    root.after(200, warm_up_in_background) # Load models once the window is up
     root.mainloop() 
 
 # 打包指令
@@ -0,0 +1,312 @@
+import collections
+import functools
+import os
+import sys
+import threading
+import time
+
+# --- Memory watchdog and worker recycling for long runs ---
+# PaddleOCR inference and python-docx rendering leave a little memory behind per
+# photo; over an all-day watch folder or a batch of thousands of photos the process
+# grows until it swaps or is killed. Three parts:
+#
+#   sampling    MemoryWatchdog reads the RSS of this process (and of the OCR worker
+#               processes) every --memory-sample-seconds and logs it with its growth
+#               rate every LOG_SECONDS (psutil if installed, else /proc, the Win32 API
+#               or, as a last resort, the peak from resource.getrusage)
+#   recycling   RecyclePolicy says when a worker is replaced by a fresh one: after
+#               --recycle-after-jobs photos, or when RSS is above --max-worker-mb.
+#               An in-process engine (ocr_engine_pool.py) is dropped when it is given
+#               back and a new one is built; OCR processes (shm_transport.py) are
+#               drained and restarted. Queued work waits for the fresh worker, none
+#               of it is dropped. Every recycle is logged and counted.
+#   snapshots   with --trace-memory, tracemalloc records Python allocations and
+#               SIGUSR1 (Ctrl+Break on Windows) or GET /debug/memory prints the lines
+#               that grew most since the last snapshot. Paddle's own (C++) memory is
+#               not traced: it shows in RSS only.
+
+MB = 1024 * 1024
+DEFAULT_SAMPLE_SECONDS = 60.0
+LOG_SECONDS = 600.0  # How often the sampler logs RSS and its growth
+MAX_SAMPLES = 1440  # A day of samples at the default interval
+MIN_JOBS_BEFORE_MEMORY_RECYCLE = 10  # A fresh worker is not recycled for memory right away
+TRACE_FRAMES = 1  # Snapshots are grouped by line; more frames only cost memory and time
+SNAPSHOT_LINES = 10
+
+JOB_LIMIT = "job limit"
+MEMORY_LIMIT = "memory limit"
+
+
+@functools.lru_cache(maxsize=None)
+def _psutil():
+    try:
+        import psutil
+        return psutil
+    except ImportError:
+        return None
+
+
+def _windows_rss(pid):
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    handle = kernel32.GetCurrentProcess() if pid is None else kernel32.OpenProcess(0x1000, False, pid)
+    if not handle:
+        return None
+    try:
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if not kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize
+    finally:
+        if pid is not None:
+            kernel32.CloseHandle(handle)
+
+
+def rss_bytes(pid=None):
+    """Resident set size of a process (this one by default) in bytes; None if it cannot be read."""
+    psutil = _psutil()
+    if psutil:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if sys.platform == "win32":
+        try:
+            return _windows_rss(pid)
+        except Exception:
+            return None
+    if pid is None:
+        try:
+            import resource # Peak, not current: better than nothing on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+        except Exception:
+            pass
+    return None
+
+
+def release_memory():
+    """Collects garbage and, with glibc, hands freed heap pages back to the OS (after dropping a worker)."""
+    import gc
+    gc.collect()
+    if sys.platform.startswith("linux"):
+        try:
+            import ctypes
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except Exception:
+            pass
+
+
+class RecyclePolicy:
+    """When a worker is replaced: after `max_jobs` jobs, or once RSS exceeds `max_rss_mb` (None: no limit)."""
+
+    def __init__(self, max_jobs=None, max_rss_mb=None, min_jobs=MIN_JOBS_BEFORE_MEMORY_RECYCLE):
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.min_jobs = min_jobs
+
+    def __bool__(self):
+        return bool(self.max_jobs or self.max_rss_mb)
+
+    def reason(self, jobs, rss):
+        """JOB_LIMIT, MEMORY_LIMIT or None for a worker that has done `jobs` jobs and uses `rss` bytes."""
+        if self.max_jobs and jobs >= self.max_jobs:
+            return JOB_LIMIT
+        if self.max_rss_mb and rss and rss > self.max_rss_mb * MB and jobs >= self.min_jobs:
+            return MEMORY_LIMIT
+        return None
+
+    def describe(self):
+        limits = ([f"after {self.max_jobs} jobs"] if self.max_jobs else []) + \
+                 ([f"above {self.max_rss_mb} MB"] if self.max_rss_mb else [])
+        return "recycle workers " + " or ".join(limits) if limits else "no worker recycling"
+
+
+class MemoryWatchdog:
+    """RSS samples of this process and its OCR workers, recycle events and tracemalloc snapshots (see above)."""
+
+    def __init__(self, interval=DEFAULT_SAMPLE_SECONDS, log_seconds=LOG_SECONDS):
+        self.interval = interval
+        self.log_seconds = log_seconds
+        self._lock = threading.Lock()
+        self.samples = collections.deque(maxlen=MAX_SAMPLES)  # (time.time(), rss)
+        self.peak_rss = 0
+        self.workers = {}  # label -> {"pid", "rss", "jobs"}
+        self.recycles = collections.Counter()  # reason -> count
+        self.events = collections.deque(maxlen=100)  # Recent recycles, newest last
+        self._snapshot = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="memory-watchdog", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        last_log = time.monotonic()
+        while not self._stop.wait(self.interval):
+            self.sample()
+            if time.monotonic() - last_log >= self.log_seconds:
+                last_log = time.monotonic()
+                print(self.describe())
+
+    def sample(self):
+        """Reads RSS now (this process and the known worker processes); returns this process's."""
+        rss = rss_bytes()
+        with self._lock:
+            if rss is not None:
+                self.samples.append((time.time(), rss))
+                self.peak_rss = max(self.peak_rss, rss)
+            workers = [(label, worker["pid"]) for label, worker in self.workers.items() if worker.get("pid")]
+        for label, pid in workers:
+            worker_rss = rss_bytes(pid)
+            with self._lock:
+                if label in self.workers and worker_rss is not None:
+                    self.workers[label]["rss"] = worker_rss
+        return rss
+
+    def update_worker(self, label, pid=None, rss=None, jobs=None):
+        """What a worker reported about itself (e.g. an OCR process with every result)."""
+        with self._lock:
+            worker = self.workers.setdefault(label, {"pid": pid, "rss": None, "jobs": 0})
+            worker.update((key, value) for key, value in (("pid", pid), ("rss", rss), ("jobs", jobs))
+                          if value is not None)
+
+    def forget_worker(self, label):
+        with self._lock:
+            self.workers.pop(label, None)
+
+    def recycled(self, worker, reason, jobs, rss_before, rss_after=None):
+        """Records and logs a recycled worker; a memory-limit recycle also takes a snapshot when tracing."""
+        event = {"time": time.time(), "worker": worker, "reason": reason, "jobs": jobs,
+                 "rss_before": rss_before, "rss_after": rss_after}
+        with self._lock:
+            self.recycles[reason] += 1
+            self.events.append(event)
+        change = _format_mb(rss_before) + (f" -> {_format_mb(rss_after)}" if rss_after is not None else "")
+        print(f"Recycled {worker} ({reason}) after {jobs} jobs, RSS {change}")
+        if reason == MEMORY_LIMIT and tracing():
+            self.snapshot()
+
+    def growth_per_hour(self):
+        """RSS growth in bytes per hour over the samples kept; None before there are two."""
+        with self._lock:
+            if len(self.samples) < 2:
+                return None
+            (first_time, first_rss), (last_time, last_rss) = self.samples[0], self.samples[-1]
+        return (last_rss - first_rss) * 3600 / (last_time - first_time) if last_time > first_time else None
+
+    def snapshot(self, limit=SNAPSHOT_LINES):
+        """Top Python allocation sites (growth since the previous snapshot, if any) as text; also printed."""
+        import tracemalloc
+        if not tracing():
+            return "tracemalloc is off (start with --trace-memory)"
+        snapshot = tracemalloc.take_snapshot() # Comparing takes seconds with a few 100,000 live objects
+        with self._lock:
+            previous, self._snapshot = self._snapshot, snapshot
+        stats = snapshot.compare_to(previous, "lineno") if previous else snapshot.statistics("lineno")
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"tracemalloc: {current / MB:.1f} MB traced (peak {peak / MB:.1f} MB); "
+                 f"top {limit} {'by growth since the last snapshot' if previous else 'allocation sites'}:"]
+        lines += [f"  {stat}" for stat in stats[:limit]]
+        text = "\n".join(lines)
+        print(text)
+        return text
+
+    def install_snapshot_signal(self):
+        """SIGUSR1 (Ctrl+Break on Windows) prints a snapshot. Only from the main thread; False if unavailable."""
+        import signal
+        signum = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+        if signum is None:
+            return False
+        try:
+            # Off the signal handler: the snapshot takes a while and allocates
+            signal.signal(signum, lambda *_: threading.Thread(target=self.snapshot, daemon=True).start())
+        except ValueError:
+            return False
+        return True
+
+    def describe(self):
+        rss = self.samples[-1][1] if self.samples else rss_bytes()
+        growth = self.growth_per_hour()
+        text = f"Memory: RSS {_format_mb(rss)} (peak {_format_mb(max(self.peak_rss, rss or 0))}"
+        text += f", {growth / MB:+.0f} MB/h)" if growth is not None else ")"
+        with self._lock:
+            workers = [(label, worker) for label, worker in sorted(self.workers.items()) if worker.get("rss")]
+            recycles = ", ".join(f"{count} {reason}" for reason, count in sorted(self.recycles.items()))
+        if workers:
+            text += "; workers " + ", ".join(f"{label} {_format_mb(worker['rss'])}/{worker['jobs']} jobs"
+                                            for label, worker in workers)
+        return text + f"; {sum(self.recycles.values())} recycled" + (f" ({recycles})" if recycles else "")
+
+    def metrics_lines(self):
+        """Prometheus text lines for the report service's /metrics."""
+        rss = rss_bytes()
+        lines = ["# TYPE process_resident_memory_bytes gauge", f"process_resident_memory_bytes {rss or 0}",
+                 "# TYPE ocr_worker_recycles_total counter"]
+        with self._lock:
+            for reason in (JOB_LIMIT, MEMORY_LIMIT):
+                lines.append(f'ocr_worker_recycles_total{{reason="{reason}"}} {self.recycles[reason]}')
+        return lines
+
+
+def _format_mb(value):
+    return f"{value / MB:.0f} MB" if value is not None else "?"
+
+
+def tracing():
+    import tracemalloc
+    return tracemalloc.is_tracing()
+
+
+WATCHDOG = MemoryWatchdog()
+
+
+def add_memory_arguments(parser):
+    """Command line flags for the watchdog and worker recycling, shared by main.py and main-pack.py."""
+    parser.add_argument("--recycle-after-jobs", type=int, default=0, metavar="N",
+                        help="每個 OCR 引擎（或 OCR 子行程）處理 N 張照片後換新，釋放累積的記憶體（0 為不換）")
+    parser.add_argument("--max-worker-mb", type=int, default=0, metavar="MB",
+                        help="記憶體（RSS）超過 MB 時換新 OCR 引擎；同一行程內的引擎以整個行程計，子行程各自計算（0 為不限）")
+    parser.add_argument("--memory-sample-seconds", type=float, default=DEFAULT_SAMPLE_SECONDS,
+                        help="記錄記憶體用量的間隔秒數（每 10 分鐘輸出一次）")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="啟用 tracemalloc：送出 SIGUSR1（Windows 按 Ctrl+Break）即列出記憶體成長最多的程式位置")
+
+
+def policy_from_args(args):
+    return RecyclePolicy(args.recycle_after_jobs or None, args.max_worker_mb or None)
+
+
+def start_from_args(args, watchdog=WATCHDOG):
+    """Starts sampling (and tracemalloc with --trace-memory). Call from the main thread, for the signal."""
+    watchdog.interval = args.memory_sample_seconds
+    if args.trace_memory:
+        import tracemalloc
+        tracemalloc.start(TRACE_FRAMES)
+        if not watchdog.install_snapshot_signal():
+            print("Warning: No signal for tracemalloc snapshots on this platform.")
+    watchdog.sample()
+    return watchdog.start()
@@ -0,0 +1,199 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Pool of OCR engines shared by everything in one process ---
+# A PaddleOCR object must not be used by two threads at once. Instead of one
+# global engine (everything serialized behind it, or worse, used concurrently)
+# the GUI's scheduler, the watch folder and the in-process batch check an engine
+# out of this pool and give it back when done:
+#
+#   with ocr_pool.checkout() as engine:
+#       lines = run_ocr(engine, path)
+#
+# Engines are built on first demand, up to `size` (each costs a model load and a
+# few hundred MB), and reused afterwards. A checkout waits at most `timeout`
+# seconds for a free engine, then raises EnginePoolTimeout. The counters behind
+# describe() show whether callers queue for engines (raise --ocr-engines) or
+# engines sit idle.
+#
+# With a RecyclePolicy (memory_watchdog.py) an engine that has served its number of
+# jobs, or is given back while the process is above its memory ceiling, is dropped
+# and a fresh one is built in the background; callers waiting for an engine get the
+# fresh one.
+
+DEFAULT_CHECKOUT_TIMEOUT = 120.0  # Seconds; a full-frame OCR of a large photo takes a few
+
+
+class EnginePoolTimeout(Exception):
+    """Raised when no engine became free within the checkout timeout."""
+
+
+class OcrEnginePool:
+    """Up to `size` engines made by `factory()`, checked out by one caller at a time."""
+
+    def __init__(self, factory, size=1, timeout=DEFAULT_CHECKOUT_TIMEOUT, recycle=None, watchdog=None):
+        self.factory = factory
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.recycle = recycle # memory_watchdog.RecyclePolicy, or None
+        self.watchdog = watchdog # Where recycles are reported; memory_watchdog.WATCHDOG by default
+        self._jobs = {} # id(engine) -> jobs it has served
+        self._recycling = 0 # Replacements being built
+        self.recycled = 0
+        self._idle = queue.LifoQueue() # Most recently used first: its memory is warm
+        self._lock = threading.Lock()
+        self._created = 0
+        self._busy = 0
+        self.checkouts = 0
+        self.waited = 0 # Checkouts that found no engine free
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.timeouts = 0
+
+    def resize(self, size):
+        """Changes how many engines may be built. Engines already built are kept."""
+        with self._lock:
+            self.size = max(1, size)
+
+    def prefill(self, count=1):
+        """Builds engines up front (e.g. during start-up) so the first callers do not wait for a model load."""
+        for _ in range(count):
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._build()
+
+    def _build(self):
+        """Builds one engine for a slot already counted in _created and adds it to the idle ones."""
+        try:
+            engine = self.factory()
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+        self._idle.put(engine)
+
+    def _acquire(self, timeout):
+        try:
+            return self._idle.get_nowait(), False
+        except queue.Empty:
+            pass
+        with self._lock:
+            build = self._created < self.size
+            if build:
+                self._created += 1
+        if build:
+            self._build()
+        try:
+            return self._idle.get(timeout=timeout), True
+        except queue.Empty:
+            raise EnginePoolTimeout(f"No OCR engine became free within {timeout:g}s "
+                                    f"({self._busy} in use)") from None
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Yields an engine for the caller's exclusive use and returns it to the pool afterwards."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        try:
+            engine, waited = self._acquire(timeout)
+        except EnginePoolTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise
+        acquired = time.perf_counter()
+        with self._lock:
+            self.checkouts += 1
+            self._busy += 1
+            if waited:
+                self.waited += 1
+                self.wait_seconds += acquired - start
+                self.max_wait_seconds = max(self.max_wait_seconds, acquired - start)
+        try:
+            yield engine
+        finally:
+            with self._lock:
+                self._busy -= 1
+                self.busy_seconds += time.perf_counter() - acquired
+                jobs = self._jobs[id(engine)] = self._jobs.get(id(engine), 0) + 1
+            if not self._recycle_if_due(engine, jobs):
+                self._idle.put(engine)
+            engine = None # A recycled engine's memory goes with the last reference
+
+    def _recycle_if_due(self, engine, jobs):
+        """Drops `engine` and builds its replacement in the background if the policy says so; True if dropped."""
+        if not self.recycle:
+            return False
+        from memory_watchdog import MEMORY_LIMIT, rss_bytes
+        rss = rss_bytes() if self.recycle.max_rss_mb else None
+        reason = self.recycle.reason(jobs, rss)
+        with self._lock:
+            # All engines share the process's memory: one replacement at a time is enough to see if it helps
+            if not reason or (reason == MEMORY_LIMIT and self._recycling):
+                return False
+            del self._jobs[id(engine)]
+            self._recycling += 1
+            self.recycled += 1
+        threading.Thread(target=self._replace, args=(reason, jobs, rss), name="ocr-engine-recycle",
+                         daemon=True).start()
+        return True
+
+    def _replace(self, reason, jobs, rss_before):
+        from memory_watchdog import WATCHDOG, release_memory, rss_bytes
+        rss_before = rss_before if rss_before is not None else rss_bytes()
+        release_memory()
+        try:
+            self._build() # The dropped engine's slot is still counted in _created
+        except Exception as e:
+            print(f"Warning: Could not rebuild a recycled OCR engine: {e}")
+        finally:
+            with self._lock:
+                self._recycling -= 1
+        (self.watchdog or WATCHDOG).recycled("OCR engine", reason, jobs, rss_before, rss_bytes())
+
+    def run(self, fn, *args, **kwargs):
+        """fn(engine, *args, **kwargs) with a checked-out engine, e.g. pool.run(run_ocr, path)."""
+        with self.checkout() as engine:
+            return fn(engine, *args, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size, "created": self._created, "busy": self._busy,
+                "checkouts": self.checkouts, "waited": self.waited, "timeouts": self.timeouts,
+                "wait_seconds": self.wait_seconds, "max_wait_seconds": self.max_wait_seconds,
+                "busy_seconds": self.busy_seconds, "recycled": self.recycled,
+            }
+
+    def describe(self):
+        s = self.stats()
+        mean_hold = s["busy_seconds"] / s["checkouts"] if s["checkouts"] else 0.0
+        return (f"OCR engines: {s['created']}/{s['size']} built, {s['busy']} in use; {s['checkouts']} checkouts "
+                f"(mean {mean_hold:.2f}s), {s['waited']} waited (total {s['wait_seconds']:.1f}s, "
+                f"max {s['max_wait_seconds']:.1f}s), {s['timeouts']} timed out, {s['recycled']} recycled")
+
+
+def create_engine_pool(det_model_dir, rec_model_dir, cls_model_dir, size=1):
+    """
+    A pool of ocr_service.create_ocr_engine engines. With more than one engine the cores
+    are split between them (thread_budget.py) instead of each starting Paddle's 10 threads.
+    """
+    def factory():
+        from ocr_service import create_ocr_engine
+        cpu_threads = None
+        if pool.size > 1:
+            from thread_budget import ThreadBudget
+            cpu_threads = ThreadBudget(pool.size, reserve=1).threads_per_worker
+        return create_ocr_engine(det_model_dir, rec_model_dir, cls_model_dir, cpu_threads=cpu_threads)
+    pool = OcrEnginePool(factory, size)
+    return pool
+
+
+def add_pool_arguments(parser):
+    """Command line flags for the engine pool, shared by main.py and main-pack.py."""
+    parser.add_argument("--ocr-engines", type=int, default=1,
+                        help="同一行程內的 OCR 引擎數，GUI、監看與批次模式共用（每個引擎需數百 MB 記憶體）")
@@ -0,0 +1,244 @@
+import os
+import json
+from extraction_rules import DEFAULT_MATCHER
+
+# --- OCR helpers shared by the GUI and the headless modes ---
+# Heavy imports (paddleocr) happen inside the functions so that importing this
+# module stays cheap.
+#
+# Field dicts carry a "sources" entry: which source supplied each field.
+#   exif        the date, from the photo's EXIF capture time (no OCR needed)
+#   ocr         full-frame OCR
+#   ocr-region  OCR of a proposed plate region only (plate_locator.py)
+#   ocr-enhanced  OCR of an enhanced copy, after a weak first read (image_enhance.py)
+#   mapping     the code, looked up from the plate in the mapping workbook
+# Merged pair fields record (photo number, source) per field.
+
+SOURCE_LABELS = {"exif": "EXIF", "ocr": "OCR", "ocr-region": "車牌區域 OCR", "ocr-enhanced": "增強後 OCR",
+                 "mapping": "對照表"}
+FIELD_LABELS = {"date": "日期", "address": "地址", "plate": "車牌", "code": "車編"}
+
+
+def create_ocr_engine(det_model_dir, rec_model_dir, cls_model_dir, cpu_threads=None):
+    """
+    Builds a PaddleOCR engine with the settings used throughout the app.
+    `cpu_threads` caps its math-library threads (PaddleOCR's default is 10; see thread_budget.py).
+    """
+    from paddleocr import PaddleOCR
+    print("Initializing PaddleOCR... This might take a moment on first run.")
+    options = {"cpu_threads": cpu_threads} if cpu_threads else {}
+    engine = PaddleOCR(
+        use_angle_cls=True,
+        lang='ch',
+        use_gpu=False,
+        det_model_dir=det_model_dir,
+        rec_model_dir=rec_model_dir,
+        cls_model_dir=cls_model_dir,
+        **options
+    )
+    print("PaddleOCR Initialized.")
+    return engine
+
+
+def run_ocr(engine, image):
+    """Runs OCR on an image path (or encoded bytes / array) and returns a list of (text, confidence) lines."""
+    result = engine.ocr(image, cls=True)
+    ocr_lines = []
+    if result and result[0]: # Check if result is valid and contains data
+        for line_info in result[0]:
+            # line_info is like [[[coords]], ('text', confidence)]
+            ocr_lines.append((line_info[1][0], line_info[1][1]))
+    return ocr_lines
+
+
+def lookup_code(plate_map, plate):
+    """Looks up the vehicle code for a plate, with and without hyphen. Returns None if unknown."""
+    if not plate or not plate_map:
+        return None
+    return plate_map.get(plate) or plate_map.get(plate.replace('-', ''))
+
+
+def extract_fields(ocr_lines, plate_map):
+    """Turns OCR lines into the address/date/plate/code dict used by the GUI and report generation."""
+    # Plates that exist in the mapping are ranked above look-alikes
+    def mapping_boost(field, value):
+        if field == "plate" and lookup_code(plate_map, value):
+            return 5
+        return 0
+
+    extracted = DEFAULT_MATCHER.extract(ocr_lines, boost=mapping_boost)
+    plate_str = extracted.best("plate")
+    fields = {
+        "address": extracted.best("address"),
+        "date": extracted.best("date"),
+        "plate": plate_str,
+        "code": lookup_code(plate_map, plate_str),
+    }
+    fields["sources"] = {name: "ocr" for name in ("address", "date", "plate") if fields[name]}
+    if fields["code"]:
+        fields["sources"]["code"] = "mapping"
+    return fields
+
+
+def extract_data_from_image(engine, image_path, plate_map, wanted=()):
+    """
+    OCRs one photo and extracts its fields. On failure returns {"error": message}.
+    A weak read (one of the `wanted` fields missing, or low confidence) is retried on
+    enhanced copies of the photo (image_enhance.py).
+    """
+    try:
+        ocr_lines = run_ocr(engine, image_path)
+        from image_enhance import enhance_and_retry
+        return enhance_and_retry(engine, image_path, plate_map, extract_fields(ocr_lines, plate_map), ocr_lines, wanted)
+    except FileNotFoundError:
+        return {"error": "圖片檔案未找到"}
+    except Exception as e:
+        print(f"OCR Error: {e}")
+        return {"error": f"OCR 處理失敗: {e}"}
+
+
+def extract_plate_from_image(engine, image_path, plate_map):
+    """
+    Like extract_data_from_image, for a photo that is only needed for its plate (photo two):
+    recognises the regions plate_locator.py proposes and falls back to full-frame OCR when
+    none of them yields a known plate. Address and date are empty on the fast path.
+    """
+    try:
+        from plate_locator import read_plate
+        fields, tried = read_plate(engine, image_path, plate_map)
+    except FileNotFoundError:
+        return {"error": "圖片檔案未找到"}
+    except Exception as e: # The fast path is optional; full-frame OCR still works without it
+        print(f"Warning: Plate localisation failed for {os.path.basename(image_path)}: {e}")
+        fields, tried = None, 0
+    if fields:
+        print(f"--- Plate read from region {tried} of {os.path.basename(image_path)}: {fields['plate']} ---")
+        fields["sources"]["plate"] = "ocr-region"
+        return fields
+    return extract_data_from_image(engine, image_path, plate_map, wanted=("plate",))
+
+
+def read_photo_fields(engine, image_path, plate_map, known=()):
+    """
+    Fields of one photo, cheapest source first. The date comes from the EXIF capture time when
+    the photo has one (a header read, no pixels decoded); OCR then only has to find what is still
+    missing: when the fields in `known` plus the EXIF date cover address and date, only the plate
+    regions are recognised. An OCR error dict still carries the EXIF date.
+    """
+    from exif_metadata import format_roc_date, read_capture_time
+    taken = read_capture_time(image_path) if os.path.exists(image_path) else None
+    missing = {"address", "date"} - set(known) - ({"date"} if taken else set())
+    if missing:
+        fields = extract_data_from_image(engine, image_path, plate_map, wanted=sorted(missing))
+    else:
+        fields = extract_plate_from_image(engine, image_path, plate_map)
+    if taken:
+        fields["date"] = format_roc_date(taken)
+        fields.setdefault("sources", {})["date"] = "exif"
+    return fields
+
+
+def describe_sources(sources):
+    """{"date": "exif", ...} or {"date": (1, "exif"), ...} -> '日期: 照片一 EXIF, ...' for display."""
+    parts = []
+    for name, label in FIELD_LABELS.items():
+        source = sources.get(name)
+        if not source:
+            continue
+        photo, source = source if isinstance(source, tuple) else (None, source)
+        prefix = f"照片{'一二'[photo - 1]} " if photo else ""
+        parts.append(f"{label}: {prefix}{SOURCE_LABELS.get(source, source)}")
+    return ", ".join(parts)
+
+
+def merge_pair_fields(data1, data2, capture_times=(None, None)):
+    """
+    Combines the OCR results of photo one (address/date) and photo two (plate/type).
+    Each field is taken from its usual photo first and from the other photo as a fallback.
+    With the photos' EXIF `capture_times`, the date comes from EXIF and OCR is the fallback.
+    """
+    from exif_metadata import format_roc_date
+    data1 = data1 if data1 and "error" not in data1 else {}
+    data2 = data2 if data2 and "error" not in data2 else {}
+    plate_source = data2 if data2.get("plate") else data1
+    fields = {
+        "address": data1.get("address") or data2.get("address") or "",
+        "date": data1.get("date") or data2.get("date") or "",
+        "plate": plate_source.get("plate") or "",
+        "code": plate_source.get("code") or data1.get("code") or data2.get("code"),
+    }
+    plate_photo = 2 if plate_source is data2 else 1
+    sources = {}
+    for name, photos in (("address", (1, 2)), ("date", (1, 2)), ("plate", (plate_photo,)),
+                         ("code", (plate_photo, 1, 2))):
+        for photo in photos:
+            data = data1 if photo == 1 else data2
+            if fields[name] and data.get(name) == fields[name]:
+                sources[name] = (photo, data.get("sources", {}).get(name, "ocr"))
+                break
+    for photo, taken in enumerate(capture_times, start=1):
+        if taken:
+            fields["date"] = format_roc_date(taken)
+            sources["date"] = (photo, "exif")
+            break
+    fields["sources"] = sources
+    return fields
+
+
+# --- OCR cache for batch reruns ---
+# Raw OCR lines keyed by image content hash. Field extraction is cheap and is
+# always redone from the lines, so mapping or rule changes still apply on rerun.
+
+OCR_CACHE_FILENAME = "ocr_cache.json"
+OCR_CACHE_VERSION = 1 # Bump when OCR settings/models change
+
+
+class OcrCache:
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._entries = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored.get("version") == OCR_CACHE_VERSION:
+                self._entries = stored.get("entries", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable OCR cache {path}: {e}")
+
+    def __contains__(self, image_hash):
+        return image_hash in self._entries
+
+    def get(self, image_hash):
+        """Cached OCR lines, or None. Counts hits and misses."""
+        if image_hash and image_hash in self._entries:
+            self.hits += 1
+            return [tuple(line) for line in self._entries[image_hash]]
+        self.misses += 1
+        return None
+
+    def put(self, image_hash, ocr_lines):
+        if image_hash:
+            self._entries[image_hash] = [[text, float(conf)] for text, conf in ocr_lines] # conf may be a numpy float
+            self._dirty = True
+
+    def lines(self, image_hash, run):
+        """Cached OCR lines for an image hash; calls `run()` and stores the result on a miss."""
+        ocr_lines = self.get(image_hash)
+        if ocr_lines is None:
+            ocr_lines = run()
+            self.put(image_hash, ocr_lines)
+        return ocr_lines
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": OCR_CACHE_VERSION, "entries": self._entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path) # Never leave a half-written cache behind
+        self._dirty = False
@@ -0,0 +1,112 @@
+import os
+import io
+import csv
+import hashlib
+import threading
+import zipfile
+from datetime import datetime
+
+from report_builder import read_fingerprint, write_file_atomically
+
+# --- Output sinks for batch mode ---
+# Where the pipeline's write stage puts finished reports (batch_pipeline.py):
+#   DirectorySink  one .docx per report in the output folder (the default; unchanged
+#                  reports are detected from their fingerprint and skipped)
+#   ZipSink        every report streamed straight into one zip archive, plus a manifest
+#                  CSV, for the per-cycle delivery to the bureau. No report touches the
+#                  disk on its own, so disk use is the archive itself, however big the batch.
+# The pipeline opens the sink, asks it for a target path per report (also what the history
+# records), hands it the rendered bytes, and closes it at the end of the batch - or aborts it
+# when the batch is interrupted.
+
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_HEADER = ["檔名", "車牌", "車編", "車種", "地址", "檢查日期", "照片一", "照片二", "位元組", "SHA-256"]
+
+
+class ArchiveError(Exception):
+    """The zip archive could not be written; it is incomplete, so the batch stops."""
+
+
+class DirectorySink:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def open(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def target(self, filename):
+        return os.path.join(self.output_dir, filename)
+
+    def is_current(self, path, fingerprint):
+        """Whether the report at `path` was already built from the same inputs."""
+        return read_fingerprint(path) == fingerprint
+
+    def write(self, path, data, row):
+        write_file_atomically(path, data)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class ZipSink:
+    """
+    Streams reports into `zip_path`. The archive is built as zip_path + ".tmp" and only
+    renamed into place by close(), so an interrupted batch never leaves a truncated archive.
+    """
+
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+        self.tmp_path = zip_path + ".tmp"
+        self.rows = []  # Manifest rows; a few hundred bytes per report
+        self._lock = threading.Lock()
+        self._zip = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.zip_path)), exist_ok=True)
+        self._zip = zipfile.ZipFile(self.tmp_path, "w") # Replaces what an interrupted run left
+
+    def target(self, filename):
+        return os.path.join(self.zip_path, filename)
+
+    def is_current(self, path, fingerprint):
+        return False # Every report goes into the new archive
+
+    def write(self, path, data, row):
+        name = os.path.basename(path)
+        info = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+        # A docx is already a deflated zip; storing it costs no space and no CPU
+        info.compress_type = zipfile.ZIP_STORED
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            try:
+                self._zip.writestr(info, data)
+            except OSError as e:  # A half-written entry leaves the archive unusable
+                raise ArchiveError(f"Could not write {name} to {self.zip_path}: {e}") from e
+            self.rows.append(list(row) + [len(data), digest])
+
+    def close(self):
+        """Adds the manifest and moves the finished archive into place."""
+        text = io.StringIO(newline="")
+        writer = csv.writer(text)
+        writer.writerow(MANIFEST_HEADER)
+        writer.writerows(sorted(self.rows))
+        with self._lock:
+            # BOM so Excel shows Chinese correctly
+            self._zip.writestr(MANIFEST_NAME, "\ufeff" + text.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+            self._zip.close()
+        with open(self.tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(self.tmp_path, self.zip_path)
+        print(f"封存檔已產生: {self.zip_path} ({len(self.rows)} 份報告, {os.path.getsize(self.zip_path) / 1e6:.1f} MB)")
+
+    def abort(self):
+        with self._lock:
+            if self._zip:
+                self._zip.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
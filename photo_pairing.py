@@ -0,0 +1,232 @@
+import os
+import re
+import sys
+import csv
+import argparse
+from collections import defaultdict
+
+# --- Photo pairing for bulk runs ---
+# Every report needs photo one (address/date) and photo two (plate/type).
+# Given an unordered set of photos, pairs are found in three passes, each
+# O(n) or O(n log n):
+#   1. filename conventions (202.jpg / 202-.jpg, 202_1 / 202_2, NNN-CODE.jpg)
+#   2. OCR: a photo one is matched with the nearest-in-time photo two that shows a plate
+#   3. capture-time proximity: photos sorted by EXIF time, split into bursts
+#      where consecutive shots are at most `window_seconds` apart
+# Anything that cannot be paired unambiguously is listed for review.
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tiff"}
+DEFAULT_WINDOW_SECONDS = 120
+
+# Trailing markers that distinguish the two photos of one vehicle: 202.jpg / 202-.jpg, 202_1.jpg / 202_2.jpg
+_PAIR_SUFFIX_RE = re.compile(r"(?:[-_ ]\(?[12]\)?|\([12]\)|-)$")
+_NUMBER_RE = re.compile(r"\d+")
+_NUMERIC_NAME_RE = re.compile(r"^[\d\-_ ]+$")
+
+
+def pair_key(path):
+    """Key shared by both photos of a vehicle, derived from the filename."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return _PAIR_SUFFIX_RE.sub("", stem) or stem
+
+
+def filename_key(path, known_codes=None):
+    """
+    Grouping key from the filename. Names made only of numbers (202.jpg, 202-.jpg,
+    206-267.jpg) are keyed by their last number, the vehicle code, so 267.jpg pairs
+    with 206-267.jpg. With `known_codes`, any number in the name that is a known code is used.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    numbers = _NUMBER_RE.findall(stem)
+    if known_codes:
+        for number in reversed(numbers):
+            if number in known_codes:
+                return f"code:{number}"
+    elif numbers and _NUMERIC_NAME_RE.match(stem):
+        # Last number once the photo one/two marker is gone: 202_2.jpg is vehicle 202, not "2"
+        return f"code:{_NUMBER_RE.findall(pair_key(path))[-1]}"
+    return pair_key(path)
+
+
+class PhotoInfo:
+    """What the pairing stage knows about one photo."""
+    __slots__ = ("path", "taken", "key", "role", "plate", "date")
+
+    def __init__(self, path, taken=None, key=None, ocr=None):
+        self.path = path
+        self.taken = taken  # datetime or None
+        self.key = key
+        ocr = ocr if ocr and "error" not in ocr else {}
+        self.plate = ocr.get("plate") or ""
+        self.date = ocr.get("date") or ""
+        # Photo two shows the plate; photo one shows address/date
+        if self.plate:
+            self.role = 2
+        elif ocr.get("address") or self.date:
+            self.role = 1
+        else:
+            self.role = None
+
+    def timestamp(self):
+        return self.taken.timestamp() if self.taken else None
+
+
+class PhotoPair:
+    __slots__ = ("photo1", "photo2", "method")
+
+    def __init__(self, photo1, photo2, method):
+        self.photo1 = photo1
+        self.photo2 = photo2
+        self.method = method  # "filename", "ocr" or "time"
+
+
+class PairingResult:
+    def __init__(self):
+        self.pairs = []
+        self.ambiguous = []  # (list of paths, reason)
+        self.unpaired = []   # paths
+
+    def summary(self):
+        return f"{len(self.pairs)} pairs, {len(self.ambiguous)} ambiguous groups, {len(self.unpaired)} unpaired photos"
+
+
+def _order(a, b):
+    """(photo one, photo two) by role, then capture time, then name."""
+    if a.role == 2 and b.role != 2 or b.role == 1 and a.role != 1:
+        return b, a
+    if a.role == b.role and a.taken and b.taken and b.taken < a.taken:
+        return b, a
+    if a.role == b.role and not (a.taken and b.taken) and b.path < a.path:
+        return b, a
+    return a, b
+
+
+def _dates_conflict(a, b):
+    return bool(a.date and b.date and a.date.replace(" ", "") != b.date.replace(" ", ""))
+
+
+def _pair_by_filename(photos, result):
+    groups = defaultdict(list)
+    for photo in photos:
+        groups[photo.key].append(photo)
+    rest = []
+    for key, members in groups.items():
+        if len(members) == 2 and not _dates_conflict(*members):
+            result.pairs.append(PhotoPair(*_order(*members), "filename"))
+        elif len(members) > 2 and key.startswith("code:"):
+            # Same vehicle photographed several times: needs a human to pick
+            result.ambiguous.append(([p.path for p in members], f"{len(members)} photos share {key}"))
+        else:
+            rest.extend(members)
+    return rest
+
+
+def _pair_by_ocr(photos, window_seconds):
+    """Each photo two (plate found) takes the closest photo one within the window."""
+    ones = sorted((p for p in photos if p.role == 1 and p.taken), key=PhotoInfo.timestamp)
+    twos = sorted((p for p in photos if p.role == 2 and p.taken), key=PhotoInfo.timestamp)
+    pairs, used = [], set()
+    i = 0
+    # Merge-style sweep over both sorted lists
+    for two in twos:
+        t = two.timestamp()
+        while i < len(ones) and (id(ones[i]) in used or ones[i].timestamp() < t - window_seconds):
+            i += 1
+        best = None
+        j = i
+        while j < len(ones) and ones[j].timestamp() <= t + window_seconds:
+            cand = ones[j]
+            if id(cand) not in used and not _dates_conflict(cand, two):
+                if best is None or abs(cand.timestamp() - t) < abs(best.timestamp() - t):
+                    best = cand
+            j += 1
+        if best is not None:
+            used.add(id(best))
+            used.add(id(two))
+            pairs.append(PhotoPair(best, two, "ocr"))
+    rest = [p for p in photos if id(p) not in used]
+    return pairs, rest
+
+
+def _pair_by_time(photos, window_seconds, result):
+    """Splits time-sorted photos into bursts; bursts of exactly two are pairs."""
+    timed = sorted((p for p in photos if p.taken), key=PhotoInfo.timestamp)
+    result.unpaired.extend(p.path for p in photos if not p.taken)
+    burst = []
+    for photo in timed + [None]:
+        if photo is not None and burst and photo.timestamp() - burst[-1].timestamp() <= window_seconds:
+            burst.append(photo)
+            continue
+        if len(burst) == 2 and not _dates_conflict(*burst):
+            result.pairs.append(PhotoPair(*_order(*burst), "time"))
+        elif len(burst) == 1:
+            result.unpaired.append(burst[0].path)
+        elif burst:
+            paths = [p.path for p in burst]
+            reason = f"{len(burst)} photos within {window_seconds}s of each other"
+            if len(burst) == 2:
+                reason = "OCR dates differ"
+            result.ambiguous.append((paths, reason))
+        burst = [photo] if photo is not None else []
+
+
+def pair_photos(paths, ocr_results=None, known_codes=None, window_seconds=DEFAULT_WINDOW_SECONDS,
+                read_time=None):
+    """
+    Groups photos into report pairs. `ocr_results` maps path -> extract_data_from_image dict
+    (optional), `known_codes` is a set of vehicle codes for the NNN-CODE filename convention.
+    """
+    if read_time is None:
+        from exif_metadata import read_capture_time as read_time
+    ocr_results = ocr_results or {}
+    photos = [PhotoInfo(path, read_time(path), filename_key(path, known_codes), ocr_results.get(path))
+              for path in paths]
+    result = PairingResult()
+    rest = _pair_by_filename(photos, result)
+    ocr_pairs, rest = _pair_by_ocr(rest, window_seconds)
+    result.pairs.extend(ocr_pairs)
+    _pair_by_time(rest, window_seconds, result)
+    return result
+
+
+def list_photos(directory):
+    return sorted(
+        entry.path for entry in os.scandir(directory)
+        if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+def write_pairs_csv(result, path):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:  # BOM so Excel shows Chinese correctly
+        writer = csv.writer(f)
+        writer.writerow(["狀態", "照片一", "照片二", "方式/原因"])
+        for pair in result.pairs:
+            writer.writerow(["配對", pair.photo1.path, pair.photo2.path, pair.method])
+        for paths, reason in result.ambiguous:
+            writer.writerow(["待確認", " | ".join(paths), "", reason])
+        for path in result.unpaired:
+            writer.writerow(["未配對", path, "", ""])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="將照片自動配對成報告所需的照片一/照片二")
+    parser.add_argument("directory")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW_SECONDS, help="同一車輛兩張照片的最大拍攝間隔（秒）")
+    parser.add_argument("--csv", help="輸出配對結果 CSV")
+    args = parser.parse_args(argv)
+
+    result = pair_photos(list_photos(args.directory), window_seconds=args.window)
+    for pair in result.pairs:
+        print(f"[{pair.method}] {os.path.basename(pair.photo1.path)} + {os.path.basename(pair.photo2.path)}")
+    for paths, reason in result.ambiguous:
+        print(f"[待確認] {', '.join(os.path.basename(p) for p in paths)} ({reason})")
+    for path in result.unpaired:
+        print(f"[未配對] {os.path.basename(path)}")
+    print(result.summary())
+    if args.csv:
+        write_pairs_csv(result, args.csv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
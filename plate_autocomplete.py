@@ -0,0 +1,148 @@
+import bisect
+
+from extraction_rules import format_plate_entry, parse_plate_entry
+from vehicle_registry import normalize_plate
+
+# --- Plate autocomplete for the 車牌號碼 entry ---
+# When OCR misses the plate the operator types it, and used to type the (code) from
+# memory too. PlateIndex keeps the mapping's plates (and codes) in sorted arrays, so
+# the matches for what has been typed so far are one bisect away: O(log n) per
+# keystroke, a few microseconds even for a fleet of 100,000 vehicles
+# (benchmarks/bench_plate_autocomplete.py). Choosing a suggestion fills in PLATE(CODE).
+
+MAX_SUGGESTIONS = 8
+
+
+class PlateIndex:
+    """Prefix index over a plate -> code mapping (plates listed with and without hyphen)."""
+
+    def __init__(self, plate_map):
+        by_key = {}
+        for plate, code in plate_map.items():
+            key = normalize_plate(plate)
+            # Both spellings map to the same vehicle; show the hyphenated one
+            if key not in by_key or "-" in plate:
+                by_key[key] = (plate.upper(), code)
+        self._plates = sorted((key, plate, code) for key, (plate, code) in by_key.items())
+        self._plate_keys = [key for key, _, _ in self._plates]
+        self._codes = sorted((str(code), plate) for _, plate, code in self._plates)
+        self._code_keys = [code for code, _ in self._codes]
+
+    def __len__(self):
+        return len(self._plates)
+
+    def complete(self, text, limit=MAX_SUGGESTIONS):
+        """
+        (plate, code) pairs whose plate starts with `text` (hyphens and case ignored),
+        then those whose code does. A PLATE(CODE) entry is matched on its plate.
+        """
+        plate, _ = parse_plate_entry(text)
+        prefix = normalize_plate(plate)
+        if not prefix:
+            return []
+        matches = []
+        start = bisect.bisect_left(self._plate_keys, prefix)
+        for key, plate, code in self._plates[start:start + limit]:
+            if not key.startswith(prefix):
+                break
+            matches.append((plate, code))
+        if len(matches) < limit:
+            seen = {plate for plate, _ in matches}
+            start = bisect.bisect_left(self._code_keys, prefix)
+            for code, plate in self._codes[start:start + limit]:
+                if not code.startswith(prefix) or len(matches) == limit:
+                    break
+                if plate not in seen:
+                    matches.append((plate, code))
+        return matches
+
+
+class PlateAutocomplete:
+    """
+    Drop-down suggestions under a tk.Entry. `mapping_for` returns the current plate -> code
+    mapping; the index is rebuilt only when that returns a different mapping (a reloaded workbook).
+    Up/Down pick a suggestion, Enter/Tab or a click take it, Escape closes the list.
+    """
+
+    def __init__(self, entry, variable, mapping_for, limit=MAX_SUGGESTIONS):
+        import tkinter as tk
+        self.entry = entry
+        self.variable = variable
+        self.mapping_for = mapping_for
+        self.limit = limit
+        self._mapping = None
+        self._index = None
+        self._matches = []
+        self._popup = tk.Toplevel(entry)
+        self._popup.withdraw()
+        self._popup.overrideredirect(True)
+        self._listbox = tk.Listbox(self._popup, height=limit, activestyle="dotbox", exportselection=False)
+        self._listbox.pack(fill="both", expand=True)
+        # On press, before the entry's focus-out closes the list
+        self._listbox.bind("<ButtonPress-1>", lambda event: self._accept(self._listbox.nearest(event.y)))
+        entry.bind("<KeyRelease>", self._on_key, add="+")
+        entry.bind("<Down>", lambda event: self._move(1))
+        entry.bind("<Up>", lambda event: self._move(-1))
+        entry.bind("<Return>", lambda event: self._accept())
+        entry.bind("<Tab>", lambda event: self._accept())
+        entry.bind("<Escape>", lambda event: self.hide())
+        entry.bind("<FocusOut>", lambda event: entry.after(150, self.hide), add="+")
+
+    def index(self):
+        mapping = self.mapping_for()
+        if mapping is not self._mapping:
+            self._mapping, self._index = mapping, PlateIndex(mapping or {})
+        return self._index
+
+    def _on_key(self, event):
+        if event.keysym in ("Up", "Down", "Return", "Tab", "Escape"):
+            return
+        self._matches = self.index().complete(self.variable.get(), self.limit)
+        if not self._matches:
+            self.hide()
+            return
+        self._listbox.delete(0, "end")
+        for plate, code in self._matches:
+            self._listbox.insert("end", format_plate_entry(plate, code))
+        self._listbox.configure(height=len(self._matches))
+        self._listbox.selection_clear(0, "end")
+        self._show()
+
+    def _show(self):
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self._popup.geometry(f"{self.entry.winfo_width()}x{self._listbox.winfo_reqheight()}+{x}+{y}")
+        self._popup.deiconify()
+        self._popup.lift()
+
+    def hide(self):
+        self._popup.withdraw()
+
+    def _visible(self):
+        return self._popup.winfo_viewable() and self._matches
+
+    def _move(self, step):
+        if not self._visible():
+            return None
+        current = self._listbox.curselection()
+        position = (current[0] + step if current else (0 if step > 0 else len(self._matches) - 1))
+        position = max(0, min(position, len(self._matches) - 1))
+        self._listbox.selection_clear(0, "end")
+        self._listbox.selection_set(position)
+        self._listbox.see(position)
+        return "break"
+
+    def _accept(self, position=None):
+        """Fills in PLATE(CODE) of the clicked, highlighted or only suggestion."""
+        if not self._visible():
+            return None
+        if position is None:
+            current = self._listbox.curselection()
+            if not current and len(self._matches) > 1:
+                return None # Nothing chosen yet: Enter/Tab keep their usual meaning
+            position = current[0] if current else 0
+        plate, code = self._matches[position]
+        self.variable.set(format_plate_entry(plate, code))
+        self.entry.icursor("end")
+        self.hide()
+        return "break"
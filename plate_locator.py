@@ -0,0 +1,187 @@
+import os
+import re
+
+# --- Plate localisation fast path ---
+# Photo two is mostly taken for the plate, yet full-frame OCR reads every sign,
+# sticker and shop front in it. This proposes a few plate-shaped regions with
+# cheap NumPy cues on a downscaled copy, and only those crops are recognised;
+# full-frame OCR remains the fallback.
+#
+# Cues (Taiwanese plates: dark green/black characters on a white, unsaturated plate):
+#   - mostly bright, low-chroma pixels (the plate background)
+#   - some dark pixels (the characters)
+#   - many strong horizontal intensity changes (character strokes)
+#   - a landscape aspect ratio (38x16 cm, less when photographed at an angle)
+# Each window size/aspect is scored for every position at once with integral images.
+
+WORK_WIDTH = 800 # Approximate long side of the downscaled copy the cues are computed on
+MAX_REGIONS = 3
+WINDOW_WIDTHS = (0.05, 0.065, 0.08, 0.1, 0.13) # Plate width as a fraction of the image width
+WINDOW_ASPECTS = (1.4, 1.8, 2.4)
+CROP_MARGIN = 0.25 # Extra context around a proposal, as a fraction of its size
+
+BRIGHT_LEVEL = 150
+DARK_LEVEL = 100
+MAX_CHROMA = 60
+EDGE_STEP = 45
+# Accepted ranges of the per-window fractions
+MIN_BRIGHT, MIN_DARK, MAX_DARK = 0.35, 0.06, 0.45
+MIN_EDGES, MAX_EDGES = 0.06, 0.4
+
+# What a recognised crop must look like to be trusted without the full-frame pass
+_PLATE_TEXT_RE = re.compile(r"^[A-Z0-9]{2,4}-?[A-Z0-9]{2,4}$")
+
+
+class PlateRegion:
+    """A proposed plate area in full-resolution pixel coordinates (x0, y0, x1, y1)."""
+    __slots__ = ("box", "score")
+
+    def __init__(self, box, score):
+        self.box = box
+        self.score = score
+
+    def crop(self, image, margin=CROP_MARGIN):
+        """The region plus a margin, cut from the full-resolution image (a view, no copy)."""
+        x0, y0, x1, y1 = self.box
+        dx, dy = int((x1 - x0) * margin), int((y1 - y0) * margin)
+        height, width = image.shape[:2]
+        return image[max(y0 - dy, 0):min(y1 + dy, height), max(x0 - dx, 0):min(x1 + dx, width)]
+
+    def __repr__(self):
+        return f"PlateRegion({self.box}, score={self.score:.3f})"
+
+
+def _integral(mask):
+    import numpy as np
+    table = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(mask, axis=0, dtype=np.int32), axis=1, out=table[1:, 1:])
+    return table
+
+
+def _rect_sums(table, top, bottom, left, right, count, stride):
+    """
+    Mask sums of the rectangle rows [top, bottom) x cols [left, right) of every window
+    on a `stride` grid; element [i, j] belongs to the window at (j * stride, i * stride).
+    """
+    rows, cols = count
+
+    def grid(row, col):
+        return table[row:row + rows * stride:stride, col:col + cols * stride:stride]
+    return grid(bottom, right) - grid(top, right) - grid(bottom, left) + grid(top, left)
+
+
+def _downscale(image):
+    """Nearest-neighbour downscale by striding: cheap, and the cues do not need better."""
+    step = max(1, int(round(max(image.shape[:2]) / WORK_WIDTH)))
+    return image[::step, ::step], step
+
+
+def _overlap(a, b):
+    """Intersection over the smaller box."""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return width * height / smaller
+
+
+def propose_plate_regions(image, max_regions=MAX_REGIONS):
+    """
+    Up to `max_regions` likely plate regions of a BGR (or RGB) uint8 image, best first.
+    Takes tens of milliseconds on a phone photo; nothing is recognised here.
+    """
+    import numpy as np
+    small, step = _downscale(image)
+    blue, green, red = (small[:, :, channel].astype(np.int16) for channel in range(3))
+    gray = (blue + 2 * green + red) >> 2
+    chroma = np.maximum(np.maximum(blue, green), red) - np.minimum(np.minimum(blue, green), red)
+    bright = _integral((gray >= BRIGHT_LEVEL) & (chroma <= MAX_CHROMA))
+    dark = _integral(gray <= DARK_LEVEL)
+    edges = np.zeros(gray.shape, dtype=bool)
+    edges[:, 1:] = np.abs(np.diff(gray, axis=1)) >= EDGE_STEP
+    edges = _integral(edges)
+
+    rows, cols = gray.shape
+    candidates = []
+    for width_fraction in WINDOW_WIDTHS:
+        width = max(int(cols * width_fraction), 8)
+        stride = max(1, width // 16)
+        for aspect in WINDOW_ASPECTS:
+            height = max(int(width / aspect), 6)
+            if width >= cols or height >= rows:
+                continue
+            count = ((rows - height) // stride + 1, (cols - width) // stride + 1)
+            rim, band = max(1, height // 6), height // 5
+
+            def part(table, top, bottom):
+                return _rect_sums(table, top, bottom, 0, width, count, stride) / float((bottom - top) * width)
+            bright_part = part(bright, 0, height)
+            text_dark = part(dark, band, height - band)
+            text_edges = part(edges, band, height - band)
+            rim_dark = (part(dark, 0, rim) + part(dark, height - rim, height)) / 2
+            plausible = ((bright_part >= MIN_BRIGHT) & (text_dark >= MIN_DARK) & (text_dark <= MAX_DARK)
+                         & (text_edges >= MIN_EDGES) & (text_edges <= MAX_EDGES) & (rim_dark <= text_dark / 2))
+            positions = np.flatnonzero(plausible)
+            if not len(positions):
+                continue
+            # Strokes in a band with clean plate background above and below it
+            # (larger windows win ties, so a whole plate beats its left or right half)
+            score = (text_edges.flat[positions] * bright_part.flat[positions]
+                     * (text_dark.flat[positions] - rim_dark.flat[positions]) * width ** 0.5)
+            # A handful of the best positions per window shape is plenty before suppression
+            best = np.argsort(score)[-8:]
+            for value, index in zip(score[best], positions[best]):
+                y, x = divmod(int(index), plausible.shape[1])
+                x, y = x * stride, y * stride
+                candidates.append((float(value), (x, y, x + width, y + height)))
+
+    candidates.sort(key=lambda item: item[0], reverse=True)
+    regions = []
+    for value, box in candidates:
+        if any(_overlap(box, kept) > 0.3 for _, kept in regions):
+            continue
+        regions.append((value, box))
+        if len(regions) == max_regions:
+            break
+    return [PlateRegion(tuple(v * step for v in box), value) for value, box in regions]
+
+
+def load_image(image):
+    """A path, encoded bytes or an already decoded array -> BGR uint8 array."""
+    from shm_transport import decode_image
+    if isinstance(image, (str, os.PathLike)):
+        with open(image, "rb") as f:
+            image = f.read()
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return decode_image(bytes(image))
+    return image
+
+
+def looks_like_plate(plate, plate_map):
+    """
+    Whether a plate read from a crop can be trusted. With a mapping loaded it must be a known
+    plate (other vehicles' plates are often in the picture too); otherwise plate-shaped.
+    """
+    from ocr_service import lookup_code
+    if not plate:
+        return False
+    if plate_map:
+        return bool(lookup_code(plate_map, plate))
+    return bool(_PLATE_TEXT_RE.match(plate.upper()))
+
+
+def read_plate(engine, image, plate_map, max_regions=MAX_REGIONS):
+    """
+    Recognises only the proposed plate regions. Returns (fields, regions tried): `fields` is
+    the extract_fields() dict of the first crop that yields a trustworthy plate (address and
+    date left empty), or None when the caller should fall back to full-frame OCR.
+    """
+    from ocr_service import extract_fields, run_ocr
+    image = load_image(image)
+    regions = propose_plate_regions(image, max_regions)
+    for tried, region in enumerate(regions, start=1):
+        fields = extract_fields(run_ocr(engine, region.crop(image)), plate_map)
+        if looks_like_plate(fields["plate"], plate_map):
+            return fields, tried
+    return None, len(regions)
@@ -0,0 +1,253 @@
+import io
+import os
+import re
+import json
+import hashlib
+import zipfile
+
+# --- Report rendering shared by the GUI and the headless modes ---
+# Nothing here talks to Tk: problems are raised as ReportError or collected as
+# warning messages for the caller to show. python-docx is imported lazily.
+
+# Truck type -> (filename suffix, template key)
+TRUCK_TYPES = {
+    "壓縮式垃圾車": ("垃圾車", "yellow"),
+    "資源回收車": ("回收車", "white"),
+}
+DEFAULT_TRUCK_TYPE = "壓縮式垃圾車"
+IMAGE_WIDTH_INCHES = 5.0
+# Part of every report fingerprint; bump when rendering changes so all reports are rebuilt once
+FINGERPRINT_VERSION = 1
+_CORE_IDENTIFIER_RE = re.compile(r"<dc:identifier>([^<]*)</dc:identifier>")
+
+
+class ReportError(Exception):
+    """Raised when a report cannot be produced (unknown type, missing template...)."""
+
+
+def build_output_filename(code, truck_type):
+    """空白-1.2級檢查-{code}垃圾車.docx / ...回收車.docx. Missing code becomes XXX."""
+    if truck_type not in TRUCK_TYPES:
+        raise ReportError(f"未知的車種選擇: {truck_type}. 無法產生檔名。")
+    suffix = TRUCK_TYPES[truck_type][0]
+    return f"空白-1.2級檢查-{code or 'XXX'}{suffix}.docx"
+
+
+def select_template(truck_type, yellow_template, white_template):
+    """Returns the template path for a truck type."""
+    if truck_type not in TRUCK_TYPES:
+        raise ReportError(f"未知的車種選擇: {truck_type}. 無法決定模板。")
+    return yellow_template if TRUCK_TYPES[truck_type][1] == "yellow" else white_template
+
+
+def build_replacements(fields):
+    """Text placeholders of the templates -> values. `fields` has plate/address/date."""
+    return {
+        "{{ADDRESS}}": fields.get("address", "N/A"),
+        "{{DATE}}": fields.get("date", "N/A"),
+        "{{LICENSE_PLATE}}": fields.get("plate", "N/A"),
+        # Checkboxes are static in the templates, no replacement needed
+    }
+
+
+def _iter_paragraphs(document):
+    """Body paragraphs first, then paragraphs inside table cells."""
+    for p in document.paragraphs:
+        yield p
+    for table in document.tables:
+        for row in table.rows:
+            try:
+                cells = row.cells
+            except AttributeError:
+                # Skip rows that cause AttributeError (likely malformed)
+                print("Warning: Skipping a row in table due to unexpected structure (no 'cells' attribute).")
+                continue
+            for cell in cells:
+                for p in cell.paragraphs:
+                    yield p
+
+
+def replace_text_placeholders(document, replacements):
+    """Replaces placeholders run by run so the template formatting is kept."""
+    for p in _iter_paragraphs(document):
+        for key, value in replacements.items():
+            if key in p.text:
+                for run in p.runs:
+                    if key in run.text:
+                        run.text = run.text.replace(key, value)
+
+
+def _image_label(img):
+    """File name for messages; `img` is a path or a stream with a .name attribute."""
+    return os.path.basename(getattr(img, "name", None) or str(img))
+
+
+def replace_image_placeholder(document, placeholder, img_path, warnings, width_inches=IMAGE_WIDTH_INCHES,
+                              linked=False):
+    """
+    Clears the placeholder and adds the picture at the end of its paragraph.
+    `img_path` may also be a binary stream holding the image. With `linked`, the picture
+    links to the file at `img_path` instead of embedding it (linked_images.py).
+    Insertion problems are appended to `warnings`. Returns True if the picture was added.
+    """
+    from docx.shared import Inches
+    from PIL import UnidentifiedImageError
+
+    for p in _iter_paragraphs(document):
+        if placeholder not in p.text:
+            continue
+        for run in p.runs:
+            if placeholder in run.text:
+                run.text = run.text.replace(placeholder, '')
+        try:
+            if linked:
+                from linked_images import add_linked_picture
+                add_linked_picture(p.add_run(), img_path, Inches(width_inches))
+            else:
+                p.add_run().add_picture(img_path, width=Inches(width_inches))
+            return True
+        except FileNotFoundError:
+            warnings.append(f"圖片檔案未找到: {img_path}")
+        except UnidentifiedImageError:
+            warnings.append(f"無法識別圖片檔案格式或檔案已損毀: {_image_label(img_path)}")
+        except Exception as e:
+            warnings.append(f"插入圖片 '{_image_label(img_path)}' 時發生未預期錯誤:\n{type(e).__name__}: {e}")
+        return False
+    print(f"Warning: Image placeholder '{placeholder}' not found anywhere in the document.")
+    return False
+
+
+def render_report(template_path, fields, img_path1, img_path2, warnings=None, linked=False):
+    """
+    Loads the template and fills text and image placeholders (linked to the photo files
+    with `linked`). Returns the python-docx Document; image problems are appended to `warnings`.
+    """
+    from docx import Document
+
+    if not os.path.exists(template_path):
+        raise ReportError(f"模板檔案未找到: {template_path}")
+    warnings = [] if warnings is None else warnings
+    document = Document(template_path)
+    replace_text_placeholders(document, build_replacements(fields))
+    if img_path1:
+        replace_image_placeholder(document, "{{IMAGE_1}}", img_path1, warnings, linked=linked)
+    if img_path2:
+        replace_image_placeholder(document, "{{IMAGE_2}}", img_path2, warnings, linked=linked)
+    return document
+
+
+# --- Input fingerprints ---
+# Every report generated by generate_report_file carries a hash of everything that
+# went into it (template, placeholder values, photos, embedding settings) in the
+# docx core properties (dc:identifier). A rerun compares it with the new inputs
+# and skips reports that would come out the same.
+
+_hash_cache = {}  # (path, size, mtime) -> sha256, so reruns in one process hash each photo once
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 of a file's content, read in chunks. None if the file cannot be read."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    cache_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if cache_key in _hash_cache:
+        return _hash_cache[cache_key]
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    _hash_cache[cache_key] = digest.hexdigest()
+    return _hash_cache[cache_key]
+
+
+def compute_fingerprint(template_path, fields, img_path1, img_path2, width_inches=IMAGE_WIDTH_INCHES,
+                        image_hashes=None, linked=False):
+    """Hash of all inputs of one report. `image_hashes` saves re-reading photos whose hash is known."""
+    if image_hashes is None:
+        image_hashes = [file_sha256(p) if p else None for p in (img_path1, img_path2)]
+    inputs = {
+        "version": FINGERPRINT_VERSION,
+        "template": file_sha256(template_path),
+        "values": build_replacements(fields),
+        "images": list(image_hashes),
+        "image_width_inches": width_inches,
+    }
+    if linked: # Only added when set, so embedded reports keep their fingerprints
+        inputs["linked_images"] = True
+    encoded = json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return "sha256:" + hashlib.sha256(encoded).hexdigest()
+
+
+def read_fingerprint(doc_path):
+    """The fingerprint stored in a generated report, or None (no file, older report, not a docx)."""
+    try:
+        with zipfile.ZipFile(doc_path) as zf:
+            core = zf.read("docProps/core.xml").decode("utf-8")
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return None
+    match = _CORE_IDENTIFIER_RE.search(core)
+    return match.group(1) if match else None
+
+
+def generate_report_file(fields, img_path1, img_path2, truck_type, output_dir, yellow_template, white_template,
+                         skip_unchanged=False, photo_store=None):
+    """
+    Renders and saves one report. `fields` has plate (as shown in the report),
+    code, address and date. Returns (doc_path, warnings, rebuilt).
+    With `skip_unchanged`, an existing report with the same input fingerprint is kept (rebuilt is False).
+    With a `photo_store` (linked_images.PhotoStore) the photos are linked from the store, not embedded.
+    """
+    template_path = select_template(truck_type, yellow_template, white_template)
+    output_filename = build_output_filename(fields.get("code"), truck_type)
+    doc_path = os.path.join(output_dir, output_filename)
+    linked = photo_store is not None
+    fingerprint = compute_fingerprint(template_path, fields, img_path1, img_path2, linked=linked)
+    if skip_unchanged and read_fingerprint(doc_path) == fingerprint:
+        return doc_path, [], False
+    if linked:
+        img_path1, img_path2 = (store_photo(photo_store, path) for path in (img_path1, img_path2))
+    warnings = []
+    document = render_report(template_path, fields, img_path1, img_path2, warnings, linked=linked)
+    if not warnings: # A report missing a photo must not look up to date on the next run
+        document.core_properties.identifier = fingerprint
+    save_document(document, doc_path)
+    return doc_path, warnings, True
+
+
+def store_photo(photo_store, path, digest=None):
+    """The photo's path in the store; the original path if it cannot be stored (rendering then reports it)."""
+    if not path:
+        return path
+    try:
+        return photo_store.add(path, digest)
+    except OSError:
+        return path
+
+
+def write_file_atomically(path, data):
+    """
+    Writes `data` to a temporary file next to `path`, syncs it and renames it over `path`:
+    after a crash or power loss there is either the old file or the complete new one.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.replace(tmp_path, path)
+    except OSError: # e.g. the report is open in Word
+        os.remove(tmp_path)
+        raise
+
+
+def save_document(document, path):
+    """Saves a python-docx Document without ever leaving a half-written report at `path`."""
+    buffer = io.BytesIO()
+    document.save(buffer)
+    write_file_atomically(path, buffer.getvalue())
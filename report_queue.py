@@ -0,0 +1,194 @@
+import itertools
+import os
+import threading
+
+from job_scheduler import INTERACTIVE, JobScheduler, describe_wait, image_cost
+from report_builder import ReportError
+
+# --- Queue of reports waiting to be rendered, for the GUI ---
+# 產生報告 used to render and save on the spot and then stop the operator with a
+# dialog. Now it only stages the pair with its confirmed fields here and clears the
+# form for the next vehicle; the reports are rendered and saved in the background,
+# on up to MAX_RENDER_WORKERS threads, and the panel shows every row's state inline:
+#
+#   排隊中   waiting for a render worker (position and estimated wait)
+#   產生中   filling the template / 儲存中: writing the .docx
+#   完成     with the seconds it took, or the image warnings it had
+#   失敗     with the error; 重試失敗項目 queues it again
+#
+# Rendering needs no OCR engine, so it has its own scheduler: staged reports never
+# hold up the OCR of the next vehicle's photos, and a background batch on the OCR
+# scheduler never holds up the staged reports.
+
+MAX_RENDER_WORKERS = 2  # zlib and file I/O release the GIL; the python-docx part of a render does not
+REFRESH_MS = 200
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class QueuedReport:
+    """One staged report: the confirmed fields, photos, template and output path, and its job's state."""
+
+    def __init__(self, number, fields, image1, image2, template_path, output_path, **details):
+        self.number = number
+        self.fields = fields  # As passed to render_report: plate (PLATE(CODE)), address, date
+        self.image1 = image1
+        self.image2 = image2
+        self.template_path = template_path
+        self.output_path = output_path
+        self.details = details  # plate, code, truck_type, ocr_seconds: for the history record
+        self.job = None
+        self.stage = None  # Set by the render function while it runs, e.g. "儲存中"
+        self.warnings = []
+
+    def state(self):
+        if self.job is None or self.job.future.cancelled():
+            return CANCELLED if self.job else QUEUED
+        if not self.job.done():
+            return QUEUED if self.job.started is None else RUNNING
+        return DONE if self.job.future.exception() is None else FAILED
+
+    def error(self):
+        return self.job.future.exception() if self.state() == FAILED else None
+
+
+class ReportQueue:
+    """
+    Renders staged reports on a scheduler of its own. `render(report)` does the work
+    (template, images, save, history) on a worker thread and may append to report.warnings.
+    """
+
+    def __init__(self, render, workers=None):
+        self.render = render
+        if workers is None: # One core stays with Tk and OCR; on a single core parallel renders only take longer
+            from thread_budget import usable_cores
+            workers = max(1, min(MAX_RENDER_WORKERS, len(usable_cores()) - 1))
+        self.scheduler = JobScheduler(workers=workers, name="render")
+        self.reports = []
+        self._numbers = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, fields, image1, image2, template_path, output_path, **details):
+        """Stages and queues a report. ReportError if an unfinished one would write the same file."""
+        with self._lock:
+            for other in self.reports:
+                if other.output_path == output_path and other.state() in (QUEUED, RUNNING):
+                    raise ReportError(f"佇列中第 {other.number} 筆（{other.fields['plate']}）將寫入相同檔名 "
+                                      f"{os.path.basename(output_path)}，請等它完成後再加入")
+            report = QueuedReport(next(self._numbers), fields, image1, image2, template_path, output_path, **details)
+            self.reports.append(report)
+        self._submit(report)
+        return report
+
+    def _submit(self, report):
+        report.stage, report.warnings = None, []
+        # FIFO among themselves: everything on this scheduler is the operator's
+        report.job = self.scheduler.submit(self.render, report, priority=INTERACTIVE,
+                                           cost=image_cost(report.image1, report.image2), kind="render")
+
+    def retry_failed(self):
+        """Queues the failed reports again; returns how many."""
+        failed = [report for report in self.reports if report.state() == FAILED]
+        for report in failed:
+            self._submit(report)
+        return len(failed)
+
+    def cancel(self, report):
+        """Removes a report that has not started yet; False once it is rendering or finished."""
+        return report.state() == QUEUED and report.job.cancel()
+
+    def clear_finished(self):
+        """Drops done and cancelled rows from the list; returns them."""
+        with self._lock:
+            finished = [report for report in self.reports if report.state() in (DONE, CANCELLED)]
+            self.reports = [report for report in self.reports if report not in finished]
+        return finished
+
+    def unfinished(self):
+        return sum(1 for report in self.reports if report.state() in (QUEUED, RUNNING))
+
+    def describe(self, report):
+        """The row's status text, e.g. '排隊中：前面還有 2 項…', '完成（1.4 秒）', '失敗：模板檔案未找到…'."""
+        state = report.state()
+        if state == QUEUED:
+            return describe_wait(self.scheduler, report.job) or "排隊中"
+        if state == RUNNING:
+            return report.stage or "產生中…"
+        if state == CANCELLED:
+            return "已取消"
+        if state == FAILED:
+            error = report.error()
+            return f"失敗：{error}" if isinstance(error, ReportError) else f"失敗：{type(error).__name__}: {error}"
+        if report.warnings:
+            return f"完成，但有警告：{'；'.join(report.warnings)}"
+        return f"完成（{report.job.elapsed():.1f} 秒）：{os.path.basename(report.output_path)}"
+
+    def shutdown(self, wait=False):
+        self.scheduler.shutdown(wait=wait, cancel_queued=not wait)
+
+
+class ReportQueuePanel:
+    """
+    The queue as a table under the form (one row per staged report, refreshed every
+    REFRESH_MS) with buttons to retry failed rows, cancel queued ones and clear finished ones.
+    """
+
+    COLUMNS = (("number", "#", 36), ("plate", "車牌", 130), ("truck_type", "車種", 100),
+               ("date", "日期", 110), ("address", "地址", 160), ("status", "狀態", 320))
+
+    def __init__(self, parent, queue):
+        import tkinter as tk
+        from tkinter import ttk
+        self.queue = queue
+        self.frame = tk.LabelFrame(parent, text="報告產生佇列", padx=5, pady=5)
+        self.tree = ttk.Treeview(self.frame, columns=[name for name, _, _ in self.COLUMNS], show="headings", height=6)
+        for name, title, width in self.COLUMNS:
+            self.tree.heading(name, text=title)
+            self.tree.column(name, width=width, stretch=name in ("address", "status"), anchor="w")
+        self.tree.tag_configure(DONE, foreground="dark green")
+        self.tree.tag_configure(FAILED, foreground="red")
+        self.tree.tag_configure("warning", foreground="dark orange")
+        self.tree.tag_configure(CANCELLED, foreground="gray")
+        scrollbar = tk.Scrollbar(self.frame, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        buttons = tk.Frame(self.frame)
+        buttons.pack(side=tk.BOTTOM, fill="x")
+        tk.Button(buttons, text="重試失敗項目", command=self.queue.retry_failed).pack(side=tk.LEFT)
+        tk.Button(buttons, text="取消選取的排隊項目", command=self.cancel_selected).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="清除已完成", command=self.clear_finished).pack(side=tk.LEFT)
+        self.summary_var = tk.StringVar()
+        tk.Label(buttons, textvariable=self.summary_var, fg="gray").pack(side=tk.RIGHT)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.refresh()
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def refresh(self):
+        """Brings every row up to date; re-schedules itself on the Tk loop."""
+        for report in list(self.queue.reports):
+            state = report.state()
+            tag = "warning" if state == DONE and report.warnings else state
+            values = (report.number, report.fields["plate"], report.details.get("truck_type", ""),
+                      report.fields["date"], report.fields["address"], self.queue.describe(report))
+            iid = str(report.number)
+            if self.tree.exists(iid):
+                self.tree.item(iid, values=values, tags=(tag,))
+            else:
+                self.tree.insert("", "end", iid=iid, values=values, tags=(tag,))
+                self.tree.see(iid)
+        states = [report.state() for report in self.queue.reports]
+        self.summary_var.set(f"排隊 {states.count(QUEUED)}、產生中 {states.count(RUNNING)}、"
+                             f"完成 {states.count(DONE)}、失敗 {states.count(FAILED)}")
+        self.frame.after(REFRESH_MS, self.refresh)
+
+    def cancel_selected(self):
+        numbers = {int(iid) for iid in self.tree.selection()}
+        for report in self.queue.reports:
+            if report.number in numbers:
+                self.queue.cancel(report)
+
+    def clear_finished(self):
+        for report in self.queue.clear_finished():
+            self.tree.delete(str(report.number))
@@ -0,0 +1,369 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import quote, urlparse
+
+from extraction_rules import format_plate_entry, parse_plate_entry
+from inspection_history import record_safely
+from ocr_service import lookup_code, merge_pair_fields
+from report_builder import DEFAULT_TRUCK_TYPE, TRUCK_TYPES, ReportError, build_output_filename, render_report, select_template
+from report_service_args import DEFAULT_WORKERS, MAX_REQUEST_MB
+
+# --- Local HTTP report service ---
+# Lets other tools on this machine (dispatch system, tablet upload page) create
+# reports without the GUI. Nothing here talks to Tk or to the network beyond the
+# listening socket, which is bound to 127.0.0.1 unless --serve-host says otherwise.
+#
+#   POST /reports   multipart/form-data with image1 and image2 (files) and optional
+#                   plate (PLATE or PLATE(CODE)), code, address, date, truck_type.
+#                   Given fields are used as they are; OCR only looks for the missing
+#                   ones (photo two is not read at all when it is not needed).
+#                   200: the .docx (Content-Disposition has its file name; the
+#                        X-Report-Fields header has the fields used, as JSON)
+#                   400/413/415: bad request, too large, not multipart
+#                   422: fields still missing after OCR (JSON with what was found)
+#                   503: too many requests queued, or no OCR engine free in time
+#   GET /metrics    request counts and latency histograms (Prometheus text format)
+#   GET /health     {"status": "ok", ...}
+#   GET /debug/memory  RSS and a tracemalloc snapshot (memory_watchdog.py)
+#
+# Requests are handled by a fixed pool of `workers` threads; OCR inside them
+# checks engines out of the process's ocr_engine_pool, so --ocr-engines bounds
+# concurrent OCR and the workers overlap it with rendering and uploads.
+
+MAX_PENDING = 32  # Requests accepted (running or queued) before answering 503
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # Seconds
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+FIELD_NAMES = {"plate": "車牌", "address": "地址", "date": "日期"}
+
+
+class RequestError(Exception):
+    """A request that cannot be served; `status` is the HTTP status, `details` goes into the JSON body."""
+
+    def __init__(self, status, message, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details or {}
+
+
+def parse_multipart(content_type, body):
+    """multipart/form-data body -> ({name: text}, {name: (filename, bytes)})."""
+    from email import policy
+    from email.parser import BytesParser
+
+    if not content_type.lower().startswith("multipart/form-data"):
+        raise RequestError(415, "請以 multipart/form-data 上傳照片")
+    header = b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n"
+    message = BytesParser(policy=policy.HTTP).parsebytes(header + body)
+    if not message.is_multipart():
+        raise RequestError(400, "無法解析上傳內容")
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if not name:
+            continue
+        payload = part.get_payload(decode=True) or b""
+        if part.get_filename() is not None:
+            files[name] = (part.get_filename(), payload)
+        else:
+            fields[name] = payload.decode(part.get_content_charset() or "utf-8", "replace").strip()
+    return fields, files
+
+
+class LatencyHistogram:
+    """Request counts by (route, status) and latency histograms by route, rendered for Prometheus."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = {}  # (route, status) -> requests
+        self._histograms = {}  # route -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, route, status, seconds):
+        with self._lock:
+            self._counts[(route, status)] = self._counts.get((route, status), 0) + 1
+            histogram = self._histograms.setdefault(route, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[len(self.buckets)] += 1
+            histogram[-1] += seconds
+
+    def render(self):
+        lines = ["# HELP report_service_requests_total Requests by route and HTTP status.",
+                 "# TYPE report_service_requests_total counter"]
+        with self._lock:
+            for (route, status), count in sorted(self._counts.items()):
+                lines.append(f'report_service_requests_total{{route="{route}",status="{status}"}} {count}')
+            lines += ["# HELP report_service_request_seconds Time from request line to response sent.",
+                      "# TYPE report_service_request_seconds histogram"]
+            for route, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f'report_service_request_seconds_bucket{{route="{route}",le="{bound:g}"}} {count}')
+                total = histogram[len(self.buckets)]
+                lines.append(f'report_service_request_seconds_bucket{{route="{route}",le="+Inf"}} {total}')
+                lines.append(f'report_service_request_seconds_sum{{route="{route}"}} {histogram[-1]:.6f}')
+                lines.append(f'report_service_request_seconds_count{{route="{route}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+
+class ReportService:
+    """
+    Turns two uploaded photos plus optional field overrides into a rendered report.
+    `read_photo_fields(path, known)` is the app's OCR (ocr_service.read_photo_fields with a pooled engine),
+    `plate_map_for()` returns the current plate -> code mapping.
+    """
+
+    def __init__(self, read_photo_fields, plate_map_for, yellow_template, white_template,
+                 truck_type_for=None, history=None):
+        self.read_photo_fields = read_photo_fields
+        self.plate_map_for = plate_map_for
+        self.yellow_template = yellow_template
+        self.white_template = white_template
+        self.truck_type_for = truck_type_for
+        self.history = history
+
+    def resolve_fields(self, path1, path2, overrides):
+        """Overrides first, OCR for the rest. Returns (fields with sources, OCR seconds)."""
+        plate, entry_code = parse_plate_entry(overrides.get("plate", ""))
+        given = {"plate": plate, "address": overrides.get("address", ""), "date": overrides.get("date", "")}
+        fields = dict(given, code=overrides.get("code") or entry_code)
+        sources = {name: "override" for name, value in fields.items() if value}
+        started = time.perf_counter()
+        errors = []
+        if not all(given.values()):
+            known = [name for name in ("address", "date") if given[name]]
+            data1 = self.read_photo_fields(path1, known)
+            known += [name for name in ("address", "date")
+                      if name not in known and data1.get(name) and ("error" not in data1 or name == "date")]
+            data2 = None
+            if not given["plate"] or len(known) < 2: # Photo two is only read when still needed
+                data2 = self.read_photo_fields(path2, known)
+            errors = [data["error"] for data in (data1, data2) if data and "error" in data]
+            merged = merge_pair_fields(data1, data2)
+            for name in ("plate", "address", "date"):
+                if not fields[name] and merged[name]:
+                    fields[name] = merged[name]
+                    sources[name] = merged["sources"].get(name)
+            if not fields["code"] and not given["plate"] and merged["code"]:
+                fields["code"], sources["code"] = merged["code"], merged["sources"].get("code")
+        if not fields["code"]:
+            fields["code"] = lookup_code(self.plate_map_for(), fields["plate"])
+            if fields["code"]:
+                sources["code"] = "mapping"
+        fields["sources"] = sources
+        missing = [label for name, label in FIELD_NAMES.items() if not fields[name]]
+        if missing:
+            raise RequestError(422, f"無法判斷: {', '.join(missing)}，請以表單欄位提供",
+                               {"fields": fields, "ocr_errors": errors})
+        return fields, time.perf_counter() - started
+
+    def generate(self, image1, image2, overrides):
+        """
+        `image1`/`image2` are (filename, bytes). Returns (output filename, docx bytes, fields, warnings).
+        Raises RequestError for anything the caller has to fix.
+        """
+        truck_type = overrides.get("truck_type")
+        if truck_type and truck_type not in TRUCK_TYPES:
+            raise RequestError(400, f"未知的車種: {truck_type}", {"truck_types": list(TRUCK_TYPES)})
+        with tempfile.TemporaryDirectory(prefix="report-service-") as tmp:
+            paths = []
+            for number, (filename, data) in enumerate((image1, image2), start=1):
+                path = os.path.join(tmp, f"photo{number}{os.path.splitext(filename or '')[1].lower() or '.jpg'}")
+                with open(path, "wb") as f:
+                    f.write(data)
+                _check_image(path, number)
+                paths.append(path)
+            fields, ocr_seconds = self.resolve_fields(*paths, overrides)
+            truck_type = truck_type or (self.truck_type_for and self.truck_type_for(fields["plate"])) or DEFAULT_TRUCK_TYPE
+            fields["truck_type"] = truck_type
+            template_path = select_template(truck_type, self.yellow_template, self.white_template)
+            report_fields = dict(fields, plate=format_plate_entry(fields["plate"], fields["code"]))
+            warnings = []
+            started = time.perf_counter()
+            document = render_report(template_path, report_fields, *paths, warnings)
+            buffer = io.BytesIO()
+            document.save(buffer)
+            record_safely(
+                self.history, "service", plate=fields["plate"], code=fields["code"], truck_type=truck_type,
+                address=fields["address"], inspection_date=fields["date"], image1=paths[0], image2=paths[1],
+                template=template_path, ocr_seconds=ocr_seconds, render_seconds=time.perf_counter() - started)
+        return build_output_filename(fields["code"], truck_type), buffer.getvalue(), fields, warnings
+
+
+def _check_image(path, number):
+    from PIL import Image
+    try:
+        with Image.open(path) as image:
+            image.size
+    except Exception:
+        raise RequestError(400, f"照片{'一二'[number - 1]}不是可辨識的圖片檔") from None
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    server_version = "ReportService/1"
+
+    def do_GET(self):
+        self._started = time.perf_counter()
+        route = urlparse(self.path).path
+        if route == "/metrics":
+            self._send(200, self.server.render_metrics().encode("utf-8"), "text/plain; version=0.0.4")
+        elif route == "/health":
+            self._send_json(200, self.server.health())
+        elif route == "/debug/memory": # tracemalloc snapshot (with --trace-memory)
+            from memory_watchdog import WATCHDOG
+            text = WATCHDOG.describe() + "\n" + WATCHDOG.snapshot() + "\n"
+            self._send(200, text.encode("utf-8"), "text/plain; charset=utf-8")
+        else:
+            self._send_json(404, {"error": f"未知的路徑: {route}"})
+
+    def do_POST(self):
+        self._started = time.perf_counter()
+        route = urlparse(self.path).path
+        try:
+            if route != "/reports":
+                raise RequestError(404, f"未知的路徑: {route}")
+            filename, data, fields, warnings = self.server.service.generate(*self._read_form())
+        except RequestError as e:
+            self._send_json(e.status, dict(e.details, error=str(e)))
+            return
+        except ReportError as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        except Exception as e:
+            from ocr_engine_pool import EnginePoolTimeout
+            if isinstance(e, EnginePoolTimeout):
+                self._send_json(503, {"error": str(e)}, {"Retry-After": "10"})
+                return
+            print(f"Error: Report request failed: {type(e).__name__}: {e}")
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        info = json.dumps(dict(fields, warnings=warnings)) # ASCII only (\u escapes), as headers must be
+        self._send(200, data, DOCX_TYPE, {
+            "Content-Disposition": f"attachment; filename=\"report.docx\"; filename*=UTF-8''{quote(filename)}",
+            "X-Report-Fields": info,
+        })
+
+    def _read_form(self):
+        """Reads and checks the upload. Returns (image1, image2, overrides) for ReportService.generate."""
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise RequestError(411, "需要 Content-Length") from None
+        if length > self.server.max_request_bytes:
+            self.close_connection = True # The body is not read
+            raise RequestError(413, f"上傳內容超過 {self.server.max_request_bytes // (1 << 20)} MB")
+        fields, files = parse_multipart(self.headers.get("Content-Type", ""), self.rfile.read(length))
+        missing = [name for name in ("image1", "image2") if not files.get(name, (None, b""))[1]]
+        if missing:
+            raise RequestError(400, f"缺少照片: {', '.join(missing)}")
+        overrides = {name: fields[name] for name in ("plate", "code", "address", "date", "truck_type")
+                     if fields.get(name)}
+        return files["image1"], files["image2"], overrides
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        route = urlparse(self.path).path
+        self.server.metrics.observe(route if route in ("/reports", "/metrics", "/health") else "other",
+                                    status, time.perf_counter() - self._started)
+
+
+class ReportServer(HTTPServer):
+    """HTTPServer whose requests run on a fixed thread pool, with at most `max_pending` accepted at a time."""
+
+    def __init__(self, address, service, workers=DEFAULT_WORKERS, max_pending=MAX_PENDING,
+                 max_request_bytes=MAX_REQUEST_MB << 20, ocr_pool=None):
+        super().__init__(address, ReportRequestHandler)
+        self.service = service
+        self.workers = workers
+        self.max_request_bytes = max_request_bytes
+        self.ocr_pool = ocr_pool
+        self.metrics = LatencyHistogram()
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="report-service")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            try:
+                request.sendall(b"HTTP/1.0 503 Service Unavailable\r\nRetry-After: 5\r\nContent-Length: 0\r\n\r\n")
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        with self._lock:
+            self._in_flight += 1
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def health(self):
+        with self._lock:
+            status = {"status": "ok", "workers": self.workers, "in_flight": self._in_flight, "rejected": self.rejected}
+        if self.ocr_pool:
+            status["ocr_engines"] = self.ocr_pool.stats()
+        return status
+
+    def render_metrics(self):
+        with self._lock:
+            lines = ["# TYPE report_service_in_flight gauge", f"report_service_in_flight {self._in_flight}",
+                     "# TYPE report_service_rejected_total counter", f"report_service_rejected_total {self.rejected}"]
+        if self.ocr_pool:
+            for name, value in self.ocr_pool.stats().items():
+                lines.append(f"ocr_engine_pool_{name} {value}")
+        from image_enhance import ENHANCE_STATS
+        from memory_watchdog import WATCHDOG
+        lines += WATCHDOG.metrics_lines()
+        lines += ["# TYPE ocr_enhancement_retries_total counter", f"ocr_enhancement_retries_total {ENHANCE_STATS.fired}",
+                  "# TYPE ocr_enhancement_helped_total counter", f"ocr_enhancement_helped_total {ENHANCE_STATS.helped}"]
+        return self.metrics.render() + "\n".join(lines) + "\n"
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+
+def run_from_args(args, read_photo_fields, plate_map_for, yellow_template, white_template,
+                  truck_type_for=None, history=None, ocr_pool=None):
+    service = ReportService(read_photo_fields, plate_map_for, yellow_template, white_template,
+                            truck_type_for=truck_type_for, history=history)
+    server = ReportServer((args.serve_host, args.serve), service, workers=args.service_workers,
+                          max_request_bytes=args.max_request_mb << 20, ocr_pool=ocr_pool)
+    if args.serve_host not in ("127.0.0.1", "localhost", "::1"):
+        print(f"Warning: Listening on {args.serve_host}; other machines can reach the service.")
+    print(f"Report service on http://{args.serve_host}:{server.server_port}/reports "
+          f"({args.service_workers} workers, metrics at /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping report service...")
+    finally:
+        server.server_close()
@@ -0,0 +1,17 @@
+# --- Command line flags of the HTTP report service ---
+# Kept apart from report_service.py so main.py / main-pack.py can build their parser
+# without importing http.server and the rest of the service; report_service is only
+# imported once --serve is given.
+
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+MAX_REQUEST_MB = 40  # Two full-size phone photos plus form fields
+
+
+def add_service_arguments(parser):
+    """Command line flags for the HTTP service mode, shared by main.py and main-pack.py."""
+    parser.add_argument("--serve", metavar="PORT", type=int, nargs="?", const=DEFAULT_PORT,
+                        help=f"本機 HTTP 服務模式：POST /reports 上傳兩張照片即回傳報告 (預設埠 {DEFAULT_PORT})")
+    parser.add_argument("--serve-host", default="127.0.0.1", help="服務綁定的位址（預設只接受本機連線）")
+    parser.add_argument("--service-workers", type=int, default=DEFAULT_WORKERS, help="服務同時處理的請求數")
+    parser.add_argument("--max-request-mb", type=int, default=MAX_REQUEST_MB, help="單一請求的大小上限 (MB)")
@@ -0,0 +1,311 @@
+import os
+import sys
+import atexit
+import itertools
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+# --- Shared-memory image transport ---
+# Hands decoded images to OCR worker processes without pickling the pixels.
+# The producer copies the decoded array into a shared memory segment once and
+# sends a small ImageHandle (name, shape, dtype); the worker maps the same
+# segment as a read-only NumPy array, no copy.
+#
+# Lifetime: the producer owns every segment it creates and unlinks it after the
+# worker is done (release) or at exit (close / atexit). If the producer dies
+# without cleaning up, multiprocessing's resource tracker unlinks its segments;
+# segments of a producer whose tracker died too are removed by
+# cleanup_stale_segments() on the next start (segment names carry the owner pid).
+# On Windows a segment disappears with its last open handle, so nothing can leak.
+
+SEGMENT_PREFIX = "gcrimg"
+_SHM_DIR = "/dev/shm"
+
+
+class ImageHandle:
+    """What travels between processes: a segment name and the array layout."""
+    __slots__ = ("name", "shape", "dtype")
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = str(dtype)
+
+    def __getstate__(self):
+        return (self.name, self.shape, self.dtype)
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype = state
+
+    def nbytes(self):
+        import numpy as np
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # Exists, owned by someone else
+    return True
+
+
+def cleanup_stale_segments():
+    """Unlinks segments left behind by producers that no longer run. Returns how many were removed."""
+    if not os.path.isdir(_SHM_DIR): # Windows / macOS: segments do not outlive their processes here
+        return 0
+    removed = 0
+    for entry in os.listdir(_SHM_DIR):
+        parts = entry.split("_")
+        if len(parts) != 3 or parts[0] != SEGMENT_PREFIX or not parts[1].isdigit():
+            continue
+        if _pid_alive(int(parts[1])):
+            continue
+        try:
+            os.unlink(os.path.join(_SHM_DIR, entry))
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        print(f"Removed {removed} shared memory segment(s) left by a crashed run.")
+    return removed
+
+
+class SharedImageTransport:
+    """Producer side. Creates one segment per image; release() it once the consumer has finished."""
+
+    def __init__(self):
+        self._segments = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._pid = os.getpid()
+        cleanup_stale_segments()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def put(self, array):
+        """Copies `array` into a new segment and returns its handle."""
+        import numpy as np
+        name = f"{SEGMENT_PREFIX}_{self._pid}_{next(self._counter)}"
+        segment = shared_memory.SharedMemory(name=name, create=True, size=max(array.nbytes, 1))
+        try:
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+        except BaseException:
+            segment.close()
+            segment.unlink()
+            raise
+        with self._lock:
+            self._segments[name] = segment
+        return ImageHandle(name, array.shape, array.dtype)
+
+    def release(self, handle):
+        with self._lock:
+            segment = self._segments.pop(handle.name, None)
+        if segment is not None:
+            segment.close()
+            segment.unlink()
+
+    def live_segments(self):
+        with self._lock:
+            return len(self._segments)
+
+    def close(self):
+        """Releases every segment still owned (idempotent)."""
+        with self._lock:
+            segments, self._segments = self._segments, {}
+        for segment in segments.values():
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _attach(name):
+    """Opens an existing segment without making this process responsible for unlinking it."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Before 3.13 attaching also registers the segment with the resource tracker. Spawned
+    # workers share the producer's tracker (its fd is handed to them), which keeps a set of
+    # names: the second registration is a no-op and the producer's unlink() clears it.
+    # Unregistering here would drop the producer's own registration instead.
+    return shared_memory.SharedMemory(name=name)
+
+
+@contextmanager
+def open_image(handle):
+    """
+    Consumer side: the image as a read-only NumPy array backed by the segment (no copy).
+    The array is only valid inside the with block; copy it if it must outlive it.
+    """
+    import numpy as np
+    segment = _attach(handle.name)
+    array = np.ndarray(handle.shape, dtype=handle.dtype, buffer=segment.buf)
+    array.flags.writeable = False
+    try:
+        yield array
+    finally:
+        del array
+        try:
+            segment.close()
+        except BufferError:
+            pass # The caller still holds the array; the mapping goes away when it is collected
+
+
+def decode_image(data):
+    """Encoded photo bytes -> BGR uint8 array, the layout PaddleOCR uses."""
+    import numpy as np
+    try:
+        import cv2 # Installed with paddleocr
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    except ImportError:
+        import io
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as img:
+            return np.ascontiguousarray(np.asarray(img.convert("RGB"))[:, :, ::-1])
+
+
+# --- OCR in worker processes ---
+# Each worker reports its pid, RSS and job count with every result. With a
+# RecyclePolicy (memory_watchdog.py), a worker past its job count or memory ceiling
+# gets the pool restarted: new calls wait while the running ones finish, then the
+# old processes exit (taking their memory with them) and fresh ones are started.
+# A worker that dies (OOM kill, crash in Paddle) breaks the whole executor; the
+# pool is restarted the same way and the photo is tried once more.
+_worker_engine = None
+_worker_jobs = 0
+
+
+def _init_ocr_worker(det_model_dir, rec_model_dir, cls_model_dir, budget, slots):
+    global _worker_engine
+    with slots.get_lock():
+        slot = slots.value
+        slots.value += 1
+    cpu_threads = budget.apply(slot) # Before paddle is imported
+    from ocr_service import create_ocr_engine
+    _worker_engine = create_ocr_engine(det_model_dir, rec_model_dir, cls_model_dir, cpu_threads=cpu_threads)
+
+
+def _ocr_shared_image(handle):
+    """OCR lines of a shared image, with (pid, RSS, jobs done) of the worker that read it."""
+    global _worker_jobs
+    from memory_watchdog import rss_bytes
+    from ocr_service import run_ocr
+    with open_image(handle) as image:
+        lines = [(text, float(conf)) for text, conf in run_ocr(_worker_engine, image)]
+    _worker_jobs += 1
+    return lines, (os.getpid(), rss_bytes(), _worker_jobs)
+
+
+class SharedMemoryOcr:
+    """
+    bytes -> OCR lines, recognised by `processes` worker processes (one engine each).
+    Meant as BatchPipeline's `read_ocr_lines` with `ocr_workers=processes`: each calling
+    thread decodes its photo, hands it over through shared memory and waits for the lines.
+    The cores are shared out by a thread_budget.ThreadBudget (by default: evenly, one core
+    kept for the main process). `recycle` is a memory_watchdog.RecyclePolicy (see above).
+    """
+
+    def __init__(self, processes, det_model_dir, rec_model_dir, cls_model_dir, budget=None,
+                 recycle=None, watchdog=None):
+        from thread_budget import ThreadBudget
+        self.processes = processes
+        self.model_dirs = (det_model_dir, rec_model_dir, cls_model_dir)
+        self.budget = budget or ThreadBudget(processes, reserve=1)
+        self.recycle = recycle
+        self.watchdog = watchdog
+        self.transport = SharedImageTransport()
+        self._condition = threading.Condition()
+        self._running = 0 # Calls submitted to the current pool and not yet returned
+        self._restarting = False
+        self.generation = 0
+        self.pool = self._start_pool()
+
+    def _start_pool(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # Spawned, never forked: the parent may already run threads and have Paddle/OpenMP loaded,
+        # and a forked child would inherit that state (deadlocks, thread limits set too late)
+        context = multiprocessing.get_context("spawn")
+        slots = context.Value("i", 0) # Hands each worker its number, for pinning
+        return ProcessPoolExecutor(self.processes, mp_context=context, initializer=_init_ocr_worker,
+                                   initargs=(*self.model_dirs, self.budget, slots))
+
+    def __call__(self, data):
+        handle = self.transport.put(decode_image(data))
+        try:
+            lines, worker, generation = self._run(handle)
+            if worker is None: # A worker died (killed for memory, crashed in Paddle): the pool is unusable
+                print("Warning: An OCR worker process died; restarting the OCR processes and retrying the photo.")
+                self._replace_pool(generation)
+                lines, worker, generation = self._run(handle)
+                if worker is None:
+                    self._replace_pool(generation) # For the photos after this one
+                    from concurrent.futures.process import BrokenProcessPool
+                    raise BrokenProcessPool("An OCR worker process died twice on this photo")
+        finally:
+            self.transport.release(handle)
+        self._watch(generation, *worker)
+        return lines
+
+    def _run(self, handle):
+        """(lines, (pid, rss, jobs), generation) from the current pool; (None, None, generation) if it broke."""
+        from concurrent.futures.process import BrokenProcessPool
+        with self._condition:
+            while self._restarting:
+                self._condition.wait()
+            pool, generation = self.pool, self.generation
+            self._running += 1
+        try:
+            lines, worker = pool.submit(_ocr_shared_image, handle).result()
+            return lines, worker, generation
+        except BrokenProcessPool:
+            return None, None, generation
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    def _watch(self, generation, pid, rss, jobs):
+        from memory_watchdog import WATCHDOG
+        watchdog = self.watchdog or WATCHDOG
+        watchdog.update_worker(f"ocr-{pid}", pid, rss, jobs)
+        reason = self.recycle.reason(jobs, rss) if self.recycle else None
+        if reason and self._replace_pool(generation):
+            watchdog.recycled(f"OCR processes (ocr-{pid})", reason, jobs, rss)
+
+    def _replace_pool(self, generation):
+        """
+        Replaces pool `generation` with fresh processes once no call is running on it. False if another
+        caller replaced (or is replacing) it already.
+        """
+        from memory_watchdog import WATCHDOG
+        watchdog = self.watchdog or WATCHDOG
+        with self._condition:
+            if generation != self.generation or self._restarting:
+                return False
+            self._restarting = True
+            while self._running:
+                self._condition.wait()
+            try:
+                self.pool.shutdown(wait=True)
+                for label in [label for label in list(watchdog.workers) if label.startswith("ocr-")]:
+                    watchdog.forget_worker(label)
+                self.pool = self._start_pool()
+                self.generation += 1
+            finally:
+                self._restarting = False
+                self._condition.notify_all()
+        return True
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.transport.close()
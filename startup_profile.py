@@ -0,0 +1,105 @@
+import sys
+import time
+import importlib.abc
+
+# --- Startup profiling (--profile-startup) ---
+# A built-in equivalent of `python -X importtime` that also works inside the
+# PyInstaller one-file build, where interpreter flags cannot be passed.
+# install() must run before the imports that should be measured.
+
+# Budget for a cold start of main-pack.py, from its first line to the main
+# window being drawn. Model loading is deferred until first OCR and is not part
+# of it. The one-file exe additionally pays PyInstaller's extraction of the
+# bundle to a temp folder, which depends on disk speed, not on our code.
+STARTUP_BUDGET_SECONDS = 1.5
+
+
+class _TimingLoader(importlib.abc.Loader):
+    """Wraps a module's real loader and records how long executing it took."""
+
+    def __init__(self, loader, name, recorder):
+        self._loader = loader
+        self._name = name
+        self._recorder = recorder
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._recorder.enter()
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._recorder.leave(self._name, time.perf_counter() - start)
+
+    def __getattr__(self, attr):
+        # get_resource_reader, get_source, is_package... go to the real loader
+        return getattr(self._loader, attr)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """Meta path hook recording self and cumulative import time per module."""
+
+    def __init__(self):
+        self.records = []  # (name, self seconds, cumulative seconds, depth), in import order
+        self._child_time = [0.0]
+        self._finding = False
+
+    def find_spec(self, name, path, target=None):
+        if self._finding:
+            return None
+        self._finding = True
+        try:
+            spec = None
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+        finally:
+            self._finding = False
+        if spec is not None and spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimingLoader(spec.loader, name, self)
+        return spec
+
+    def enter(self):
+        self._child_time.append(0.0)
+
+    def leave(self, name, cumulative):
+        children = self._child_time.pop()
+        self._child_time[-1] += cumulative
+        self.records.append((name, cumulative - children, cumulative, len(self._child_time) - 1))
+
+    def report(self, limit=30, out=None):
+        out = out or sys.stdout
+        total = sum(cumulative for _, _, cumulative, depth in self.records if depth == 0)
+        print(f"import time: {len(self.records)} modules, {total * 1000:.1f} ms in top-level imports", file=out)
+        print(f"{'self [ms]':>10} | {'cumulative':>10} | imported package", file=out)
+        ranked = sorted((r for r in self.records if r[3] == 0), key=lambda r: -r[2])
+        for name, self_time, cumulative, _ in ranked[:limit]:
+            print(f"{self_time * 1000:10.1f} | {cumulative * 1000:10.1f} | {name}", file=out)
+
+
+_timer = None
+
+
+def install():
+    """Starts recording imports. Safe to call more than once."""
+    global _timer
+    if _timer is None:
+        _timer = ImportTimer()
+        sys.meta_path.insert(0, _timer)
+    return _timer
+
+
+def report_startup(started_at, label="startup", out=None):
+    """Prints the import report and the elapsed time since `started_at` (a perf_counter value)."""
+    out = out or sys.stdout
+    elapsed = time.perf_counter() - started_at
+    if _timer is not None:
+        _timer.report(out=out)
+    status = "OK" if elapsed <= STARTUP_BUDGET_SECONDS else "OVER BUDGET"
+    print(f"{label}: {elapsed:.3f}s (budget {STARTUP_BUDGET_SECONDS:.1f}s) {status}", file=out)
+    return elapsed
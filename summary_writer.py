@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+
+# --- Summary workbook ---
+# The office wants one spreadsheet listing every inspected vehicle. It is exported
+# from the inspection history (inspection_history.py), which the GUI, watch and batch
+# modes already append to, with openpyxl's write-only mode: rows are streamed from
+# the database straight into the file, so memory stays flat however many reports
+# there are. The workbook is rebuilt rather than edited in place (openpyxl can only
+# append to a workbook it holds entirely in memory); 50,000 rows take about 7 seconds
+# and 16 MB. Written to a temporary file first, so Excel never sees a half-written one.
+# Because every rebuild costs the whole history, the GUI's SummaryUpdater rebuilds at
+# most once per MIN_REBUILD_SECONDS: reports confirmed meanwhile are folded into the
+# next rebuild, and a last one runs when the window closes.
+
+SUMMARY_FILENAME = "檢查總表.xlsx"
+MIN_REBUILD_SECONDS = 30
+SUMMARY_HEADER = ["檢查日期", "車牌", "車編", "車種", "地址", "報告檔名", "產生時間", "來源"]
+COLUMN_WIDTHS = [14, 12, 8, 14, 32, 36, 20, 8]
+
+
+def _summary_row(row, plate_map):
+    from ocr_service import lookup_code
+    # Reports made without a code (e.g. a plate typed by hand) get it from the mapping
+    code = row["code"] or lookup_code(plate_map, row["plate"])
+    return [row["inspection_date"] or row["inspection_day"], row["plate"], code, row["truck_type"],
+            row["address"], os.path.basename(row["output_path"] or ""), row["created_at"].replace("T", " "),
+            row["source"]]
+
+
+def write_summary(history, path, plate_map=None, first_day=None, last_day=None):
+    """Exports the history (optionally between two YYYY-MM-DD days) to `path`. Returns the row count."""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("檢查紀錄")
+    for index, width in enumerate(COLUMN_WIDTHS):
+        sheet.column_dimensions[chr(ord("A") + index)].width = width
+    sheet.freeze_panes = "A2"
+    sheet.append(SUMMARY_HEADER)
+    count = 0
+    for row in history.iter_inspections(first_day, last_day):
+        sheet.append(_summary_row(row, plate_map))
+        count += 1
+
+    tmp_path = path + ".tmp"
+    try:
+        workbook.save(tmp_path)
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return count
+
+
+def write_summary_safely(history, output_dir, plate_map=None):
+    """Rebuilds output/檢查總表.xlsx; a problem is printed but never fails the run itself."""
+    if history is None:
+        return None
+    path = os.path.join(output_dir, SUMMARY_FILENAME)
+    start = time.perf_counter()
+    try:
+        count = write_summary(history, path, plate_map)
+    except Exception as e:
+        print(f"Warning: Could not write summary workbook {path}: {e}")
+        return None
+    print(f"總表已更新: {path} ({count} 筆, {time.perf_counter() - start:.1f}s)")
+    return path
+
+
+class SummaryUpdater:
+    """
+    Keeps the summary workbook current from the GUI: request() after each report, and a
+    background thread rebuilds it, at most once per `min_interval` seconds. Requests made
+    while a rebuild runs or waits are folded into one. close() runs the pending rebuild now.
+    """
+
+    def __init__(self, output_dir, plate_map_for=lambda: None, min_interval=MIN_REBUILD_SECONDS):
+        self.output_dir = output_dir
+        self.plate_map_for = plate_map_for  # Called per rebuild: the mapping may be reloaded meanwhile
+        self.min_interval = min_interval
+        self.history = None
+        self._condition = threading.Condition()
+        self._pending = False
+        self._closing = False
+        self._next_rebuild = 0.0  # time.monotonic() before which no rebuild starts
+        self._thread = None
+
+    def request(self, history):
+        if history is None:
+            return
+        with self._condition:
+            self.history = history
+            self._pending = True
+            if self._thread is None and not self._closing:
+                self._thread = threading.Thread(target=self._run, name="summary-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def close(self, timeout=None):
+        """Writes a pending rebuild without waiting out the interval, then stops the thread."""
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closing)
+                if not self._pending:
+                    return
+                self._condition.wait_for(lambda: self._closing, self._next_rebuild - time.monotonic())
+                self._pending = False
+                history = self.history
+            write_summary_safely(history, self.output_dir, self.plate_map_for())
+            self._next_rebuild = time.monotonic() + self.min_interval
@@ -0,0 +1,102 @@
+import json
+import os
+
+from batch_journal import JOURNAL_FILENAME, LAST_JOURNAL_FILENAME, BatchJournal
+from ocr_engine_pool import EnginePoolTimeout
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def interrupted_journal(output_dir, input_dir):
+    """A run that OCR'd one photo and finished one report before it stopped."""
+    journal = BatchJournal(output_dir, input_dir)
+    journal.ocr_done("hash-a", [("KEL-0283", 0.95)])
+    journal.plan("a.docx", "a_1.jpg", "a_2.jpg")
+    journal.completed("a.docx", "fingerprint-a")
+    journal.close()
+    return journal.path
+
+
+def test_resumes_an_interrupted_run(tmp_path):
+    interrupted_journal(str(tmp_path), str(tmp_path / "photos"))
+    journal = BatchJournal(str(tmp_path), str(tmp_path / "photos"))
+    assert journal.resumed
+    assert journal.ocr_lines == {"hash-a": [("KEL-0283", 0.95)]}
+    assert journal.done == {"a.docx": "fingerprint-a"}
+    journal.close()
+
+
+def test_torn_last_line_is_cut_off(tmp_path):
+    path = interrupted_journal(str(tmp_path), str(tmp_path / "photos"))
+    good_size = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(b'{"event": "done", "report": "b.docx", "finger')  # Crash in the middle of a write
+
+    journal = BatchJournal(str(tmp_path), str(tmp_path / "photos"))
+    assert journal.resumed
+    assert "b.docx" not in journal.done
+    assert os.path.getsize(path) == good_size
+    # Records appended after the recovery are whole lines again
+    journal.completed("b.docx", "fingerprint-b")
+    journal.close()
+    assert read_records(path)[-1] == {"event": "done", "report": "b.docx", "fingerprint": "fingerprint-b"}
+    assert BatchJournal(str(tmp_path), str(tmp_path / "photos")).done == {
+        "a.docx": "fingerprint-a", "b.docx": "fingerprint-b"}
+
+
+def test_line_without_newline_is_torn_even_if_it_parses(tmp_path):
+    path = interrupted_journal(str(tmp_path), str(tmp_path / "photos"))
+    with open(path, "ab") as f:
+        f.write(b'{"event": "done", "report": "b.docx", "fingerprint": "x"}')
+    journal = BatchJournal(str(tmp_path), str(tmp_path / "photos"))
+    assert "b.docx" not in journal.done
+    journal.close()
+
+
+def test_journal_of_another_folder_is_moved_aside(tmp_path):
+    interrupted_journal(str(tmp_path), str(tmp_path / "photos"))
+    journal = BatchJournal(str(tmp_path), str(tmp_path / "other"))
+    assert not journal.resumed and journal.done == {}
+    assert os.path.exists(tmp_path / LAST_JOURNAL_FILENAME)
+    journal.close()
+
+
+def test_finished_run_starts_afresh(tmp_path):
+    journal = BatchJournal(str(tmp_path), str(tmp_path / "photos"))
+    journal.completed("a.docx", "fingerprint-a")
+    journal.finish("1 rebuilt")
+    assert not os.path.exists(tmp_path / JOURNAL_FILENAME)
+    journal = BatchJournal(str(tmp_path), str(tmp_path / "photos"))
+    assert not journal.resumed and journal.done == {}
+    journal.close()
+
+
+def test_only_photo_failures_are_recorded(tmp_path):
+    journal = BatchJournal(str(tmp_path), str(tmp_path / "photos"))
+    assert journal.ocr_failed("hash-a", ValueError("cannot identify image file")) is True
+    assert journal.ocr_failed("hash-b", EnginePoolTimeout("no engine free")) is False
+    assert journal.ocr_failed(None, ValueError("no digest")) is False
+    journal.close()
+    journal = BatchJournal(str(tmp_path), str(tmp_path / "photos"))
+    assert journal.ocr_errors == {"hash-a": "cannot identify image file"}
+    journal.close()
+
+
+def test_watch_journal_keeps_fields_and_claimed_reports(tmp_path):
+    journal = BatchJournal(str(tmp_path), str(tmp_path / "photos"), "watch_journal.jsonl")
+    journal.fields_done("hash-a", {"plate": "KEL-0283", "address": "", "date": ""})
+    journal.fields_done("hash-b", {"error": "OCR 處理失敗"})  # Retried after a restart
+    journal.plan("2025-03-03/a.docx", "/photos/a_1.jpg", "/photos/a_2.jpg")
+    journal.close()
+    assert not os.path.exists(tmp_path / JOURNAL_FILENAME)  # Separate from a batch run's journal
+
+    journal = BatchJournal(str(tmp_path), str(tmp_path / "photos"), "watch_journal.jsonl")
+    assert journal.resumed
+    assert journal.fields == {"hash-a": {"plate": "KEL-0283", "address": "", "date": ""}}
+    assert journal.planned == {"2025-03-03/a.docx": ["a_1.jpg", "a_2.jpg"]}
+    journal.close()
+    BatchJournal(str(tmp_path), str(tmp_path / "other"), "watch_journal.jsonl").close()
+    assert os.path.exists(tmp_path / "watch_journal.last.jsonl")
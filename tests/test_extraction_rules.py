@@ -0,0 +1,140 @@
+import pytest
+
+from extraction_rules import (DEFAULT_MATCHER, FieldMatcher, format_plate_entry, parse_mapping_cell,
+                              parse_plate_entry)
+
+
+# --- FieldMatcher ---
+def candidates(result, field):
+    return [(c.value, c.rule, c.score, c.line_index) for c in result.candidates[field]]
+
+
+def test_one_scan_finds_every_field():
+    result = DEFAULT_MATCHER.extract(["114年3月3日 健行路530號", "KEL-0283"])
+    assert result.best("date") == "114年3月3日"
+    assert result.best("address") == "健行路530號"
+    assert result.best("plate") == "KEL-0283"
+
+
+def test_rule_score_ranks_before_confidence():
+    result = DEFAULT_MATCHER.extract([("862-UB", 0.99), ("KEL-0283", 0.60)])
+    assert result.ranked("plate") == ["KEL-0283", "862-UB"]
+
+
+def test_confidence_ranks_within_a_rule():
+    result = DEFAULT_MATCHER.extract([("KEL-0283", 0.60), ("ABC-1234", 0.95)])
+    assert result.ranked("plate") == ["ABC-1234", "KEL-0283"]
+
+
+def test_earlier_line_wins_a_tie():
+    result = DEFAULT_MATCHER.extract([("ABC-1234", 0.9), ("KEL-0283", 0.9)])
+    assert result.ranked("plate") == ["ABC-1234", "KEL-0283"]
+
+
+def test_boost_lifts_a_known_plate():
+    known = {"862-UB"}
+    result = DEFAULT_MATCHER.extract([("KEL-0283", 0.9), ("862-UB", 0.9)],
+                                     boost=lambda field, value: 5 if field == "plate" and value in known else 0)
+    assert candidates(result, "plate")[0] == ("862-UB", "digits_letters2", 13, 1)
+
+
+def test_duplicates_keep_their_first_line():
+    result = DEFAULT_MATCHER.extract([("kel 0283", 0.5), ("KEL-0283", 0.9)])
+    assert candidates(result, "plate") == [("KEL-0283", "letters3_digits", 10, 0)]
+
+
+def test_fields_limits_what_is_collected():
+    result = DEFAULT_MATCHER.extract(["114年3月3日 健行路530號 KEL-0283"], fields=("plate",))
+    assert set(result.candidates) == {"plate"}
+    assert result.best("date") == ""
+
+
+def test_matches_map_back_to_their_line():
+    lines = [("健行路530號", 0.7), ("", 0.1), ("雜訊", 0.2), ("114年3月3日", 0.8), ("KEL-0283", 0.95)]
+    result = DEFAULT_MATCHER.extract(lines)
+    line_of = {c.field: (c.line_index, c.confidence) for ranked in result.candidates.values() for c in ranked}
+    assert line_of == {"address": (0, 0.7), "date": (3, 0.8), "plate": (4, 0.95)}
+
+
+@pytest.mark.parametrize("line, plate, rule", [
+    ("KEL-0283", "KEL-0283", "letters3_digits"),
+    ("kel 0283", "KEL-0283", "letters3_digits"),
+    ("ABC-123", "ABC-123", "letters3_digits"),
+    ("ABC123", "ABC123", "letters3_digits"),
+    ("862-UB", "862-UB", "digits_letters2"),
+    ("116UX", "116UX", "digits_letters2"),
+    ("045-Q3", "045-Q3", "digits_alnum"),
+    ("045Q3", "045Q3", "digits_alnum"),
+    ("045 Q3", "045-Q3", "digits_alnum"),
+    ("3202D3", "3202D3", "digits_alnum"),
+    ("AB-1234", "AB-1234", "letters2_digits"),
+])
+def test_plate_formats(line, plate, rule):
+    assert candidates(DEFAULT_MATCHER.extract([line]), "plate")[0][:2] == (plate, rule)
+
+
+def test_plate_must_not_be_glued_to_other_characters():
+    assert DEFAULT_MATCHER.extract(["XKEL-02839"]).ranked("plate") == []
+
+
+def test_weaker_address_rule_is_a_fallback():
+    result = DEFAULT_MATCHER.extract(["中山路一段", "健行路530號"])
+    assert candidates(result, "address") == [("健行路530號", "street_number", 10, 1),
+                                             ("中山路一段", "street_only", 3, 0)]
+
+
+def test_custom_rule_table():
+    matcher = FieldMatcher({"plate": {"rules": [{"name": "digits_only", "pattern": r"\d{4}", "score": 1}]}})
+    assert matcher.fields == ("plate",)
+    result = matcher.extract(["KEL-0283"])
+    assert candidates(result, "plate") == [("0283", "digits_only", 1, 0)]
+
+
+# --- Plate entry and mapping cells ---
+@pytest.mark.parametrize("text, expected", [
+    ("KEL-0283(202)", ("KEL-0283", "202")),
+    ("KEL0283(202)", ("KEL0283", "202")),    # No hyphen: kept as typed
+    ("kel-0283 （202）", ("KEL-0283", "202")),  # Full-width brackets, lower case
+    ("X(202)", ("X", "202")),
+    ("  KEL-0283  ", ("KEL-0283", None)),
+    ("KEL-0283()", ("KEL-0283()", None)),     # Empty code: not split
+])
+def test_parse_plate_entry(text, expected):
+    assert parse_plate_entry(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "   ", None])
+def test_parse_plate_entry_blank(text):
+    assert parse_plate_entry(text) == ("", None)
+
+
+@pytest.mark.parametrize("plate, code, expected", [
+    ("KEL-0283", "202", "KEL-0283(202)"),
+    ("KEL0283", "202", "KEL0283(202)"),
+    ("X", "202", "X(202)"),
+    ("KEL-0283", None, "KEL-0283"),
+    ("", "202", ""),
+    (None, None, ""),
+])
+def test_format_plate_entry(plate, code, expected):
+    assert format_plate_entry(plate, code) == expected
+
+
+@pytest.mark.parametrize("entry", ["KEL-0283(202)", "KEL0283(202)", "X(202)"])
+def test_format_inverts_parse(entry):
+    assert format_plate_entry(*parse_plate_entry(entry)) == entry
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("KEL-0283(202)", ("KEL-0283", "202")),
+    ("KEL0283（202）", ("KEL0283", "202")),
+    ("abc-12 (5)", ("ABC-12", "5")),
+    ("X(202)", ("X", "202")),
+])
+def test_parse_mapping_cell(text, expected):
+    assert parse_mapping_cell(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "   ", "KEL-0283", "(202)", "202\n(KEL-0283)"])
+def test_parse_mapping_cell_no_match(text):
+    assert parse_mapping_cell(text) is None
@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from job_scheduler import BATCH, INTERACTIVE, JobScheduler, describe_wait
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = JobScheduler(workers=1, name="test")
+    yield scheduler
+    scheduler.shutdown(wait=True, cancel_queued=True)
+
+
+def hold(scheduler):
+    """Occupies the only worker until the returned event is set."""
+    release, running = threading.Event(), threading.Event()
+
+    def blocker():
+        running.set()
+        release.wait(TIMEOUT)
+        return "blocker"
+
+    job = scheduler.submit(blocker, priority=BATCH)
+    assert running.wait(TIMEOUT)
+    return release, job
+
+
+def test_interactive_runs_before_queued_batch_jobs_and_batch_by_cost(scheduler):
+    release, blocker = hold(scheduler)
+    order = []
+    jobs = [scheduler.submit(order.append, "small", cost=0.5),
+            scheduler.submit(order.append, "large", cost=12.0),
+            scheduler.submit(order.append, "medium", cost=3.0),
+            scheduler.submit(order.append, "operator", priority=INTERACTIVE, cost=12.0),
+            scheduler.submit(order.append, "medium, later", cost=3.0)]
+    assert scheduler.pending() == 5 and scheduler.pending(INTERACTIVE) == 1
+    release.set()
+    for job in jobs:
+        job.result(TIMEOUT)
+    assert blocker.result(TIMEOUT) == "blocker"
+    assert order == ["operator", "large", "medium", "medium, later", "small"]
+
+
+def test_interactive_jobs_keep_their_order(scheduler):
+    release, _ = hold(scheduler)
+    order = []
+    jobs = [scheduler.submit(order.append, name, priority=INTERACTIVE, cost=cost)
+            for name, cost in (("first", 0.5), ("second", 12.0), ("third", 3.0))]
+    release.set()
+    for job in jobs:
+        job.result(TIMEOUT)
+    assert order == ["first", "second", "third"]
+
+
+def test_cancelled_job_is_skipped(scheduler):
+    release, blocker = hold(scheduler)
+    order = []
+    kept = scheduler.submit(order.append, "kept")
+    dropped = scheduler.submit(order.append, "dropped", cost=12.0)
+    assert dropped.cancel()
+    assert scheduler.pending() == 1
+    assert "queued: 0 interactive, 1 batch" in scheduler.describe()
+    release.set()
+    kept.result(TIMEOUT)
+    assert order == ["kept"]
+    assert dropped.future.cancelled()
+    assert not blocker.cancel()  # Already ran
+
+
+def test_running_job_cannot_be_cancelled(scheduler):
+    release, job = hold(scheduler)
+    assert not job.cancel()
+    assert scheduler.position(job) is None
+    release.set()
+    assert job.result(TIMEOUT) == "blocker"
+    assert job.elapsed() >= 0
+
+
+def test_position_and_wait_of_a_queued_job(scheduler):
+    release, _ = hold(scheduler)
+    big = scheduler.submit(lambda: None, cost=12.0)
+    small = scheduler.submit(lambda: None, cost=1.0)
+    operator = scheduler.submit(lambda: None, priority=INTERACTIVE)
+    assert scheduler.position(operator) == 1  # Only the running job
+    assert scheduler.position(big) == 2
+    assert scheduler.position(small) == 3
+    assert scheduler.estimated_wait(small) > scheduler.estimated_wait(big)
+    assert describe_wait(scheduler, small).startswith("排隊中：前面還有 3 項")
+    release.set()
+    small.result(TIMEOUT)
+    assert describe_wait(scheduler, small) is None
+
+
+def test_errors_reach_the_caller_and_the_worker_keeps_going(scheduler):
+    def fail():
+        raise ValueError("bad photo")
+
+    failed = scheduler.submit(fail)
+    with pytest.raises(ValueError, match="bad photo"):
+        failed.result(TIMEOUT)
+    assert scheduler.submit(lambda: 42).result(TIMEOUT) == 42
+
+
+def test_shutdown_cancels_queued_jobs(scheduler):
+    release, blocker = hold(scheduler)
+    queued = scheduler.submit(lambda: None)
+    scheduler.shutdown(wait=False, cancel_queued=True)
+    assert queued.future.cancelled()
+    release.set()  # The running job still finishes
+    assert blocker.result(TIMEOUT) == "blocker"
+    with pytest.raises(RuntimeError):
+        scheduler.submit(lambda: None)
+
+
+def test_shutdown_runs_what_is_queued_by_default():
+    scheduler = JobScheduler(workers=1)
+    release, _ = hold(scheduler)
+    order = []
+    scheduler.submit(order.append, "queued")
+    release.set()
+    scheduler.shutdown(wait=True)
+    assert order == ["queued"]
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+from photo_pairing import PhotoInfo, _order, pair_photos
+
+T0 = datetime(2025, 3, 3, 8, 0, 0)
+PHOTO_ONE = {"address": "台北市信義區", "date": "114年03月03日"}
+PHOTO_TWO = {"plate": "KEL-0283"}
+
+
+def pair(paths, taken, ocr=None, **options):
+    """pair_photos with capture times given as seconds after T0 (None: no EXIF time)."""
+    times = {path: None if seconds is None else T0 + timedelta(seconds=seconds) for path, seconds in taken.items()}
+    return pair_photos(paths, ocr, read_time=times.get, **options)
+
+
+def as_names(result):
+    return sorted((p.photo1.path, p.photo2.path, p.method) for p in result.pairs)
+
+
+def test_filename_pass():
+    paths = ["202_1.jpg", "202_2.jpg", "206.jpg", "206-.jpg"]
+    result = pair(paths, dict.fromkeys(paths))
+    assert as_names(result) == [("202_1.jpg", "202_2.jpg", "filename"), ("206-.jpg", "206.jpg", "filename")]
+    assert not result.unpaired and not result.ambiguous
+
+
+def test_filename_pass_orders_by_ocr_role():
+    paths = ["202_1.jpg", "202_2.jpg"]
+    result = pair(paths, dict.fromkeys(paths), {"202_1.jpg": PHOTO_TWO, "202_2.jpg": PHOTO_ONE})
+    assert as_names(result) == [("202_2.jpg", "202_1.jpg", "filename")]
+
+
+def test_filename_pass_same_code_three_times_is_ambiguous():
+    paths = ["202.jpg", "202-.jpg", "202_2.jpg"]
+    result = pair(paths, dict.fromkeys(paths))
+    assert result.pairs == []
+    assert [sorted(paths) for paths, _ in result.ambiguous] == [sorted(paths)]
+
+
+def test_filename_pass_skips_conflicting_dates():
+    paths = ["202_1.jpg", "202_2.jpg"]
+    ocr = {"202_1.jpg": {"date": "114年03月03日"}, "202_2.jpg": {"date": "114年03月04日"}}
+    result = pair(paths, {"202_1.jpg": 0, "202_2.jpg": 10}, ocr)
+    assert result.pairs == []
+    assert result.ambiguous == [(["202_1.jpg", "202_2.jpg"], "OCR dates differ")]
+
+
+def test_ocr_pass_takes_the_closest_photo_one():
+    paths = ["IMG_0001.jpg", "IMG_0002.jpg", "IMG_0003.jpg"]
+    taken = {"IMG_0001.jpg": 0, "IMG_0002.jpg": 100, "IMG_0003.jpg": 110}
+    ocr = {"IMG_0001.jpg": PHOTO_ONE, "IMG_0002.jpg": PHOTO_ONE, "IMG_0003.jpg": PHOTO_TWO}
+    result = pair(paths, taken, ocr)
+    assert as_names(result) == [("IMG_0002.jpg", "IMG_0003.jpg", "ocr")]
+    assert result.unpaired == ["IMG_0001.jpg"]
+
+
+def test_ocr_pass_respects_the_window():
+    paths = ["IMG_0001.jpg", "IMG_0002.jpg"]
+    result = pair(paths, {"IMG_0001.jpg": 0, "IMG_0002.jpg": 300},
+                  {"IMG_0001.jpg": PHOTO_ONE, "IMG_0002.jpg": PHOTO_TWO}, window_seconds=120)
+    assert result.pairs == []
+    assert sorted(result.unpaired) == paths
+
+
+def test_time_pass_splits_bursts():
+    paths = ["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg", "f.jpg", "g.jpg"]
+    # a+b is a pair, c is alone, d+e+f is one burst (d-e and e-f within the window), g has no time
+    taken = {"a.jpg": 0, "b.jpg": 30, "c.jpg": 1000, "d.jpg": 2000, "e.jpg": 2100, "f.jpg": 2200, "g.jpg": None}
+    result = pair(paths, taken, window_seconds=120)
+    assert as_names(result) == [("a.jpg", "b.jpg", "time")]
+    assert sorted(result.unpaired) == ["c.jpg", "g.jpg"]
+    assert [paths for paths, _ in result.ambiguous] == [["d.jpg", "e.jpg", "f.jpg"]]
+
+
+def test_time_pass_orders_by_capture_time():
+    result = pair(["late.jpg", "early.jpg"], {"late.jpg": 60, "early.jpg": 0})
+    assert as_names(result) == [("early.jpg", "late.jpg", "time")]
+
+
+def test_order_puts_the_plate_photo_second():
+    one = PhotoInfo("b.jpg", T0 + timedelta(seconds=50), "b", PHOTO_ONE)
+    two = PhotoInfo("a.jpg", T0, "a", PHOTO_TWO)
+    assert _order(two, one) == (one, two)
+    assert _order(one, two) == (one, two)
+
+
+def test_ocr_errors_carry_no_role():
+    photo = PhotoInfo("a.jpg", T0, "a", {"plate": "KEL-0283", "error": "corrupt"})
+    assert photo.role is None and photo.plate == ""
@@ -0,0 +1,123 @@
+import pytest
+
+from vehicle_registry import load_vehicle_registry, normalize_truck_type, parse_cell_rows, VehicleRegistry
+
+openpyxl = pytest.importorskip("openpyxl")
+
+
+def write_workbook(path, sheets):
+    """sheets: [(name, rows)], in workbook order."""
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for name, rows in sheets:
+        sheet = workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+TIRE_SHEET = ("輪胎表", [
+    ["北區清潔隊車輛輪胎規格表"],  # Title row above the header
+    ["車編", "車牌號碼", "輪胎規格", "車種", "車編", "車牌號碼", "輪胎規格"],
+    [200, "KEU-3137", "205/85R16", "壓縮式垃圾車", 241, "116-UX", "10.00R20"],
+    [201.0, "kee-6307", "前:195/70R15\r\n後:145R13", "資源回收車", 242, None, "11R22.5"],  # No plate: skipped
+    [202, "KEL-0283", None, "回收車", None, None, None],
+])
+
+
+@pytest.fixture
+def registry(tmp_path):
+    path = write_workbook(tmp_path / "mapping.xlsx", [
+        TIRE_SHEET,
+        ("工作表1", [[200, "(", "KEU-3137", ")", "200(KEU-3137)"], ["265\n(262-UP)"]]),
+        # Read first although it is the last sheet: its codes win
+        ("1.2級車牌複製用", [["KEL-0283(212)", "KEU-3137(200)"], ["045Q3(299)"]]),
+    ])
+    return load_vehicle_registry(path)
+
+
+def test_table_groups_side_by_side(registry):
+    assert registry.by_plate("KEU-3137").tire_spec == "205/85R16"
+    assert registry.by_plate("116-UX").tire_spec == "10.00R20"
+    assert registry.by_code("242") is None
+
+
+def test_numeric_code_and_lower_case_plate(registry):
+    record = registry.by_code("201")
+    assert record.plate == "KEE-6307"
+    assert record.tire_spec == "前:195/70R15\n後:145R13"
+
+
+def test_truck_type_column(registry):
+    assert registry.truck_type_for("KEU3137") == "壓縮式垃圾車"
+    assert registry.truck_type_for("kee 6307") == "資源回收車"
+    assert registry.truck_type_for("116-UX") is None  # Group without a 車種 column
+    assert registry.truck_type_for("ZZZ-0000") is None
+
+
+def test_plate_code_and_code_plate_cells(registry):
+    assert registry.by_plate("262-UP").code == "265"
+    assert registry.by_plate("045Q3").code == "299"
+
+
+def test_priority_sheet_wins_a_conflict(registry):
+    assert registry.by_plate("KEL-0283").code == "212"
+    assert registry.by_code("202") is None
+    assert any("KEL-0283 is listed as 202, keeping 212" in problem for _, problem in registry.conflicts)
+    # The table still fills in what the first sheet did not know
+    assert registry.by_plate("KEL-0283").truck_type == "資源回收車"
+
+
+def test_plate_map_has_both_spellings(registry):
+    mapping = registry.plate_map()
+    assert mapping["KEU-3137"] == mapping["KEU3137"] == "200"
+
+
+def test_header_without_plate_column_falls_back_to_cells(tmp_path):
+    path = write_workbook(tmp_path / "mapping.xlsx", [
+        ("輪胎表", [["車編", "輪胎規格"], [200, "205/85R16"], ["KEU-3137(200)", None]]),
+    ])
+    registry = load_vehicle_registry(path)
+    assert len(registry) == 1
+    assert registry.by_plate("KEU-3137").tire_spec is None
+
+
+def test_workbook_without_type_column(tmp_path, capsys):
+    path = write_workbook(tmp_path / "mapping.xlsx", [("工作表1", [["200(KEU-3137)"]])])
+    registry = load_vehicle_registry(path)
+    assert registry.truck_type_for("KEU-3137") is None
+    assert "no 車種 column" in capsys.readouterr().out
+
+
+def test_bytes_are_parsed_instead_of_the_file(tmp_path):
+    path = write_workbook(tmp_path / "mapping.xlsx", [TIRE_SHEET])
+    with open(path, "rb") as f:
+        data = f.read()
+    assert len(load_vehicle_registry(str(tmp_path / "gone.xlsx"), data=data)) == 4
+
+
+def test_missing_or_broken_file_gives_an_empty_registry(tmp_path):
+    assert len(load_vehicle_registry(str(tmp_path / "missing.xlsx"))) == 0
+    broken = tmp_path / "broken.xlsx"
+    broken.write_bytes(b"not a workbook")
+    assert len(load_vehicle_registry(str(broken))) == 0
+
+
+def test_cells_without_brackets_are_ignored():
+    registry = VehicleRegistry()
+    parse_cell_rows([["KEU-3137", 200, None, "(", "200(KEU-3137)"]], registry)
+    assert [(r.plate, r.code) for r in registry] == [("KEU-3137", "200")]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("壓縮式垃圾車", "壓縮式垃圾車"),
+    ("資源回收車", "資源回收車"),
+    (" 回收車 ", "資源回收車"),
+    ("垃圾車", "壓縮式垃圾車"),
+    ("", None),
+    (None, None),
+    ("吊車", None),
+])
+def test_normalize_truck_type(text, expected):
+    assert normalize_truck_type(text) == expected
@@ -0,0 +1,80 @@
+import os
+
+# --- CPU thread budget ---
+# Every PaddleOCR engine runs its own math-library thread pool (cpu_threads, 10 by
+# default), and OpenMP/MKL/OpenBLAS/OpenCV add pools of their own sized to the whole
+# machine. With several OCR workers that is dozens of busy threads on a few cores,
+# and throughput falls as workers are added. ThreadBudget splits the cores once:
+#
+#   usable cores (the process affinity) - `reserve` for the main process
+#   (decoding, rendering) = the OCR share, divided evenly between the workers
+#
+# Each worker then builds its engine with cpu_threads = its share, after its
+# environment limits are set (LIMIT_VARIABLES only affect libraries loaded later,
+# so they are applied before the engine is imported) and, optionally, after it is
+# pinned to its own cores. benchmarks/bench_thread_scaling.py shows the effect.
+
+LIMIT_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                   "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+
+def usable_cores():
+    """The cores this process may run on (respects taskset / container CPU sets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pin_to_cores(cores):
+    """Restricts the calling process to `cores`. Returns False where that is not supported."""
+    if hasattr(os, "sched_setaffinity"): # Linux
+        os.sched_setaffinity(0, cores)
+        return True
+    try:
+        import psutil # Optional; the only portable way on Windows/macOS
+    except ImportError:
+        return False
+    psutil.Process().cpu_affinity(list(cores))
+    return True
+
+
+class ThreadBudget:
+    """How many math threads each of `workers` OCR engines gets, and (with `pin`) which cores."""
+
+    def __init__(self, workers=1, reserve=0, threads_per_worker=None, pin=False, cores=None):
+        self.cores = list(cores) if cores is not None else usable_cores()
+        self.workers = max(1, workers)
+        self.reserve = min(reserve, len(self.cores) - 1)
+        share = (len(self.cores) - self.reserve) // self.workers
+        self.threads_per_worker = threads_per_worker or max(1, share)
+        self.pin = pin and share >= 1 # Pinning only makes sense with at least one core per worker
+
+    def describe(self):
+        pinned = ", pinned" if self.pin else ""
+        return (f"{len(self.cores)} cores: {self.workers} OCR worker(s) x {self.threads_per_worker} thread(s)"
+                f"{pinned}, {self.reserve} reserved")
+
+    def worker_cores(self, slot):
+        """The cores of worker number `slot` (0-based): consecutive blocks after the reserved ones."""
+        ocr_cores = self.cores[self.reserve:]
+        size = max(1, len(ocr_cores) // self.workers)
+        start = (slot % self.workers) * size
+        return ocr_cores[start:start + size] or ocr_cores
+
+    def environment(self):
+        return {name: str(self.threads_per_worker) for name in LIMIT_VARIABLES}
+
+    def apply(self, slot=0):
+        """
+        Configures the calling (worker) process: thread limits, then pinning. Call before
+        the OCR engine (paddle, cv2) is imported. Returns the cpu_threads for the engine.
+        """
+        os.environ.update(self.environment())
+        if self.pin and not pin_to_cores(self.worker_cores(slot)):
+            print("Warning: Pinning OCR workers to cores is not supported here (install psutil); not pinned.")
+        try:
+            import cv2 # Installed with paddleocr; has a pool of its own
+            cv2.setNumThreads(self.threads_per_worker)
+        except ImportError:
+            pass
+        return self.threads_per_worker
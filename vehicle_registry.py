@@ -0,0 +1,217 @@
+import io
+import os
+from extraction_rules import parse_mapping_cell, parse_code_plate_cell
+from report_builder import TRUCK_TYPES
+
+# --- Vehicle registry ---
+# Everything the 車牌對照表、輪胎規格表 workbook knows about a vehicle, loaded once
+# from all of its sheets and indexed by plate and by vehicle code:
+#   輪胎表            header row with 車編 / 車牌號碼 / 輪胎規格 groups side by side
+#                     (an optional 車種 column per group selects the template)
+#   1.2級車牌複製用    PLATE(CODE) and CODE(PLATE) cells
+#   工作表1            CODE(PLATE) cells
+# Records use __slots__; both indexes are plain dicts pointing at the same records.
+
+# Sheets read first win when two sheets disagree about a plate's code.
+# 1.2級車牌複製用 is what the report file names have always used.
+PRIORITY_SHEET_NAMES = ('1.2級車牌複製用', '工作表1', 'Sheet1')
+
+CODE_HEADERS = ('車編', '車號', '編號')
+PLATE_HEADERS = ('車牌號碼', '車牌')
+TIRE_HEADERS = ('輪胎規格',)
+TYPE_HEADERS = ('車種', '車型', '車輛種類')
+HEADER_SEARCH_ROWS = 5 # Title rows above the header, e.g. "北區清潔隊車輛輪胎規格表"
+
+
+class VehicleRecord:
+    __slots__ = ("code", "plate", "tire_spec", "truck_type")
+
+    def __init__(self, code, plate, tire_spec=None, truck_type=None):
+        self.code = code
+        self.plate = plate
+        self.tire_spec = tire_spec # May span lines: "前:195/70R15\n後:145R13"
+        self.truck_type = truck_type # A TRUCK_TYPES key, or None if the workbook does not say
+
+    def __repr__(self):
+        return f"VehicleRecord({self.code!r}, {self.plate!r}, tire_spec={self.tire_spec!r}, truck_type={self.truck_type!r})"
+
+
+def normalize_plate(plate):
+    """Index key for a plate: upper case, no hyphens or spaces (KEL-0283, kel 0283 -> KEL0283)."""
+    return str(plate).upper().replace("-", "").replace(" ", "")
+
+
+def normalize_truck_type(text):
+    """Maps a 車種 cell ("壓縮式垃圾車", "回收車", ...) to a TRUCK_TYPES key, or None."""
+    if not text:
+        return None
+    text = str(text).strip()
+    if text in TRUCK_TYPES:
+        return text
+    for truck_type, (suffix, _color) in TRUCK_TYPES.items():
+        if suffix in text:
+            return truck_type
+    if "回收" in text:
+        return "資源回收車"
+    if "垃圾" in text or "壓縮" in text:
+        return "壓縮式垃圾車"
+    return None
+
+
+class VehicleRegistry:
+    """Vehicles by plate and by code, with O(1) lookups on either key."""
+
+    def __init__(self):
+        self._by_plate = {}
+        self._by_code = {}
+        self.records = []
+        self.conflicts = [] # (sheet, description)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def by_plate(self, plate):
+        return self._by_plate.get(normalize_plate(plate)) if plate else None
+
+    def by_code(self, code):
+        return self._by_code.get(str(code).strip()) if code else None
+
+    def add(self, plate, code, tire_spec=None, truck_type=None, sheet=""):
+        """Adds a vehicle or fills in what an existing record is missing."""
+        plate = str(plate).strip().upper()
+        code = str(code).strip()
+        key = normalize_plate(plate)
+        record = self._by_plate.get(key)
+        if record is None:
+            existing = self._by_code.get(code)
+            if existing is not None: # Code reused for a replacement vehicle; by_code keeps the first
+                self.conflicts.append((sheet, f"code {code} is used by both {existing.plate} and {plate}"))
+            record = VehicleRecord(code, plate)
+            self.records.append(record)
+            self._by_plate[key] = record
+            self._by_code.setdefault(code, record)
+        elif record.code != code:
+            self.conflicts.append((sheet, f"{plate} is listed as {code}, keeping {record.code}"))
+        if tire_spec and not record.tire_spec:
+            record.tire_spec = tire_spec
+        if truck_type and not record.truck_type:
+            record.truck_type = truck_type
+        return record
+
+    def plate_map(self):
+        """plate -> code, with and without hyphen, as load_license_mapping has always returned it."""
+        mapping = {}
+        for record in self.records:
+            mapping.setdefault(record.plate, record.code)
+            mapping.setdefault(record.plate.replace('-', ''), record.code)
+        return mapping
+
+    def truck_type_for(self, plate):
+        record = self.by_plate(plate)
+        return record.truck_type if record else None
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value) # 車編 typed as a number
+    return str(value).strip()
+
+
+def _find_header(rows):
+    """Returns (row index, column groups) for a 車編/車牌號碼 table, or (None, None)."""
+    for row_idx, row in enumerate(rows[:HEADER_SEARCH_ROWS]):
+        headers = [_cell_text(v) for v in row]
+        groups = []
+        for col, header in enumerate(headers):
+            if header in CODE_HEADERS:
+                groups.append({"code": col})
+            elif groups:
+                for field, names in (("plate", PLATE_HEADERS), ("tire", TIRE_HEADERS), ("type", TYPE_HEADERS)):
+                    if header in names and field not in groups[-1]:
+                        groups[-1][field] = col
+        groups = [g for g in groups if "plate" in g]
+        if groups:
+            return row_idx, groups
+    return None, None
+
+
+def parse_table_rows(rows, registry, sheet=""):
+    """Reads a sheet with 車編/車牌號碼/輪胎規格(/車種) column groups. Returns False if it has no such header."""
+    header_idx, groups = _find_header(rows)
+    if groups is None:
+        return False
+    for row in rows[header_idx + 1:]:
+        for group in groups:
+            cells = {field: _cell_text(row[col]) if col < len(row) else "" for field, col in group.items()}
+            if cells["code"] and cells["plate"]:
+                tire_spec = cells.get("tire", "").replace("\r\n", "\n") or None
+                registry.add(cells["plate"], cells["code"], tire_spec,
+                             normalize_truck_type(cells.get("type")), sheet)
+    return True
+
+
+def parse_cell_rows(rows, registry, sheet=""):
+    """Reads every PLATE(CODE) or CODE(PLATE) cell of a sheet."""
+    for row in rows:
+        for value in row:
+            text = _cell_text(value)
+            if not text or "(" not in text and "（" not in text:
+                continue
+            parsed = parse_mapping_cell(text) or parse_code_plate_cell(text)
+            if parsed:
+                registry.add(*parsed, sheet=sheet)
+
+
+def _sheet_order(sheetnames):
+    first = [n for n in PRIORITY_SHEET_NAMES if n in sheetnames]
+    return first + [n for n in sheetnames if n not in first]
+
+
+def load_vehicle_registry(filepath, data=None):
+    """
+    Loads every sheet of the mapping workbook into a VehicleRegistry. An empty registry
+    is returned (and the problem printed) if the file cannot be read.
+    If `data` (the workbook bytes) is given it is parsed instead of reading `filepath` again.
+    """
+    registry = VehicleRegistry()
+    try:
+        from openpyxl import load_workbook
+        workbook = load_workbook(io.BytesIO(data) if data is not None else filepath, read_only=True, data_only=True)
+        try:
+            for sheet_name in _sheet_order(workbook.sheetnames):
+                rows = list(workbook[sheet_name].iter_rows(values_only=True)) # A few hundred cells at most
+                if not parse_table_rows(rows, registry, sheet_name):
+                    parse_cell_rows(rows, registry, sheet_name)
+        finally:
+            workbook.close()
+
+        for sheet, problem in registry.conflicts:
+            print(f"Warning: Sheet '{sheet}': {problem}.")
+        if not registry:
+            print("Warning: No vehicles were loaded. Check file path, sheet names, and column format.")
+        else:
+            with_tires = sum(1 for r in registry if r.tire_spec)
+            with_type = sum(1 for r in registry if r.truck_type)
+            print(f"Successfully loaded {len(registry)} vehicles ({with_tires} with tire specs, {with_type} with vehicle type).")
+            if not with_type:
+                print("Note: The workbook has no 車種 column, so the template is not chosen automatically; "
+                      "add one to 輪胎表 to enable it.")
+        return registry
+
+    except FileNotFoundError:
+        print(f"*********************************************************************")
+        print(f"*** Error: Mapping file not found at '{os.path.abspath(filepath)}' ***")
+        print(f"*** Please ensure the file exists and the path is correct. ***")
+        print(f"*********************************************************************")
+        return VehicleRegistry()
+    except Exception as e: # General except block for any other errors during loading/processing
+        print(f"*****************************************************")
+        print(f"*** Error loading license plate mapping: {e} ***")
+        print(f"*** Check file integrity, sheet names, and format. ***")
+        print(f"*****************************************************")
+        return VehicleRegistry()
@@ -0,0 +1,433 @@
+import os
+import sys
+import time
+import select
+import signal
+import struct
+import threading
+from collections import OrderedDict, deque
+
+from extraction_rules import format_plate_entry
+from ocr_service import merge_pair_fields
+from exif_metadata import read_capture_time
+from report_builder import DEFAULT_TRUCK_TYPE, build_output_filename, file_sha256, generate_report_file, select_template
+from batch_journal import BatchJournal
+from photo_pairing import DEFAULT_WINDOW_SECONDS, IMAGE_EXTENSIONS, filename_key, pair_photos
+
+# --- Watch-folder daemon ---
+# Inspectors drop photos into a shared folder; every photo is OCR'd as soon as it
+# has finished arriving, and a report is written once both photos of a pair are in.
+# Change detection uses inotify on Linux and falls back to polling elsewhere.
+# Photos pair by filename as soon as both are OCR'd. A photo still alone after
+# --pair-timeout (phone names like IMG_1234/IMG_1235, a third shot of the same
+# vehicle) goes through the batch pairing by OCR and capture time (photo_pairing.py)
+# with the other waiting photos; if that finds no partner it is reported as unpaired.
+# The daemon stops on Ctrl+C and on SIGTERM (service managers).
+# Reports go to a folder per inspection day (output/2025-03-03/), so the same vehicle
+# on another day gets its own file; within a day the first pair to claim a file name
+# keeps it, and a later pair that would overwrite it is reported instead.
+# What the daemon has done survives a restart: the fields read from each photo (by
+# content hash) and the report each pair claimed are kept in watch_journal.jsonl in the
+# output folder, so a restart re-pairs the folder from there without OCR, and a report
+# whose inputs have not changed is neither rewritten nor recorded in the history again.
+
+# Names used by sync tools / phones while a file is still being written
+PARTIAL_SUFFIXES = (".part", ".partial", ".tmp", ".crdownload", "~")
+
+PAIR_TIMEOUT_SECONDS = 300
+SEEN_LIMIT = 20000  # Paths handed to OCR in this run; the oldest are forgotten beyond this
+WATCH_JOURNAL_FILENAME = "watch_journal.jsonl"
+UNKNOWN_DAY_FOLDER = "日期不明"
+
+
+def is_candidate_photo(path):
+    name = os.path.basename(path)
+    if name.startswith(".") or name.lower().endswith(PARTIAL_SUFFIXES):
+        return False
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+# --- Change sources ---
+class PollingWatcher:
+    """Portable fallback: rescans the directory and reports new or changed files."""
+
+    def __init__(self, directory, interval=1.0):
+        self.directory = directory
+        self.interval = interval
+        self._signatures = {}
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changed = []
+        current = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return changed
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            signature = (st.st_size, st.st_mtime_ns)
+            current[entry.path] = signature
+            if self._signatures.get(entry.path) != signature:
+                changed.append(entry.path)
+        self._signatures = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify via ctypes (no extra dependency)."""
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+        self.directory = directory
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if self._libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+        self.overflowed = False
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        changed = []
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            _, mask, _, name_len = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if mask & self.IN_Q_OVERFLOW:
+                # Kernel queue overflowed: the caller rescans the directory
+                self.overflowed = True
+            elif name:
+                changed.append(os.path.join(self.directory, os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_watcher(directory, poll_interval=1.0, force_polling=False):
+    if not force_polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            print(f"Warning: inotify unavailable ({e}), falling back to polling.")
+    return PollingWatcher(directory, poll_interval)
+
+
+class Debouncer:
+    """A file is ready once it has not changed (size and mtime) for `quiet_seconds`."""
+
+    def __init__(self, quiet_seconds=2.0):
+        self.quiet_seconds = quiet_seconds
+        self._pending = {}  # path -> (signature, last change time)
+
+    def touch(self, path):
+        self._pending.pop(path, None)
+        self._pending[path] = (None, time.monotonic())
+
+    def pop_ready(self):
+        ready = []
+        now = time.monotonic()
+        for path, (signature, changed_at) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]  # Deleted or renamed before it settled
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != signature:
+                self._pending[path] = (current, now)
+            elif st.st_size > 0 and now - changed_at >= self.quiet_seconds:
+                del self._pending[path]
+                ready.append(path)
+        return ready
+
+    def __len__(self):
+        return len(self._pending)
+
+
+# --- Daemon ---
+class WatchFolderDaemon:
+    """
+    Watches `input_dir`, OCRs photos as they settle and renders a report per completed pair.
+    `ocr_func(path)` returns the dict produced by extract_data_from_image.
+    At most `max_inflight` OCR jobs are queued or running; further settled photos wait as
+    plain paths, so a burst of hundreds of files never has more than that many images in flight.
+    `truck_type_for(plate)` (optional) returns the vehicle's type from the workbook, or None to use `truck_type`.
+    A photo without a filename partner after `pair_timeout` seconds is paired by OCR/capture time or reported.
+    Reports are recorded in `history` (an InspectionHistory) when one is given.
+    """
+
+    def __init__(self, input_dir, output_dir, ocr_func, yellow_template, white_template,
+                 truck_type=DEFAULT_TRUCK_TYPE, quiet_seconds=2.0, poll_interval=1.0,
+                 max_inflight=4, force_polling=False, truck_type_for=None, history=None, ocr_workers=1,
+                 pair_timeout=PAIR_TIMEOUT_SECONDS):
+        self.input_dir = os.path.abspath(input_dir)
+        self.output_dir = output_dir
+        self.ocr_func = ocr_func
+        self.yellow_template = yellow_template
+        self.white_template = white_template
+        self.truck_type = truck_type
+        self.truck_type_for = truck_type_for
+        self.history = history
+        self.poll_interval = poll_interval
+        self.max_inflight = max_inflight
+        self.force_polling = force_polling
+        self.pair_timeout = pair_timeout
+        self.debouncer = Debouncer(quiet_seconds)
+        self.backlog = deque()  # Settled photos waiting for an OCR slot (paths only)
+        self.waiting = OrderedDict()  # pair key -> {path: ocr result}, pairs not complete yet
+        self._waiting_since = {}  # path -> time.monotonic() when its OCR finished
+        self.seen = OrderedDict()  # Photos already handed to OCR, oldest first (at most SEEN_LIMIT)
+        self.journal = None  # Opened by run()
+        self.stats = {"ocr": 0, "ocr_cached": 0, "ocr_errors": 0, "reports": 0, "unchanged": 0,
+                      "report_errors": 0, "collisions": 0, "unpaired": 0}
+        self._inflight = set()
+        self._ocr_seconds = {}  # path -> OCR time, kept until the pair's report is recorded
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        from concurrent.futures import ThreadPoolExecutor
+        # A PaddleOCR engine must not be called from several threads: one OCR worker per engine
+        # that `ocr_func` can use (ocr_engine_pool.py)
+        self._ocr_pool = ThreadPoolExecutor(max_workers=ocr_workers, thread_name_prefix="watch-ocr")
+        self._render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="watch-render")
+
+    def stop(self):
+        self._stop.set()
+
+    def _initial_scan(self):
+        for entry in sorted(os.scandir(self.input_dir), key=lambda e: e.name):
+            if entry.is_file() and is_candidate_photo(entry.path):
+                self.debouncer.touch(entry.path)
+
+    def run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.journal = BatchJournal(self.output_dir, self.input_dir, WATCH_JOURNAL_FILENAME)
+        watcher = create_watcher(self.input_dir, self.poll_interval, self.force_polling)
+        print(f"Watching {self.input_dir} ({type(watcher).__name__}), reports go to {os.path.abspath(self.output_dir)}")
+        self._initial_scan()  # Photos that arrived while the daemon was not running
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread():
+            previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        try:
+            while not self._stop.is_set():
+                for path in watcher.poll(self.poll_interval):
+                    if is_candidate_photo(path) and path not in self.seen:
+                        self.debouncer.touch(path)
+                if getattr(watcher, "overflowed", False):
+                    watcher.overflowed = False
+                    self._initial_scan()
+                self.backlog.extend(p for p in self.debouncer.pop_ready() if p not in self.seen)
+                self._dispatch_ocr()
+                self._pair_stale()
+            print("Stopping watch-folder daemon...")
+        except KeyboardInterrupt:
+            print("Stopping watch-folder daemon...")
+        finally:
+            if previous_handler is not None:
+                signal.signal(signal.SIGTERM, previous_handler)
+            watcher.close()
+            self._ocr_pool.shutdown(wait=True)
+            self._render_pool.shutdown(wait=True)
+            self.journal.close()
+            for key, group in self.waiting.items():
+                print(f"Warning: Pair '{key}' incomplete, only {', '.join(os.path.basename(p) for p in group)} arrived.")
+            from image_enhance import ENHANCE_STATS
+            from memory_watchdog import WATCHDOG
+            print(f"Watch-folder daemon stopped. {self.stats}. {ENHANCE_STATS.describe()}")
+            print(WATCHDOG.describe())
+
+    def _dispatch_ocr(self):
+        with self._lock:
+            while self.backlog and len(self._inflight) < self.max_inflight:
+                path = self.backlog.popleft()
+                if path in self.seen:
+                    continue
+                self.seen[path] = None
+                if len(self.seen) > SEEN_LIMIT:
+                    self.seen.popitem(last=False)
+                self._inflight.add(path)
+                self._ocr_pool.submit(self._ocr_job, path)
+
+    def _ocr_job(self, path):
+        start = time.perf_counter()
+        digest = file_sha256(path)
+        data = self.journal.fields.get(digest)  # Read before a restart
+        if data is None:
+            try:
+                data = self.ocr_func(path)
+            except Exception as e:  # ocr_func normally reports errors in the dict
+                data = {"error": str(e)}
+            self.journal.fields_done(digest, data)
+        else:
+            self.stats["ocr_cached"] += 1
+        with self._lock:
+            self._ocr_seconds[path] = time.perf_counter() - start
+            self._inflight.discard(path)
+            if "error" in data:
+                self.stats["ocr_errors"] += 1
+                print(f"Warning: OCR failed for {os.path.basename(path)}: {data['error']}")
+            self.stats["ocr"] += 1
+            key = filename_key(path)
+            group = self.waiting.setdefault(key, {})
+            group[path] = data
+            self._waiting_since[path] = time.monotonic()
+            if len(group) < 2:
+                return
+            del self.waiting[key]
+            for member in group:
+                self._waiting_since.pop(member, None)
+        self._render_pool.submit(self._render_pair, key, self._order_pair(group))
+
+    def _pair_stale(self):
+        """
+        Photos alone for longer than pair_timeout: pairs them with the other waiting photos
+        by OCR and capture time, like the batch mode; those that still have no partner are
+        reported as unpaired and dropped.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not any(now - since >= self.pair_timeout for since in self._waiting_since.values()):
+                return
+            snapshot = {path: (key, data) for key, group in self.waiting.items() for path, data in group.items()}
+        stale = {path for path in snapshot if now - self._waiting_since.get(path, now) >= self.pair_timeout}
+        result = pair_photos(list(snapshot), {path: data for path, (_, data) in snapshot.items()},
+                             window_seconds=DEFAULT_WINDOW_SECONDS)
+        pairs = [(pair.photo1.path, pair.photo2.path, pair.method) for pair in result.pairs
+                 if pair.photo1.path in stale or pair.photo2.path in stale]
+        left = [([path], "no photo taken close enough in time") for path in result.unpaired if path in stale]
+        left += [(paths, reason) for paths, reason in result.ambiguous if stale.intersection(paths)]
+        with self._lock:
+            def take(paths):
+                # A photo may have been paired by filename while this ran
+                if not all(path in self.waiting.get(snapshot[path][0], {}) for path in paths):
+                    return False
+                for path in paths:
+                    key = snapshot[path][0]
+                    del self.waiting[key][path]
+                    if not self.waiting[key]:
+                        del self.waiting[key]
+                    self._waiting_since.pop(path, None)
+                return True
+            pairs = [(img1, img2, method) for img1, img2, method in pairs if take((img1, img2))]
+            left = [(paths, reason) for paths, reason in left if take(paths)]
+            self.stats["unpaired"] += sum(len(paths) for paths, _ in left)
+            for paths, _ in left:
+                for path in paths:
+                    self._ocr_seconds.pop(path, None)
+        for img1, img2, method in pairs:
+            key = f"{os.path.basename(img1)}+{os.path.basename(img2)}"
+            print(f"Paired by {method}: {key}")
+            self._render_pool.submit(self._render_pair, key, ((img1, snapshot[img1][1]), (img2, snapshot[img2][1])))
+        for paths, reason in left:
+            print(f"Warning: Unpaired after {self.pair_timeout:g}s ({reason}): "
+                  f"{', '.join(os.path.basename(p) for p in paths)}; needs a manual report.")
+
+    def _order_pair(self, group):
+        """Photo one carries address/date, photo two the plate. Falls back to filename order."""
+        (path_a, data_a), (path_b, data_b) = sorted(group.items())
+        if data_a.get("plate") and not data_b.get("plate") and data_b.get("address"):
+            return (path_b, data_b), (path_a, data_a)
+        return (path_a, data_a), (path_b, data_b)
+
+    def _render_pair(self, key, pair):
+        (img1, data1), (img2, data2) = pair
+        fields = merge_pair_fields(data1, data2, (read_capture_time(img1), read_capture_time(img2)))
+        missing = [name for name in ("plate", "address", "date") if not fields.get(name)]
+        if missing:
+            print(f"Warning: Pair '{key}' is missing {', '.join(missing)}; report needs manual review.")
+        truck_type = (self.truck_type_for and self.truck_type_for(fields["plate"])) or self.truck_type
+        plate = fields["plate"]
+        fields["plate"] = format_plate_entry(plate, fields.get("code"))
+        from inspection_history import record_safely, roc_to_iso
+        day = roc_to_iso(fields.get("date")) or UNKNOWN_DAY_FOLDER
+        start = time.perf_counter()
+        try:
+            report = os.path.join(day, build_output_filename(fields.get("code"), truck_type))
+            photos = [os.path.basename(img1), os.path.basename(img2)]
+            with self._lock:
+                owner = self.journal.planned.get(report)
+                if owner and sorted(owner) != sorted(photos):
+                    # E.g. two vehicles without a code on the same day: keep the first report
+                    self.stats["collisions"] += 1
+                    self._ocr_seconds.pop(img1, None)
+                    self._ocr_seconds.pop(img2, None)
+                    print(f"Warning: Pair '{key}' would overwrite {report} (written for {' + '.join(owner)}); "
+                          f"skipped, needs a manual report.")
+                    return
+                self.journal.plan(report, img1, img2)
+            os.makedirs(os.path.join(self.output_dir, day), exist_ok=True)
+            doc_path, warnings, rebuilt = generate_report_file(
+                fields, img1, img2, truck_type, os.path.join(self.output_dir, day),
+                self.yellow_template, self.white_template, skip_unchanged=True)
+        except Exception as e:
+            with self._lock:
+                self.stats["report_errors"] += 1
+                self._ocr_seconds.pop(img1, None)
+                self._ocr_seconds.pop(img2, None)
+            print(f"Error: Report for pair '{key}' failed: {e}")
+            return
+        for message in warnings:
+            print(f"Warning: {message}")
+        render_seconds = time.perf_counter() - start
+        with self._lock:
+            self.stats["reports" if rebuilt else "unchanged"] += 1
+            ocr_seconds = self._ocr_seconds.pop(img1, 0.0) + self._ocr_seconds.pop(img2, 0.0)
+        if not rebuilt:  # Written before a restart from the same photos and fields
+            return
+        record_safely(
+            self.history, "watch", plate=plate, code=fields.get("code"), truck_type=truck_type,
+            address=fields.get("address"), inspection_date=fields.get("date"), image1=img1, image2=img2,
+            output_path=doc_path, template=select_template(truck_type, self.yellow_template, self.white_template),
+            ocr_seconds=ocr_seconds, render_seconds=render_seconds)
+        print(f"報告已產生: {doc_path} ({os.path.basename(img1)} + {os.path.basename(img2)})")
+
+
+def add_watch_arguments(parser):
+    """Command line flags for the daemon mode, shared by main.py and main-pack.py."""
+    parser.add_argument("--watch", metavar="INPUT_DIR", help="監看資料夾模式：照片到齊後自動產生報告")
+    parser.add_argument("--truck-type", default=DEFAULT_TRUCK_TYPE, help="監看模式使用的車種，對照表有車種欄位時以對照表為準 (預設: 壓縮式垃圾車)")
+    parser.add_argument("--quiet-seconds", type=float, default=2.0, help="檔案多久未變動視為寫入完成")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--max-inflight", type=int, default=4, help="同時排隊/執行的 OCR 工作上限")
+    parser.add_argument("--force-polling", action="store_true", help="不使用 inotify，改用輪詢")
+    parser.add_argument("--pair-timeout", type=float, default=PAIR_TIMEOUT_SECONDS,
+                        help="照片等待同檔名配對的秒數，逾時改以 OCR/拍攝時間配對，仍無法配對則回報 (預設: 300)")
+
+
+def run_from_args(args, output_dir, ocr_func, yellow_template, white_template, truck_type_for=None,
+                  history=None, ocr_workers=1):
+    daemon = WatchFolderDaemon(
+        args.watch, output_dir, ocr_func, yellow_template, white_template,
+        truck_type=args.truck_type, quiet_seconds=args.quiet_seconds,
+        poll_interval=args.poll_interval, max_inflight=args.max_inflight,
+        force_polling=args.force_polling, truck_type_for=truck_type_for,
+        history=history, ocr_workers=ocr_workers, pair_timeout=args.pair_timeout)
+    daemon.run()